@@ -40,7 +40,6 @@ import tf2_py
 from tf2_ros.buffer import Buffer
 import tf2_msgs
 from tf2_ros import TransformException, TransformStamped
-import pymap3d
 from cv_bridge import CvBridge
 import numpy as np
 import ros2_numpy as rnp
@@ -51,6 +50,7 @@ sys.path.append('/home/share/carla/PythonAPI/carla/dist/carla-0.9.12-py3.7-linux
 import carla
 import random
 import sim_bridge.scenarios as sc
+from geo_projection.projection import EnuProjection
 
 # #SCENARIO TO RUN
 # SCENARIO = sc.car_in_junction
@@ -189,15 +189,13 @@ class SimBridgeNode(Node):
         msg.header.frame_id = 'map'
         msg.child_frame_id = 'gnss'
 
-        enu_coords = pymap3d.geodetic2enu(
-            data.latitude, data.longitude, 0.0,
-            MAP_ORIGIN_LAT, MAP_ORIGIN_LON, 0.0
-        )
+        enu_coords = self.map_projection.toLocal(
+            data.latitude, data.longitude, 0.0)
 
-        posewithcov.pose.position.x = enu_coords[0]
-        posewithcov.pose.position.y = enu_coords[1]
+        posewithcov.pose.position.x = float(enu_coords[0])
+        posewithcov.pose.position.y = float(enu_coords[1])
         # This should be 0.0. We don't care about altitude. WSH.
-        posewithcov.pose.position.z = enu_coords[2]
+        posewithcov.pose.position.z = float(enu_coords[2])
 
         ego_tf = self.ego.get_transform()
         ego_quat = R.from_euler(
@@ -477,6 +475,9 @@ class SimBridgeNode(Node):
     def __init__(self):
         super().__init__('sim_bridge_node')
 
+        # For lat/lon-> ENU conversions, with the map origin precomputed
+        self.map_projection = EnuProjection(MAP_ORIGIN_LAT, MAP_ORIGIN_LON, 0.0)
+
         # Define sensors
         self.front_lidar: carla.ServerSideSensor
         self.front_lidar_cloud = np.array([])
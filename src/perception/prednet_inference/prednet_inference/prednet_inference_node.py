@@ -37,8 +37,7 @@ from nova_msgs.msg import Egma
 
 import torch
 
-
-import matplotlib.pyplot as plt
+from vt_viz import debug_plot
 
 
 class PredNetNode(Node):
@@ -85,8 +84,10 @@ class PredNetNode(Node):
         # GPU that the prednet model will use
         self.device = 'cuda:0'
 
-        # Whether the images have been made (for testing)
-        self.madeExample = True
+        # Whether the images have been made (for testing).
+        # They're only made with the debug_plots parameter.
+        debug_plot.enable(self.declare_parameter('debug_plots', False).value)
+        self.madeExample = not debug_plot.isEnabled()
 
         # Model directry
         # Importing models
@@ -177,6 +178,7 @@ class PredNetNode(Node):
         if not self.madeExample and self.time > 100:
             IMAGES_FN = '/navigator/src/perception/prednet_inference/predictionTest/'
 
+            plt = debug_plot.getPyplot()
             fig1 = plt.figure()
             ax1 = fig1.add_subplot(111)
             displayOutput = (
@@ -205,6 +207,7 @@ class PredNetNode(Node):
             # displayOutput = (prediction[0,:,0, :, :] * 0.5 + (prediction[0,:,1, :, :] * -0.5 + 0.5)) * 100
             displayOutput = displayOutput.cpu().detach().numpy()
 
+            plt = debug_plot.getPyplot()
             for i in range(displayOutput.shape[0]):
                 fig1 = plt.figure()
                 ax1 = fig1.add_subplot(111)
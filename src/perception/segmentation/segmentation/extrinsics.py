@@ -0,0 +1,114 @@
+'''
+Package: segmentation
+   File: extrinsics.py
+ Author: Will Heitman (w at heit dot mn)
+
+Per-camera base_link->pixel projection matrices.
+
+Camera mounts are static, so each camera's transform from base_link and
+its intrinsics are composed once into a single 3x4 matrix, which takes
+homogeneous base_link points straight to (scaled) pixel coordinates.
+A camera's matrix is rebuilt only after its CameraInfo changes or
+/tf_static is republished.
+'''
+
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+
+
+def getTransformMatrix(quaternion: list, translation: list) -> np.ndarray:
+    """Build a 4x4 homogeneous transform.
+
+    Args:
+        quaternion (list): rotation [x,y,z,w]
+        translation (list): [x,y,z]
+
+    Returns:
+        np.ndarray: 4x4 transform
+    """
+    transform = np.eye(4)
+    transform[0:3, 0:3] = R.from_quat(quaternion).as_matrix()
+    transform[0:3, 3] = translation
+
+    return transform
+
+
+class ExtrinsicsCache:
+
+    def __init__(self):
+        """An empty cache, filled with setProjection() and setTransform()"""
+        self.projections = {}  # Camera frame -> 3x4 intrinsic projection (CameraInfo's P)
+        self.transforms = {}  # Camera frame -> 4x4 base_link->camera transform
+        self.matrices = {}  # Camera frame -> composed 3x4 base_link->pixel matrix
+
+    def setProjection(self, camera_frame: str, P) -> bool:
+        """Set a camera's intrinsics, e.g. from each CameraInfo message.
+
+        Args:
+            camera_frame (str): The camera's optical frame
+            P: 3x4 projection matrix, or CameraInfo's flat p array
+
+        Returns:
+            bool: True if the projection changed
+        """
+        P = np.asarray(P, dtype=np.float64).reshape((3, 4))
+        if camera_frame in self.projections and np.array_equal(P, self.projections[camera_frame]):
+            return False
+
+        self.projections[camera_frame] = P
+        self.matrices.pop(camera_frame, None)
+        return True
+
+    def setTransform(self, camera_frame: str, transform: np.ndarray):
+        """Set a camera's 4x4 transform from base_link (see getTransformMatrix)"""
+        self.transforms[camera_frame] = transform
+        self.matrices.pop(camera_frame, None)
+
+    def hasTransform(self, camera_frame: str) -> bool:
+        return camera_frame in self.transforms
+
+    def getOpticalAxis(self, camera_frame: str) -> tuple:
+        """Return where a camera is and which way it faces, in base_link.
+
+        Args:
+            camera_frame (str): The camera's optical frame
+
+        Returns:
+            tuple: ((3,) camera position, (3,) unit optical axis), or None
+                if the camera's transform is not yet known
+        """
+        if camera_frame not in self.transforms:
+            return None
+
+        transform = self.transforms[camera_frame]
+        rotation = transform[0:3, 0:3]
+
+        # Invert base_link->camera. The optical axis is the camera's +z.
+        origin = -rotation.T @ transform[0:3, 3]
+        axis = rotation[2, :]
+
+        return origin, axis
+
+    def invalidateTransforms(self):
+        """Forget every camera's transform, e.g. after /tf_static is republished"""
+        self.transforms.clear()
+        self.matrices.clear()
+
+    def getMatrix(self, camera_frame: str) -> np.ndarray:
+        """Return a camera's 3x4 base_link->pixel matrix.
+
+        Args:
+            camera_frame (str): The camera's optical frame
+
+        Returns:
+            np.ndarray: 3x4 matrix, or None if the camera's projection
+                or transform is not yet known
+        """
+        if camera_frame not in self.matrices:
+            if camera_frame not in self.projections or camera_frame not in self.transforms:
+                return None
+
+            self.matrices[camera_frame] = \
+                self.projections[camera_frame] @ self.transforms[camera_frame]
+
+        return self.matrices[camera_frame]
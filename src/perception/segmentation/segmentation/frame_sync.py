@@ -0,0 +1,130 @@
+'''
+Package: segmentation
+   File: frame_sync.py
+ Author: Will Heitman (w at heit dot mn)
+
+Approximate-time matching of lidar clouds to semantic images.
+
+Semantic images arrive well after the lidar cloud that they belong to,
+since segmentation takes a while. Each camera's latest images are kept
+in a small stamped ring buffer, and each cloud is painted with the
+image from each camera closest to it in time. Clouds with no image
+within the tolerance are dropped rather than painted with the wrong
+image.
+'''
+
+from collections import deque
+
+import numpy as np
+
+FRAME_BUFFER_SIZE = 8  # Images kept per camera
+SKEW_WINDOW = 100  # Matches that skew statistics are computed over
+
+# Results of FrameSync.match()
+MATCHED = 'matched'
+WAITING = 'waiting'  # A closer image may still arrive
+UNMATCHED = 'unmatched'
+
+
+class StampedBuffer:
+
+    def __init__(self, capacity: int = FRAME_BUFFER_SIZE):
+        """Ring buffer of the latest stamped frames"""
+        self.stamps = np.full(capacity, -np.inf)
+        self.frames = [None] * capacity
+        self.next = 0  # Slot to overwrite next
+
+    def push(self, stamp: float, frame):
+        self.stamps[self.next] = stamp
+        self.frames[self.next] = frame
+        self.next = (self.next + 1) % len(self.frames)
+
+    def newestStamp(self) -> float:
+        """Stamp of the newest frame, or -inf if empty"""
+        return np.max(self.stamps)
+
+    def getClosest(self, stamp: float) -> tuple:
+        """Find the frame closest in time to stamp.
+
+        Args:
+            stamp (float): seconds
+
+        Returns:
+            tuple: (frame, skew), where skew is the frame's stamp minus
+                stamp, or (None, inf) if the buffer is empty
+        """
+        skews = self.stamps - stamp
+        closest = np.argmin(np.abs(skews))
+
+        if self.frames[closest] is None:
+            return None, np.inf
+
+        return self.frames[closest], skews[closest]
+
+
+class FrameSync:
+
+    def __init__(self, camera_count: int, tolerance: float, capacity: int = FRAME_BUFFER_SIZE):
+        """Match stamps against each camera's recent frames.
+
+        Args:
+            camera_count (int)
+            tolerance (float): Largest allowed skew between a cloud and a frame, in seconds
+            capacity (int, optional): Frames kept per camera
+        """
+        self.tolerance = tolerance
+        self.buffers = [StampedBuffer(capacity) for _ in range(camera_count)]
+        self.skews = [deque(maxlen=SKEW_WINDOW) for _ in range(camera_count)]
+        self.matched = 0
+        self.unmatched = 0
+
+    def push(self, camera: int, stamp: float, frame):
+        self.buffers[camera].push(stamp, frame)
+
+    def match(self, stamp: float) -> tuple:
+        """Pick each camera's frame for a cloud.
+
+        A camera's match is final once it has a frame from at or after the
+        cloud's stamp, since later frames can only be further away.
+
+        Args:
+            stamp (float): The cloud's stamp, in seconds
+
+        Returns:
+            tuple: (result, frames), where result is MATCHED, WAITING or
+                UNMATCHED, and frames lists each camera's frame if MATCHED
+        """
+        frames = []
+        skews = []
+        waiting = False
+
+        for buffer in self.buffers:
+            frame, skew = buffer.getClosest(stamp)
+            newest_stamp = buffer.newestStamp()
+
+            if abs(skew) <= self.tolerance and newest_stamp >= stamp:
+                frames.append(frame)
+                skews.append(skew)
+            elif newest_stamp > stamp + self.tolerance:
+                # No frame within tolerance, and none can still arrive
+                self.unmatched += 1
+                return UNMATCHED, None
+            else:
+                waiting = True
+
+        if waiting:
+            return WAITING, None
+
+        self.matched += 1
+        for camera_skews, skew in zip(self.skews, skews):
+            camera_skews.append(skew)
+
+        return MATCHED, frames
+
+    def getSkewStats(self, camera: int) -> tuple:
+        """Return (mean, max) absolute skew of a camera's recent matches, in seconds"""
+        if len(self.skews[camera]) == 0:
+            return 0.0, 0.0
+
+        skews = np.abs(self.skews[camera])
+        return np.mean(skews), np.max(skews)
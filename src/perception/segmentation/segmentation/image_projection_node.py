@@ -4,6 +4,23 @@ Package: segmentation
  Author: Will Heitman (w at heit dot mn)
 
 Node to project 2D semantic segmentation results onto a 3D point cloud
+
+Each point within range is painted by the camera that faces it most
+directly, and projected only into that camera; see painting.py.
+Each camera's base_link->pixel matrix is cached (see extrinsics.py), and
+rebuilt only when its CameraInfo changes or /tf_static is republished.
+
+Each cloud waits for the semantic image from each camera that is closest
+to it in time (see frame_sync.py). Clouds with no image within
+sync_tolerance are dropped.
+
+Parameters:
+- sync_tolerance (float): Largest allowed skew between a cloud and
+    a semantic image, in seconds
+
+Publishes:
+- Painted cloud (sensor_msgs/PointCloud2)
+- Diagnostic status, incl. dropped clouds and image skew (DiagnosticStatus)
 '''
 
 
@@ -11,24 +28,25 @@ import rclpy
 import ros2_numpy as rnp
 import numpy as np
 from rclpy.node import Node
-from scipy.spatial.transform import Rotation as R
+from rclpy.qos import DurabilityPolicy, QoSProfile
 import sys
 import time
+from collections import deque
 from tf2_ros import TransformException
 from tf2_ros.buffer import Buffer
 from tf2_ros.transform_listener import TransformListener
 
 # Message definitions
-from geometry_msgs.msg import TransformStamped
+from diagnostic_msgs.msg import DiagnosticStatus, KeyValue
 from nav_msgs.msg import OccupancyGrid
 from rosgraph_msgs.msg import Clock
 from sensor_msgs.msg import CameraInfo, Image, PointCloud2
 from std_msgs.msg import Float32
+from tf2_msgs.msg import TFMessage
 
-import image_geometry
-import matplotlib.pyplot as plt
-
-import struct
+from .extrinsics import ExtrinsicsCache, getTransformMatrix
+from .frame_sync import FrameSync, MATCHED, WAITING
+from .painting import MultiCameraPainter
 
 name_to_dtypes = {
     "rgb8":    (np.uint8,  3),
@@ -85,6 +103,8 @@ name_to_dtypes = {
 
 img_shape = (512, 1024)
 
+MAX_PENDING_CLOUDS = 5  # Clouds waiting for semantic images. Older ones are dropped.
+
 
 class ImageProjectioNode(Node):
 
@@ -113,13 +133,27 @@ class ImageProjectioNode(Node):
         self.tf_buffer = Buffer()
         self.tf_listener = TransformListener(self.tf_buffer, self)
 
+        # Camera mounts only move if /tf_static is republished
+        tf_static_sub = self.create_subscription(
+            TFMessage, '/tf_static', self.tfStaticCb,
+            QoSProfile(depth=100, durability=DurabilityPolicy.TRANSIENT_LOCAL))
+
         self.left_camera_frame = 'hero/rgb_left'
         self.right_camera_frame = 'hero/rgb_right'
-        self.left_cam_model: image_geometry.PinholeCameraModel = None
-        self.right_cam_model: image_geometry.PinholeCameraModel = None
+        self.extrinsics = ExtrinsicsCache()
 
-        self.left_semantic_image = None
-        self.right_semantic_image = None
+        self.camera_frames = [self.left_camera_frame, self.right_camera_frame]
+        self.painter: MultiCameraPainter = None  # Built once the camera poses are known
+
+        # Semantic images, matched to clouds by stamp
+        self.sync = FrameSync(len(self.camera_frames),
+                              self.declare_parameter('sync_tolerance', 0.05).value)
+        self.pending_clouds = deque()  # (header, points), oldest first
+        self.overflowed_clouds = 0
+
+        self.status_pub = self.create_publisher(
+            DiagnosticStatus, '/node_statuses', 1)
+        self.status_timer = self.create_timer(1.0, self.publishStatus)
 
     def imageToNumpy(self, msg: Image) -> np.array:
         """Converts Image message to numpy array
@@ -161,10 +195,7 @@ class ImageProjectioNode(Node):
         Returns:
             None
         """
-        if self.left_cam_model is not None:
-            return  # Already set, skip
-        self.left_cam_model = image_geometry.PinholeCameraModel()
-        self.left_cam_model.fromCameraInfo(msg)
+        self.extrinsics.setProjection(self.left_camera_frame, msg.p)
 
     def rightCameraInfoCb(self, msg: CameraInfo):
         """Sets camera info for right camera
@@ -175,95 +206,97 @@ class ImageProjectioNode(Node):
         Returns:
             None
         """
-        if self.right_cam_model is not None:
-            return  # Already set, skip
-        self.right_cam_model = image_geometry.PinholeCameraModel()
-        self.right_cam_model.fromCameraInfo(msg)
+        self.extrinsics.setProjection(self.right_camera_frame, msg.p)
 
-    def leftCameraImageCb(self, msg: Image):
-        self.left_semantic_image = self.imageToNumpy(msg)
+    def tfStaticCb(self, msg: TFMessage):
+        # Look up every camera's transform again on the next cloud
+        self.extrinsics.invalidateTransforms()
+        self.painter = None
 
-    def rightCameraImageCb(self, msg: Image):
-        self.right_semantic_image = self.imageToNumpy(msg)
-
-    def tagPoints(self, camera_frame: str, pts: np.array, semantic_img: np.array) -> np.array:
-        """Given LiDAR point cloud and semantic segmentation image, paint the image
-            onto the point cloud, assigning a class to each point.
+    def getCameraMatrix(self, camera_frame: str) -> np.array:
+        """Return the camera's cached base_link->pixel matrix, looking up
+            its transform only if it isn't cached yet.
 
         Args:
-            frame (str)
-            pts (np.array): LiDAR points, where each row is a point [x,y,z]
-            semantic_img (np.array): n x m semantic segmentation image
+            camera_frame (str)
 
         Returns:
-            np.array: Classified LiDAR points, where each row is a point [x,y,z,class]
+            np.array: 3x4 matrix, or None if the camera isn't ready
         """
-        t = TransformStamped()
-
-        try:
-            t = self.tf_buffer.lookup_transform(
-                camera_frame, 'base_link', rclpy.time.Time())
-        except TransformException as ex:
-            self.get_logger().info(
-                f'Could not transform to camera frame: {ex}')
-            return
-
-        # Rotate to camera frame
-        q = t.transform.rotation
-        tf_rotation: R = R.from_quat([q.x, q.y, q.z, q.w])
-        lidar_array_tfed = tf_rotation.apply(pts)
-
-        # Translate to camera frame
-        lidar_array_tfed += [t.transform.translation.x,
-                             t.transform.translation.y,
-                             t.transform.translation.z]
-
-        classified_pts = []
-        rgb = []
-
-        for idx, pt in enumerate(lidar_array_tfed):
-            uv = self.right_cam_model.project3dToPixel(pt)
-            pixel_coords = np.array(uv).astype(int)
-
-            if pixel_coords[0] > 1023 or pixel_coords[0] < 0:
-                continue
-            elif pixel_coords[1] > 511 or pixel_coords[1] < 0:
-                continue
+        if not self.extrinsics.hasTransform(camera_frame):
+            try:
+                t = self.tf_buffer.lookup_transform(
+                    camera_frame, 'base_link', rclpy.time.Time())
+            except TransformException as ex:
+                self.get_logger().info(
+                    f'Could not transform to camera frame: {ex}')
+                return None
+
+            q = t.transform.rotation
+            translation = t.transform.translation
+            self.extrinsics.setTransform(camera_frame, getTransformMatrix(
+                [q.x, q.y, q.z, q.w], [translation.x, translation.y, translation.z]))
+
+        return self.extrinsics.getMatrix(camera_frame)
 
-            pixel_class = semantic_img[pixel_coords[1], pixel_coords[0]]
-            # print(pixel_class)
-            r = int(pixel_class[0])
-            g = int(pixel_class[1])
-            b = int(pixel_class[2])
-            a = 255
-            rgb.append(struct.unpack('I', struct.pack('BBBB', b, g, r, a))[0])
-            # classified_pt = np.append(pts[idx], pixel_class)
-            classified_pts.append(pts[idx])
-
-        classified_pts = np.array(classified_pts)  # Convert to np array
-        rgb = np.array(rgb).astype(np.uint32)
-
-        if len(classified_pts) < 1:
-            return
+    def leftCameraImageCb(self, msg: Image):
+        self.sync.push(0, self.getStampSeconds(msg.header.stamp),
+                       self.imageToNumpy(msg))
+        self.paintPendingClouds()
 
-        xyzc = np.zeros(classified_pts.shape[0], dtype=[
-            ('x', np.float32),
-            ('y', np.float32),
-            ('z', np.float32),
-            ('rgb', np.uint32)
-        ])
+    def rightCameraImageCb(self, msg: Image):
+        self.sync.push(1, self.getStampSeconds(msg.header.stamp),
+                       self.imageToNumpy(msg))
+        self.paintPendingClouds()
+
+    def getStampSeconds(self, stamp) -> float:
+        return stamp.sec + stamp.nanosec * 1e-9
+
+    def publishStatus(self):
+        """Report dropped clouds and how far apart matched clouds and images were"""
+        status = DiagnosticStatus()
+        status.name = self.get_name()
+        status.level = DiagnosticStatus.OK
+
+        values = {
+            'painted_clouds': str(self.sync.matched),
+            'unmatched_clouds': str(self.sync.unmatched),
+            'overflowed_clouds': str(self.overflowed_clouds)
+        }
+        for camera, camera_frame in enumerate(self.camera_frames):
+            mean_skew, max_skew = self.sync.getSkewStats(camera)
+            values[f'{camera_frame}/mean_skew'] = f"{mean_skew:.4f}"
+            values[f'{camera_frame}/max_skew'] = f"{max_skew:.4f}"
+
+        for key, value in values.items():
+            kv = KeyValue()
+            kv.key = key
+            kv.value = value
+            status.values.append(kv)
+
+        self.status_pub.publish(status)
+
+    def getPainter(self) -> MultiCameraPainter:
+        """Return the painter for our camera rig, building it once the
+            camera transforms are known.
 
-        xyzc['x'] = classified_pts[:, 0]
-        xyzc['y'] = classified_pts[:, 1]
-        xyzc['z'] = classified_pts[:, 2]
-        xyzc['rgb'] = rgb
+        Returns:
+            MultiCameraPainter, or None if any camera isn't ready yet
+        """
+        if self.painter is None:
+            poses = [self.extrinsics.getOpticalAxis(camera_frame)
+                     for camera_frame in self.camera_frames]
+            if any(pose is None for pose in poses):
+                return None
 
-        # self.get_logger().info(str(xyzc[rgb == 4286595200]))
+            origins, axes = zip(*poses)
+            self.painter = MultiCameraPainter(np.array(origins), np.array(axes))
 
-        return xyzc
+        return self.painter
 
     def lidarCb(self, msg: PointCloud2):
-        """When LiDAR data is received, trim it, call tagPoints for each camera, and publish the result.
+        """When LiDAR data is received, trim it and queue it to be painted
+            once the matching semantic images arrive.
 
         Args:
             msg (PointCloud2): _description_
@@ -271,12 +304,6 @@ class ImageProjectioNode(Node):
         Returns:
             _type_: _description_
         """
-        if self.left_cam_model is None or self.right_cam_model is None:
-            return  # Camera models not yet available.
-
-        if self.left_semantic_image is None or self.right_semantic_image is None:
-            return  # Semantic results not yet available.
-
         # Convert point cloud message to numpy array
         lidar_array = rnp.numpify(msg)
 
@@ -284,9 +311,6 @@ class ImageProjectioNode(Node):
         lidar_array_raw = np.vstack(
             (lidar_array['x'], lidar_array['y'], lidar_array['z'])).T
 
-        # Downsampe to 25%
-        lidar_array_raw = lidar_array_raw[::4]
-
         # Trim distance
         MAX_DISTANCE = 40.0  # meters
         dist = np.linalg.norm(lidar_array_raw, axis=1)
@@ -294,26 +318,41 @@ class ImageProjectioNode(Node):
         # Only points in front of us
         lidar_array_raw = lidar_array_raw[lidar_array_raw[:, 0] > 0.0]
 
-        start = time.time()
+        self.pending_clouds.append((msg.header, lidar_array_raw))
+        if len(self.pending_clouds) > MAX_PENDING_CLOUDS:
+            self.pending_clouds.popleft()
+            self.overflowed_clouds += 1
 
-        left_classified_pts = self.tagPoints(self.left_camera_frame, lidar_array_raw,
-                                             self.left_semantic_image)
+        self.paintPendingClouds()
 
-        left_classified_pts = left_classified_pts[left_classified_pts['y'] > 0]
+    def paintPendingClouds(self):
+        """Paint and publish each waiting cloud whose semantic images have arrived,
+            oldest first, and drop those that can't be matched.
+        """
+        matrices = [self.getCameraMatrix(camera_frame)
+                    for camera_frame in self.camera_frames]
+        if any(matrix is None for matrix in matrices):
+            return  # Camera models not yet available.
+
+        while len(self.pending_clouds) > 0:
+            header, pts = self.pending_clouds[0]
+            result, images = self.sync.match(
+                self.getStampSeconds(header.stamp))
 
-        right_classified_pts = self.tagPoints(self.right_camera_frame, lidar_array_raw,
-                                              self.right_semantic_image)
+            if result == WAITING:
+                return  # Newer clouds will be waiting too
 
-        right_classified_pts = right_classified_pts[right_classified_pts['y'] < 0]
+            self.pending_clouds.popleft()
+            if result != MATCHED:
+                continue
 
-        classified_pts = np.concatenate(
-            (left_classified_pts, right_classified_pts), axis=0)
+            classified_pts = self.getPainter().paint(pts, matrices, images)
 
-        # Convert our combined classified points back to a PointCloud2 message
-        result_msg: PointCloud2 = rnp.msgify(PointCloud2, classified_pts)
-        result_msg.header = msg.header
+            # Convert our combined classified points back to a PointCloud2 message
+            result_msg: PointCloud2 = rnp.msgify(PointCloud2, classified_pts)
+            result_msg.header = header
 
-        self.semantic_lidar_pub.publish(result_msg)
+            self.semantic_lidar_pub.publish(result_msg)
 
 
 def main(args=None):
@@ -4,6 +4,22 @@ Package: segmentation
  Author: Will Heitman (w at heit dot mn)
 
 Node to semantically segment a 2D image using a model.
+
+Left and right frames stamped within batch_window of each other are
+segmented together, in one batched inference call. A frame is segmented
+alone once the other camera sends a frame stamped past it, or once it
+has waited pair_timeout (of wall time) for its partner.
+
+Parameters:
+- batch_window (float): Largest stamp difference between a left and right
+    frame that are segmented together, in seconds
+- pair_timeout (float): Longest a frame waits for its partner to arrive,
+    in seconds of wall time
+
+Publishes:
+- Coloured result, CityScapes scheme (sensor_msgs/Image, rgb8)
+- Raw class IDs (sensor_msgs/Image, mono8)
+- Diagnostic status, incl. paired and single inference batches (DiagnosticStatus)
 '''
 
 
@@ -20,12 +36,12 @@ from tf2_ros.buffer import Buffer
 from tf2_ros.transform_listener import TransformListener
 
 # Message definitions
+from diagnostic_msgs.msg import DiagnosticStatus, KeyValue
 from nav_msgs.msg import OccupancyGrid
 from rosgraph_msgs.msg import Clock
 from sensor_msgs.msg import Image, PointCloud2
 from std_msgs.msg import Float32
 
-import matplotlib.pyplot as plt
 
 import cv2
 from cv_bridge import CvBridge
@@ -34,6 +50,10 @@ from cv_bridge import CvBridge
 from mmseg.apis import inference_segmentor, init_segmentor
 import mmcv
 
+from .palette import PALETTE
+
+CAMERAS = ('left', 'right')
+
 name_to_dtypes = {
     "rgb8":    (np.uint8,  3),
     "rgba8":   (np.uint8,  4),
@@ -106,16 +126,35 @@ class ImageSegmentationNode(Node):
             lifespan=Duration(seconds=0, nanoseconds=2e8)
         )
 
+        self.batch_window = self.declare_parameter(
+            'batch_window', 0.02).value
+        self.pair_timeout = self.declare_parameter(
+            'pair_timeout', 0.1).value
+
         self.left_rgb_sub = self.create_subscription(
             Image, "/carla/hero/rgb_left/image", self.rgbLeftCb, image_qos_policy)
 
-        self.left_result_pub = self.create_publisher(
-            Image, '/semantic/left', 1)
-
         self.right_rgb_sub = self.create_subscription(
             Image, "/carla/hero/rgb_right/image", self.rgbRightCb, image_qos_policy)
-        self.right_result_pub = self.create_publisher(
-            Image, '/semantic/right', 1)
+
+        self.result_pubs = {}
+        self.class_pubs = {}
+        for camera in CAMERAS:
+            self.result_pubs[camera] = self.create_publisher(
+                Image, f'/semantic/{camera}', 1)
+            self.class_pubs[camera] = self.create_publisher(
+                Image, f'/semantic/{camera}/class_ids', 1)
+
+        # Camera -> (Image, wall time received), waiting for the other camera's frame
+        self.pending_frames = {}
+        self.flush_timer = self.create_timer(
+            self.pair_timeout / 2, self.flushPendingFrames)
+
+        self.paired_batches = 0  # Inference calls with both cameras' frames
+        self.single_batches = 0  # Inference calls with one camera's frame
+        self.status_pub = self.create_publisher(
+            DiagnosticStatus, '/node_statuses', 1)
+        self.status_timer = self.create_timer(1.0, self.publishStatus)
 
         self.idx = 0
 
@@ -220,55 +259,100 @@ class ImageSegmentationNode(Node):
         Returns:
             np.array: Colored result (3D array, accounting for RGB channel)
         """
-        result_rgb = np.zeros(
-            (mono_result.shape[0], mono_result.shape[1], 3), dtype=np.uint8)
-        result_rgb[:, :][mono_result == 0] = [128, 64, 128]  # Road
-        result_rgb[:, :][mono_result == 1] = [244, 35, 232]  # Sidewalk
-        result_rgb[:, :][np.logical_or(np.logical_or(
-            mono_result == 2, mono_result == 3), mono_result == 4)] = [70, 70, 70]  # Building, wall, fence
-        result_rgb[:, :][mono_result == 3] = [100, 40, 40]  # Fence
-        result_rgb[:, :][mono_result == 5] = [153, 153, 153]  # Pole
-        result_rgb[:, :][mono_result == 6] = [250, 170, 30]  # Traffic light
-        result_rgb[:, :][mono_result == 7] = [220, 220, 0]  # Traffic light
-        result_rgb[:, :][mono_result == 8] = [107, 142, 35]  # Vegetation
-        result_rgb[:, :][mono_result == 9] = [145, 170, 100]  # Terrain
-        result_rgb[:, :][mono_result == 10] = [70, 130, 180]  # Sky
-        result_rgb[:, :][mono_result == 11] = [220, 20, 60]  # Person
-        result_rgb[:, :][np.logical_or(np.logical_or(
-            np.logical_or(mono_result == 12, mono_result == 13),
-            np.logical_or(mono_result == 14, mono_result == 15)),
-            mono_result == 16)] = [0, 0, 142]  # Car, rider, truck, bus, train, motorcycle
-        result_rgb[:, :][np.logical_or(mono_result == 17, mono_result == 18)] = [
-            119, 11, 32]  # Building, wall, fence
-        return result_rgb
+        return PALETTE[mono_result]
 
-    def rgbLeftCb(self, msg: Image):
-        img_array = self.bridge.imgmsg_to_cv2(
-            msg, 'rgb8')[:, :, :3]  # Cut out alpha
+    def getStampSeconds(self, msg: Image) -> float:
+        return msg.header.stamp.sec + msg.header.stamp.nanosec * 1e-9
+
+    def publishStatus(self):
+        """Report how often both cameras' frames were segmented in one batch"""
+        status = DiagnosticStatus()
+        status.name = self.get_name()
+        status.level = DiagnosticStatus.OK
 
-        # Actually performs the inference
-        result = inference_segmentor(self.model, img_array)[0]
+        values = {
+            'paired_batches': str(self.paired_batches),
+            'single_batches': str(self.single_batches),
+            'pending_frames': str(len(self.pending_frames))
+        }
 
-        result_rgb = self.convertToColor(result)
+        for key, value in values.items():
+            kv = KeyValue()
+            kv.key = key
+            kv.value = value
+            status.values.append(kv)
 
-        result_msg_rgb = self.bridge.cv2_to_imgmsg(result_rgb, encoding='rgb8')
-        result_msg_rgb.header = msg.header
+        self.status_pub.publish(status)
 
-        self.left_result_pub.publish(result_msg_rgb)
+    def rgbLeftCb(self, msg: Image):
+        self.queueFrame('left', msg)
 
     def rgbRightCb(self, msg: Image):
-        img_array = self.bridge.imgmsg_to_cv2(
-            msg, 'rgb8')[:, :, :3]  # Cut out alpha
+        self.queueFrame('right', msg)
+
+    def queueFrame(self, camera: str, msg: Image):
+        """Hold a frame until the other camera's matching frame arrives.
+
+        Args:
+            camera (str): 'left' or 'right'
+            msg (Image): The camera's new frame
+        """
+        self.pending_frames[camera] = (msg, time.time())
+        other = CAMERAS[1] if camera == CAMERAS[0] else CAMERAS[0]
+
+        if other not in self.pending_frames:
+            return
+
+        skew = self.getStampSeconds(msg) - \
+            self.getStampSeconds(self.pending_frames[other][0])
+
+        if abs(skew) <= self.batch_window:
+            self.segment([camera, other])
+        elif skew > 0:
+            # This camera has moved past the other's frame, which can no longer be paired
+            self.segment([other])
+        else:
+            # The other camera has moved past this frame
+            self.segment([camera])
+
+    def flushPendingFrames(self):
+        """Segment any frame that has waited longer than pair_timeout for its partner"""
+        now = time.time()
+        stale = [camera for camera, (_, received) in self.pending_frames.items()
+                 if now - received > self.pair_timeout]
+
+        if len(stale) > 0:
+            self.segment(stale)
+
+    def segment(self, cameras: list):
+        """Segment the pending frames from cameras in one inference call, then publish the results.
+
+        Args:
+            cameras (list): Cameras with pending frames, e.g. ['left', 'right']
+        """
+        msgs = [self.pending_frames.pop(camera)[0] for camera in cameras]
+        if len(msgs) > 1:
+            self.paired_batches += 1
+        else:
+            self.single_batches += 1
+        img_arrays = [self.bridge.imgmsg_to_cv2(
+            msg, 'rgb8')[:, :, :3] for msg in msgs]  # Cut out alpha
 
-        # Actually performs the inference
-        result = inference_segmentor(self.model, img_array)[0]
+        # Actually performs the inference, as a single batch
+        results = inference_segmentor(self.model, img_arrays)
 
-        result_rgb = self.convertToColor(result)
+        for camera, msg, result in zip(cameras, msgs, results):
+            class_ids = result.astype(np.uint8)
 
-        result_msg_rgb = self.bridge.cv2_to_imgmsg(result_rgb, encoding='rgb8')
-        result_msg_rgb.header = msg.header
+            result_msg_ids = self.bridge.cv2_to_imgmsg(
+                class_ids, encoding='mono8')
+            result_msg_ids.header = msg.header
+            self.class_pubs[camera].publish(result_msg_ids)
 
-        self.right_result_pub.publish(result_msg_rgb)
+            result_msg_rgb = self.bridge.cv2_to_imgmsg(
+                self.convertToColor(class_ids), encoding='rgb8')
+            result_msg_rgb.header = msg.header
+            self.result_pubs[camera].publish(result_msg_rgb)
 
 
 def main(args=None):
@@ -0,0 +1,187 @@
+'''
+Package: segmentation
+   File: painting.py
+ Author: Will Heitman (w at heit dot mn)
+
+Paints semantic segmentation images onto lidar points, one whole cloud
+at a time.
+
+Points are projected with a single (N,4) x (4,3) matmul against the
+camera's 3x4 projection matrix, then masked, and each point's colour is
+gathered from the image with fancy indexing.
+
+With several cameras, each point is first assigned to the camera whose
+optical axis points closest to it, then projected into that camera only.
+Every point is projected once, however many cameras there are, and the
+assignment itself is a single table lookup by azimuth.
+'''
+
+import numpy as np
+
+AZIMUTH_BINS = 720  # Half-degree bins for MultiCameraPainter's camera lookup
+
+# Classified cloud, as published on /lidar/semantic
+PAINTED_DTYPE = [
+    ('x', np.float32),
+    ('y', np.float32),
+    ('z', np.float32),
+    ('rgb', np.uint32)
+]
+
+
+def projectToPixels(P: np.ndarray, pts: np.ndarray) -> tuple:
+    """Project points to pixel coordinates.
+
+    Equivalent to PinholeCameraModel.project3dToPixel, for every point at once.
+
+    Args:
+        P (np.ndarray): 3x4 matrix from the points' frame to pixels: either
+            CameraInfo's P, for points in the camera's optical frame, or
+            a matrix from ExtrinsicsCache, for points in base_link
+        pts (np.ndarray): (N,3) points [x,y,z]
+
+    Returns:
+        tuple: ((N,2) pixel coordinates [u,v], (N,) mask of points in front of the camera)
+    """
+    P = np.asarray(P, dtype=np.float64)
+
+    # (3,3) @ (3,N) is much faster than (N,3) @ (3,3)
+    projected = P[:, 0:3] @ pts.T + P[:, 3:4]
+
+    in_front = projected[2] > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        uv = (projected[0:2] / projected[2]).T
+
+    return uv, in_front
+
+
+def packRgb(colors: np.ndarray) -> np.ndarray:
+    """Pack colours into PointCloud2 'rgb' fields, with full opacity.
+
+    Args:
+        colors (np.ndarray): (N,3) colours [r,g,b], 0-255
+
+    Returns:
+        np.ndarray: (N,) packed colours, 0xAARRGGBB
+    """
+    colors = colors.astype(np.uint32)
+    return (np.uint32(255) << 24) | (colors[:, 0] << 16) | (colors[:, 1] << 8) | colors[:, 2]
+
+
+def paintPoints(P: np.ndarray, pts: np.ndarray, semantic_img: np.ndarray) -> tuple:
+    """Look up each point's colour in a semantic image.
+
+    Args:
+        P (np.ndarray): 3x4 matrix from the points' frame to pixels (see projectToPixels)
+        pts (np.ndarray): (N,3) points [x,y,z]
+        semantic_img (np.ndarray): (H,W,3) semantic segmentation image, RGB
+
+    Returns:
+        tuple: ((N,) mask of points that land on the image,
+            (M,) packed colours of those points, see packRgb)
+    """
+    uv, in_front = projectToPixels(P, pts)
+
+    # Truncate, like project3dToPixel's results cast to int
+    height, width = semantic_img.shape[0:2]
+    with np.errstate(invalid='ignore'):
+        on_image = in_front & (uv[:, 0] > -1) & (uv[:, 0] < width) & \
+            (uv[:, 1] > -1) & (uv[:, 1] < height)
+    pixels = uv[on_image].astype(int)
+
+    colors = semantic_img[pixels[:, 1], pixels[:, 0], 0:3]
+
+    return on_image, packRgb(colors)
+
+
+def toPaintedCloud(pts: np.ndarray, rgb: np.ndarray) -> np.ndarray:
+    """Combine points and packed colours into a structured array (see PAINTED_DTYPE)"""
+    xyzc = np.zeros(len(pts), dtype=PAINTED_DTYPE)
+    xyzc['x'] = pts[:, 0]
+    xyzc['y'] = pts[:, 1]
+    xyzc['z'] = pts[:, 2]
+    xyzc['rgb'] = rgb
+
+    return xyzc
+
+
+class MultiCameraPainter:
+
+    def __init__(self, origins: np.ndarray, axes: np.ndarray, bins: int = AZIMUTH_BINS):
+        """Precompute which camera each point should be painted by.
+
+        Points are assigned to the camera whose optical axis has the nearest
+        azimuth, as seen from the middle of the rig. For cameras mounted at
+        the same pitch, that is also the camera whose axis is nearest in 3D.
+
+        Args:
+            origins (np.ndarray): (C,3) camera positions in base_link
+            axes (np.ndarray): (C,3) unit optical axes in base_link
+                (see ExtrinsicsCache.getOpticalAxis)
+            bins (int, optional): Azimuth resolution of the lookup table
+        """
+        self.center = np.mean(origins, axis=0)
+        self.camera_count = len(axes)
+        self.bins = bins
+
+        headings = np.asarray(axes)[:, 0:2]
+        headings = headings / \
+            np.maximum(np.linalg.norm(headings, axis=1, keepdims=True), 1e-12)
+
+        # Camera for each azimuth bin, from -pi to pi
+        bin_azimuths = (np.arange(bins) + 0.5) * (2 * np.pi / bins) - np.pi
+        bin_directions = np.column_stack(
+            (np.cos(bin_azimuths), np.sin(bin_azimuths)))
+        self.table = np.argmax(bin_directions @ headings.T, axis=1).astype(
+            np.min_scalar_type(self.camera_count - 1))
+
+    def assign(self, pts: np.ndarray) -> np.ndarray:
+        """Return the index of each point's camera.
+
+        Args:
+            pts (np.ndarray): (N,3) points in base_link
+
+        Returns:
+            np.ndarray: (N,) camera indices
+        """
+        azimuths = np.arctan2(pts[:, 1] - self.center[1],
+                              pts[:, 0] - self.center[0])
+        bins = ((azimuths + np.pi) * (self.bins / (2 * np.pi))).astype(np.intp)
+
+        return self.table[np.minimum(bins, self.bins - 1)]
+
+    def paint(self, pts: np.ndarray, matrices: list, images: list) -> np.ndarray:
+        """Paint a cloud, projecting each point into its own camera only.
+
+        Args:
+            pts (np.ndarray): (N,3) points in base_link
+            matrices (list): Each camera's 3x4 base_link->pixel matrix
+            images (list): Each camera's (H,W,3) semantic image, RGB
+
+        Returns:
+            np.ndarray: Painted points (see PAINTED_DTYPE), grouped by camera.
+                Points that miss their camera's image are left out.
+        """
+        assignments = self.assign(pts)
+
+        # Group the points by camera with one sort, rather than a mask per camera.
+        # Each camera then paints a contiguous slice of the sorted points.
+        order = np.argsort(assignments, kind='stable')
+        pts = pts[order]
+        bounds = np.searchsorted(
+            assignments[order], np.arange(self.camera_count + 1))
+
+        painted = np.zeros(len(pts), dtype=bool)
+        rgb = np.zeros(len(pts), dtype=np.uint32)
+
+        for i in range(self.camera_count):
+            camera_pts = slice(bounds[i], bounds[i+1])
+            if bounds[i] == bounds[i+1]:
+                continue
+
+            on_image, colors = paintPoints(
+                matrices[i], pts[camera_pts], images[i])
+            painted[camera_pts] = on_image
+            rgb[camera_pts][on_image] = colors
+
+        return toPaintedCloud(pts[painted], rgb[painted])
@@ -0,0 +1,46 @@
+'''
+Package: segmentation
+   File: palette.py
+ Author: Will Heitman (w at heit dot mn)
+
+Colours for segmentation results, using the CityScapes colouring scheme.
+
+A result is coloured with a single lookup, PALETTE[class_ids], rather
+than a boolean mask pass per class. Class IDs without a colour are black.
+'''
+
+import numpy as np
+
+CLASS_COLORS = {
+    0: (128, 64, 128),  # Road
+    1: (244, 35, 232),  # Sidewalk
+    2: (70, 70, 70),  # Building
+    3: (100, 40, 40),  # Wall
+    4: (70, 70, 70),  # Fence
+    5: (153, 153, 153),  # Pole
+    6: (250, 170, 30),  # Traffic light
+    7: (220, 220, 0),  # Traffic sign
+    8: (107, 142, 35),  # Vegetation
+    9: (145, 170, 100),  # Terrain
+    10: (70, 130, 180),  # Sky
+    11: (220, 20, 60),  # Person
+    12: (0, 0, 142),  # Rider
+    13: (0, 0, 142),  # Car
+    14: (0, 0, 142),  # Truck
+    15: (0, 0, 142),  # Bus
+    16: (0, 0, 142),  # Train
+    17: (119, 11, 32),  # Motorcycle
+    18: (119, 11, 32)  # Bicycle
+}
+
+
+def getPalette() -> np.ndarray:
+    """Return a (256,3) RGB lookup table, indexed by class ID"""
+    palette = np.zeros((256, 3), dtype=np.uint8)
+    for class_id, color in CLASS_COLORS.items():
+        palette[class_id] = color
+
+    return palette
+
+
+PALETTE = getPalette()
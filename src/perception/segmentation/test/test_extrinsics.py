@@ -0,0 +1,56 @@
+import unittest
+
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+
+from segmentation.extrinsics import ExtrinsicsCache, getTransformMatrix
+from segmentation.painting import projectToPixels
+
+P = np.array([[512.0, 0.0, 512.0, 0.0],
+              [0.0, 512.0, 256.0, 0.0],
+              [0.0, 0.0, 1.0, 0.0]])
+
+
+class TestExtrinsicsCache(unittest.TestCase):
+    def test_matches_transform_then_project(self):
+        rng = np.random.default_rng(0)
+        quaternion = R.random(random_state=0).as_quat()
+        translation = [0.3, -0.5, 1.7]
+        pts = rng.uniform(-20, 20, (100, 3))
+
+        cache = ExtrinsicsCache()
+        cache.setProjection('camera', P.ravel())
+        cache.setTransform('camera', getTransformMatrix(quaternion, translation))
+
+        pts_in_camera = R.from_quat(quaternion).apply(pts) + translation
+        expected_uv, expected_in_front = projectToPixels(P, pts_in_camera)
+        uv, in_front = projectToPixels(cache.getMatrix('camera'), pts)
+
+        np.testing.assert_array_equal(in_front, expected_in_front)
+        np.testing.assert_allclose(uv[in_front], expected_uv[in_front])
+
+    def test_cameras_are_independent(self):
+        cache = ExtrinsicsCache()
+        cache.setProjection('left', P)
+        cache.setProjection('right', 2 * P)
+        cache.setTransform('left', np.eye(4))
+        cache.setTransform('right', np.eye(4))
+
+        np.testing.assert_array_equal(cache.getMatrix('left'), P)
+        np.testing.assert_array_equal(cache.getMatrix('right'), 2 * P)
+
+    def test_invalidation(self):
+        cache = ExtrinsicsCache()
+        self.assertIsNone(cache.getMatrix('camera'))
+
+        self.assertTrue(cache.setProjection('camera', P))
+        self.assertFalse(cache.setProjection('camera', P.ravel()))
+        self.assertIsNone(cache.getMatrix('camera'))
+
+        cache.setTransform('camera', np.eye(4))
+        matrix = cache.getMatrix('camera')
+        self.assertIs(cache.getMatrix('camera'), matrix)
+
+        cache.invalidateTransforms()
+        self.assertFalse(cache.hasTransform('camera'))
+        self.assertIsNone(cache.getMatrix('camera'))
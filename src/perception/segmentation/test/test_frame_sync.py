@@ -0,0 +1,48 @@
+import unittest
+
+from segmentation.frame_sync import FrameSync, StampedBuffer, MATCHED, WAITING, UNMATCHED
+
+
+class TestStampedBuffer(unittest.TestCase):
+    def test_closest_frame(self):
+        buffer = StampedBuffer(capacity=3)
+        self.assertEqual(buffer.getClosest(1.0)[0], None)
+
+        for stamp in [0.0, 0.1, 0.2, 0.3]:
+            buffer.push(stamp, f"frame {stamp}")
+
+        frame, skew = buffer.getClosest(0.22)
+        self.assertEqual(frame, "frame 0.2")
+        self.assertAlmostEqual(skew, -0.02)
+
+        # The oldest frame was overwritten
+        self.assertEqual(buffer.getClosest(0.0)[0], "frame 0.1")
+        self.assertEqual(buffer.newestStamp(), 0.3)
+
+
+class TestFrameSync(unittest.TestCase):
+    def test_waits_for_late_frames(self):
+        sync = FrameSync(2, tolerance=0.05)
+        sync.push(0, 0.98, 'left')
+
+        # A closer left frame might still arrive, and no right frame has yet
+        self.assertEqual(sync.match(1.0), (WAITING, None))
+
+        sync.push(0, 1.01, 'left, later')
+        sync.push(1, 1.03, 'right')
+        self.assertEqual(sync.match(1.0), (MATCHED, ['left, later', 'right']))
+        self.assertEqual(sync.matched, 1)
+
+        mean_skew, max_skew = sync.getSkewStats(1)
+        self.assertAlmostEqual(mean_skew, 0.03)
+        self.assertAlmostEqual(max_skew, 0.03)
+
+    def test_drops_unmatched_clouds(self):
+        sync = FrameSync(2, tolerance=0.05)
+        sync.push(0, 1.0, 'left')
+        sync.push(1, 0.8, 'right')
+        sync.push(1, 1.2, 'right')
+
+        # The right camera skipped the cloud's time
+        self.assertEqual(sync.match(1.0), (UNMATCHED, None))
+        self.assertEqual(sync.unmatched, 1)
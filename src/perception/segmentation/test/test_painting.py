@@ -0,0 +1,144 @@
+import struct
+import unittest
+
+import numpy as np
+from scipy.spatial.transform import Rotation as R
+
+from segmentation.extrinsics import ExtrinsicsCache, getTransformMatrix
+from segmentation.painting import MultiCameraPainter, paintPoints, packRgb, \
+    projectToPixels
+
+# CARLA's 1024x512 cameras, with a 90 degree field of view
+P = np.array([[512.0, 0.0, 512.0, 0.0],
+              [0.0, 512.0, 256.0, 0.0],
+              [0.0, 0.0, 1.0, 0.0]])
+
+
+def getLoopPaint(pts, semantic_img):
+    """The original per-point projection loop, for comparison"""
+    on_image = []
+    rgb = []
+    for pt in pts:
+        # PinholeCameraModel.project3dToPixel
+        dst = P @ np.append(pt, 1.0)
+        pixel_coords = np.array([dst[0] / dst[2], dst[1] / dst[2]]).astype(int)
+
+        if pixel_coords[0] > 1023 or pixel_coords[0] < 0 or \
+                pixel_coords[1] > 511 or pixel_coords[1] < 0:
+            on_image.append(False)
+            continue
+
+        r, g, b = (int(c) for c in semantic_img[pixel_coords[1], pixel_coords[0]])
+        rgb.append(struct.unpack('I', struct.pack('BBBB', b, g, r, 255))[0])
+        on_image.append(True)
+
+    return np.array(on_image), np.array(rgb, dtype=np.uint32)
+
+
+class TestPainting(unittest.TestCase):
+    def test_matches_loop(self):
+        rng = np.random.default_rng(0)
+        semantic_img = rng.integers(0, 256, (512, 1024, 3), dtype=np.uint8)
+        # In front of the camera, some of them outside of its view
+        pts = np.column_stack((rng.uniform(-20, 20, (2000, 2)),
+                               rng.uniform(0.5, 20, 2000)))
+
+        on_image, rgb = paintPoints(P, pts, semantic_img)
+        expected_on_image, expected_rgb = getLoopPaint(pts, semantic_img)
+
+        np.testing.assert_array_equal(on_image, expected_on_image)
+        np.testing.assert_array_equal(rgb, expected_rgb)
+
+    def test_skips_points_behind_camera(self):
+        pts = np.array([[0.0, 0.0, 5.0], [0.0, 0.0, -5.0], [0.0, 0.0, 0.0]])
+
+        _, in_front = projectToPixels(P, pts)
+        on_image, _ = paintPoints(P, pts, np.zeros((512, 1024, 3), np.uint8))
+
+        np.testing.assert_array_equal(in_front, [True, False, False])
+        np.testing.assert_array_equal(on_image, [True, False, False])
+
+    def test_pack_rgb(self):
+        np.testing.assert_array_equal(
+            packRgb(np.array([[128, 64, 128], [0, 0, 0]], dtype=np.uint8)),
+            [0xFF804080, 0xFF000000])
+
+
+def getCamera(yaw: float) -> tuple:
+    """A camera at base_link, facing yaw radians left of forward
+
+    Returns:
+        tuple: (3x4 base_link->pixel matrix, origin, optical axis)
+    """
+    # Rows are the optical frame's axes (x right, y down, z forward) in base_link
+    base_to_optical = R.from_matrix([[np.sin(yaw), -np.cos(yaw), 0.0],
+                                     [0.0, 0.0, -1.0],
+                                     [np.cos(yaw), np.sin(yaw), 0.0]])
+
+    cache = ExtrinsicsCache()
+    cache.setProjection('camera', P)
+    cache.setTransform('camera', getTransformMatrix(
+        base_to_optical.as_quat(), [0.0, 0.0, 0.0]))
+
+    return (cache.getMatrix('camera'), *cache.getOpticalAxis('camera'))
+
+
+class TestMultiCameraPainter(unittest.TestCase):
+    def setUp(self):
+        matrices, origins, axes = zip(
+            getCamera(np.radians(35)), getCamera(np.radians(-35)))
+        self.matrices = matrices
+        self.painter = MultiCameraPainter(np.array(origins), np.array(axes))
+        self.axes = np.array(axes)
+
+        # Each camera sees a single colour
+        self.images = [np.zeros((512, 1024, 3), dtype=np.uint8) for _ in range(2)]
+        self.images[0][:, :] = (255, 0, 0)
+        self.images[1][:, :] = (0, 0, 255)
+
+    def test_optical_axis(self):
+        np.testing.assert_allclose(
+            self.axes[0], [np.cos(np.radians(35)), np.sin(np.radians(35)), 0], atol=1e-12)
+
+    def test_assigns_nearest_axis(self):
+        rng = np.random.default_rng(0)
+        pts = rng.uniform(-30, 30, (1000, 3))
+
+        # Nearest in 3D, for these level cameras
+        expected = np.argmax(pts @ self.axes.T /
+                             np.linalg.norm(pts, axis=1, keepdims=True), axis=1)
+        assignments = self.painter.assign(pts)
+
+        # Up to the azimuth table's resolution, at the border between cameras
+        azimuths = np.degrees(np.arctan2(pts[:, 1], pts[:, 0]))
+        away_from_border = (np.abs(azimuths) > 0.5) & (np.abs(np.abs(azimuths) - 180) > 0.5)
+        np.testing.assert_array_equal(
+            assignments[away_from_border], expected[away_from_border])
+
+    def test_each_point_painted_once(self):
+        rng = np.random.default_rng(0)
+        pts = np.column_stack((rng.uniform(0.5, 30, 3000),
+                               rng.uniform(-30, 30, 3000),
+                               rng.uniform(-2, 2, 3000)))
+
+        painted = self.painter.paint(pts, self.matrices, self.images)
+        left = painted['y'] > 0
+
+        self.assertGreater(len(painted), 1000)
+        self.assertEqual(len(np.unique(painted[['x', 'y', 'z']])), len(painted))
+        np.testing.assert_array_equal(painted['rgb'][left], 0xFFFF0000)
+        np.testing.assert_array_equal(painted['rgb'][~left], 0xFF0000FF)
+
+    def test_matches_single_camera_painting(self):
+        rng = np.random.default_rng(1)
+        pts = rng.uniform(-30, 30, (3000, 3))
+        painted = self.painter.paint(pts, self.matrices, self.images)
+
+        assignments = self.painter.assign(pts)
+        expected = 0
+        for i in range(2):
+            on_image, _ = paintPoints(
+                self.matrices[i], pts[assignments == i], self.images[i])
+            expected += np.count_nonzero(on_image)
+
+        self.assertEqual(len(painted), expected)
@@ -0,0 +1,46 @@
+import unittest
+
+import numpy as np
+
+from segmentation.palette import PALETTE
+
+
+def convertToColor(mono_result):
+    """The previous mask-per-class colouring, for reference"""
+    result_rgb = np.zeros(
+        (mono_result.shape[0], mono_result.shape[1], 3), dtype=np.uint8)
+    result_rgb[:, :][mono_result == 0] = [128, 64, 128]
+    result_rgb[:, :][mono_result == 1] = [244, 35, 232]
+    result_rgb[:, :][np.logical_or(np.logical_or(
+        mono_result == 2, mono_result == 3), mono_result == 4)] = [70, 70, 70]
+    result_rgb[:, :][mono_result == 3] = [100, 40, 40]
+    result_rgb[:, :][mono_result == 5] = [153, 153, 153]
+    result_rgb[:, :][mono_result == 6] = [250, 170, 30]
+    result_rgb[:, :][mono_result == 7] = [220, 220, 0]
+    result_rgb[:, :][mono_result == 8] = [107, 142, 35]
+    result_rgb[:, :][mono_result == 9] = [145, 170, 100]
+    result_rgb[:, :][mono_result == 10] = [70, 130, 180]
+    result_rgb[:, :][mono_result == 11] = [220, 20, 60]
+    result_rgb[:, :][np.isin(mono_result, [12, 13, 14, 15, 16])] = [0, 0, 142]
+    result_rgb[:, :][np.logical_or(mono_result == 17, mono_result == 18)] = [
+        119, 11, 32]
+    return result_rgb
+
+
+class TestPalette(unittest.TestCase):
+    def test_matches_mask_coloring(self):
+        rng = np.random.default_rng(0)
+        result = rng.integers(0, 256, size=(64, 128))
+
+        np.testing.assert_array_equal(PALETTE[result], convertToColor(result))
+        np.testing.assert_array_equal(
+            PALETTE[result.astype(np.uint8)], convertToColor(result))
+
+    def test_unknown_classes_are_black(self):
+        self.assertEqual(PALETTE.shape, (256, 3))
+        self.assertEqual(PALETTE.dtype, np.uint8)
+        self.assertFalse(np.any(PALETTE[19:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -28,8 +28,6 @@ from rosgraph_msgs.msg import Clock
 from sensor_msgs.msg import PointCloud2
 from std_msgs.msg import Float32
 
-import matplotlib.pyplot as plt
-
 
 class LidarProcessingNode(Node):
 
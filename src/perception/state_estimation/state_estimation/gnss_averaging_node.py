@@ -26,7 +26,6 @@ import math
 import rclpy
 import ros2_numpy as rnp
 import numpy as np
-import matplotlib.pyplot as plt
 from rclpy.node import Node
 from builtin_interfaces.msg import Time
 from tf2_ros import TransformBroadcaster
@@ -39,6 +38,11 @@ from nav_msgs.msg import Odometry
 from rosgraph_msgs.msg import Clock
 from sensor_msgs.msg import Imu
 
+from .ring_buffer import RingBuffer
+
+# Most stationary GNSS poses to average. At 20 Hz, this is the last 25 seconds.
+MAX_CACHED_GNSS_POSES = 500
+
 
 class GnssAveragingNode(Node):
 
@@ -81,7 +85,7 @@ class GnssAveragingNode(Node):
         self.last_update_time = None
         self.heading_rate = 0.0  # rad/s
         self.is_stationary = True
-        self.cached_gnss_poses = []
+        self.cached_gnss_poses = RingBuffer(MAX_CACHED_GNSS_POSES, shape=(3,))
         self.current_pose = None  # [x, y, heading]
         self.yaw = 0.0
 
@@ -176,33 +180,29 @@ class GnssAveragingNode(Node):
             if gnss_pose_arr[2] > math.pi:
                 gnss_pose_arr[2] -= 2*math.pi
 
-            self.cached_gnss_poses.append(gnss_pose_arr)
+            self.cached_gnss_poses.push(gnss_pose_arr)
 
-            if len(self.cached_gnss_poses) % 10 == 0:
-                print(f"Cache now has {len(self.cached_gnss_poses)} poses")
+            self.get_logger().debug(
+                f"Cache now has {len(self.cached_gnss_poses)} poses")
 
             if len(self.cached_gnss_poses) > 10:
-                cached_poses = np.array(self.cached_gnss_poses)
-                self.current_pose = np.mean(cached_poses, axis=0)
-
-            # if len(self.cached_gnss_poses) > 50:
-            #     self.cached_gnss_poses = self.cached_gnss_poses[:-50]
+                self.current_pose = self.cached_gnss_poses.mean()
 
         elif self.is_stationary:
             # We're over the stationary speed, so update our state
             self.is_stationary = False
 
-            # Calculate average pose
-            cached_poses = np.array(self.cached_gnss_poses)
-            average_pose = np.mean(cached_poses, axis=0)
-
-            if len(cached_poses) < 2:
+            if len(self.cached_gnss_poses) < 2:
                 return
 
+            # Calculate average pose
+            average_pose = self.cached_gnss_poses.mean()
+
             average_pose[2] %= 2*math.pi  # Wrap to [0, 2*pi]
 
             self.get_logger().info(
                 f"Pose was corrected by {average_pose-self.current_pose}")
+            # cached_poses = self.cached_gnss_poses.toArray()
             # plt.scatter(cached_poses[:, 0], cached_poses[:, 1], c='blue')
             # plt.scatter(average_pose[0], average_pose[1], c='green')
             # plt.show()
@@ -25,24 +25,8 @@ from xml.etree import ElementTree as ET
 
 from scipy.spatial.transform import Rotation as R
 
-
-def toRadians(degrees: float):
-    return degrees * math.pi / 180.0
-
-
-def latToScale(lat: float) -> float:
-    """Return UTM projection scale
-
-    Args:
-        lat (float): degrees latitude
-
-    Returns:
-        float: projection scale
-    """
-    return math.cos(toRadians(lat))
-
-
-EARTH_RADIUS_EQUA = 6378137.0
+from geo_projection.projection import MercatorProjection
+from .ring_buffer import RingBuffer
 
 
 class GnssProcessingNode(Node):
@@ -89,13 +73,12 @@ class GnssProcessingNode(Node):
         self.clock = Clock()
         self.lat0 = None
         self.lon0 = None
+        self.projection: MercatorProjection = None  # Created once lat0/lon0 are known
 
-        # Make a queue of previous poses for our weighted moving average
-        # where '10' is the size of our history
+        # Make a queue of previous [x, y, z] positions for our weighted moving average
+        # where '5' is the size of our history
         self.history_size = 5
-        self.previous_x_vals = np.zeros((self.history_size))
-        self.previous_y_vals = np.zeros((self.history_size))
-        self.previous_z_vals = np.zeros((self.history_size))
+        self.previous_positions = RingBuffer(self.history_size, shape=(3,))
         self.wma_pose = Pose()
 
     def _parse_header_(self, root: ET.Element) -> dict:
@@ -121,41 +104,15 @@ class GnssProcessingNode(Node):
             return
         root = ET.fromstring(msg.opendrive)
         self.lat0, self.lon0 = self._parse_header_(root)
+        self.projection = MercatorProjection(self.lat0, self.lon0)
         self.get_logger().info("World info received.")
 
-    def latlonToMercator(self, lat: float, lon: float, scale: float) -> tuple:
-        """Convert geodetic coords (in degrees) to UTM coords (meters)
-
-        Copied to match CARLA:
-        [LatLonToMercator](https://github.com/carla-simulator/carla/blob/fe3cb6863a604f5c0cf8b692fe2b6300b45b5999/LibCarla/source/carla/geom/GeoLocation.cpp#L38)
-
-        Args:
-            lat (float): degrees
-            lon (float): degrees
-            scale (float): projection scale (see latToScale)
-
-        Returns:
-            tuple: (x,y) in UTM meters
-        """
-        x = scale * toRadians(lon) * EARTH_RADIUS_EQUA
-        y = scale * EARTH_RADIUS_EQUA * \
-            math.log(math.tan((90.0+lat) * math.pi/360.0))
-
-        return (x, y)
-
     def gnssCb(self, msg: NavSatFix):
-        if self.lat0 is None:
+        if self.projection is None:
             return
 
-        x0, y0 = self.latlonToMercator(
-            self.lat0, self.lon0, latToScale(self.lat0))
-
-        # TODO: Should scale here be from self.lat0?
-        x, y = self.latlonToMercator(
-            msg.latitude, msg.longitude, latToScale(msg.latitude))
-
-        position_x = x - x0
-        position_y = y - y0
+        position_x, position_y = self.projection.toLocal(
+            msg.latitude, msg.longitude)
 
         odom_msg = Odometry()
 
@@ -168,8 +125,8 @@ class GnssProcessingNode(Node):
         odom_msg.child_frame_id = 'base_link'
         pos = Point()
 
-        pos.x = position_x
-        pos.y = position_y
+        pos.x = float(position_x)
+        pos.y = float(position_y)
         pos.z = msg.altitude  # TODO: Make relative to georeference
         odom_msg.pose.pose.position = pos
         self.raw_odom_pub.publish(odom_msg)
@@ -204,21 +161,12 @@ class GnssProcessingNode(Node):
 
         # Calculate the weighted moving average (WMA) for odometry
         # 1. Discard oldest reading and add newest to 'queue'
+        self.previous_positions.push(
+            [current_pos.x, current_pos.y, current_pos.z])
 
-        self.previous_x_vals = np.roll(self.previous_x_vals, -1)
-        self.previous_y_vals = np.roll(self.previous_y_vals, -1)
-        self.previous_z_vals = np.roll(self.previous_z_vals, -1)
-        self.previous_x_vals[self.history_size-1] = current_pos.x
-        self.previous_y_vals[self.history_size-1] = current_pos.y
-        self.previous_z_vals[self.history_size-1] = current_pos.z
-
-        # 2. Generate weight array: [1,2,3,...,n]
-        weights = np.arange(0, self.history_size)
-
-        # 3. Use a numpy functions to handle the rest :->)
-        wma_x = np.average(self.previous_x_vals, axis=0, weights=weights)
-        wma_y = np.average(self.previous_y_vals, axis=0, weights=weights)
-        wma_z = np.average(self.previous_z_vals, axis=0, weights=weights)
+        # 2. Weigh readings [1,2,3,...,n], newest last. The buffer keeps
+        # running sums, so this doesn't depend on the history size.
+        wma_x, wma_y, wma_z = self.previous_positions.weightedMean()
 
         wma_pose = Pose()
         wma_pose.position.x = wma_x
@@ -286,7 +234,7 @@ class GnssProcessingNode(Node):
         # Update our timestamp (used to check staleness)
         self.latest_timestamp = odom_msg.header.stamp
 
-        # self.get_logger().info("{}".format(str(self.previous_y_vals)))
+        # self.get_logger().info("{}".format(str(self.previous_positions.toArray())))
         # self.get_logger().info(f"CURRENT Y: {current_pos.y}")
 
         # Publish our map->base_link tf
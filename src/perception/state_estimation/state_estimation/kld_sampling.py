@@ -0,0 +1,70 @@
+'''
+Package: state_estimation
+   File: kld_sampling.py
+ Author: Will Heitman (w at heit dot mn)
+
+KLD-sampling: choose how many particles MCL needs.
+
+Particles are binned into a coarse (x, y, heading) histogram. If k bins are
+occupied, then with probability 1 - delta, the Kullback-Leibler divergence
+between the particles and the true posterior stays under epsilon as long as
+we have at least
+
+    (k - 1) / (2 epsilon) * (1 - 2 / (9 (k - 1)) + sqrt(2 / (9 (k - 1))) z)^3
+
+particles, where z is the upper 1 - delta quantile of the standard normal.
+A spread-out posterior occupies many bins and gets many particles, while a
+converged one gets few.
+
+Reference: Fox, "KLD-Sampling: Adaptive Particle Filters" (NIPS 2001)
+'''
+
+import numpy as np
+import scipy.stats
+
+DEFAULT_BIN_SIZE = np.array([0.5, 0.5, np.deg2rad(10.0)])  # meters, meters, radians
+
+
+def getOccupiedBinCount(particles: np.ndarray, bin_size=DEFAULT_BIN_SIZE) -> int:
+    """Count the histogram bins that hold at least one particle.
+
+    Args:
+        particles (np.ndarray): (N,3) particles [x, y, heading]
+        bin_size (optional): Bin size along [x, y, heading].
+            Defaults to DEFAULT_BIN_SIZE.
+
+    Returns:
+        int: Number of occupied bins
+    """
+    if len(particles) == 0:
+        return 0
+
+    bins = np.floor(particles[:, 0:3] / bin_size).astype(np.int64)
+    return len(np.unique(bins, axis=0))
+
+
+def getKLDParticleCount(particles: np.ndarray, min_N: int, max_N: int, epsilon=0.05,
+                        delta=0.01, bin_size=DEFAULT_BIN_SIZE) -> int:
+    """Number of particles needed to represent the current particle spread.
+
+    Args:
+        particles (np.ndarray): (N,3) particles [x, y, heading]
+        min_N (int): Fewest particles to return
+        max_N (int): Most particles to return
+        epsilon (float, optional): Allowed KL divergence. Defaults to 0.05.
+        delta (float, optional): Chance of exceeding epsilon. Defaults to 0.01.
+        bin_size (optional): Bin size along [x, y, heading].
+            Defaults to DEFAULT_BIN_SIZE.
+
+    Returns:
+        int: Particle count, clipped to [min_N, max_N]
+    """
+    k = getOccupiedBinCount(particles, bin_size)
+    if k < 2:
+        return min_N
+
+    z = scipy.stats.norm.ppf(1 - delta)
+    a = 2 / (9 * (k - 1))
+    count = (k - 1) / (2 * epsilon) * (1 - a + np.sqrt(a) * z)**3
+
+    return int(np.clip(np.ceil(count), min_N, max_N))
@@ -0,0 +1,61 @@
+'''
+Package: state_estimation
+   File: landmarks.py
+ Author: Will Heitman (w at heit dot mn)
+
+Landmark extraction from semantic lidar clouds.
+
+A single traffic light or pole can return hundreds of lidar hits. These
+are grouped by hashing each point into a square grid cell, in one
+vectorized pass, and every occupied cell becomes one landmark: the
+centroid of its points, plus the number of points it stands for.
+'''
+
+import numpy as np
+
+
+def getClusters(points: np.ndarray, cell_size: float) -> tuple:
+    """Group 2D points by grid cell.
+
+    Args:
+        points (np.ndarray): (N,2) points [x, y]
+        cell_size (float): Cell size in meters. Points in the same cell
+            form one cluster.
+
+    Returns:
+        tuple: (centroids, counts), where centroids is (K,2) and counts is (K,)
+    """
+    if len(points) == 0:
+        return np.zeros((0, 2)), np.zeros(0, dtype=int)
+
+    cells = np.floor(points[:, 0:2] / cell_size).astype(np.int64)
+    _, cluster_ids, counts = np.unique(
+        cells, axis=0, return_inverse=True, return_counts=True)
+    cluster_ids = cluster_ids.ravel()
+
+    centroids = np.empty((len(counts), 2))
+    centroids[:, 0] = np.bincount(cluster_ids, weights=points[:, 0])
+    centroids[:, 1] = np.bincount(cluster_ids, weights=points[:, 1])
+    centroids /= counts[:, np.newaxis]
+
+    return centroids, counts
+
+
+def extractLandmarks(cloud: np.ndarray, class_id: int, cell_size: float,
+                     max_distance: float = np.inf) -> tuple:
+    """Find the landmarks of one class in a classified cloud.
+
+    Args:
+        cloud (np.ndarray): (N,3) cloud [x, y, class ID], in base_link
+        class_id (int): Class to extract, e.g. TRAFFIC_LIGHT_ID
+        cell_size (float): Points closer than about this are merged into one landmark
+        max_distance (float, optional): Ignore points further than this from
+            base_link. Defaults to no limit.
+
+    Returns:
+        tuple: (centroids, counts), where centroids is (K,2) and counts is (K,)
+    """
+    points = cloud[cloud[:, 2] == class_id][:, 0:2]
+    points = points[np.linalg.norm(points, axis=1) < max_distance]
+
+    return getClusters(points, cell_size)
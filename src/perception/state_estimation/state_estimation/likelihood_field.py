@@ -0,0 +1,69 @@
+'''
+Package: state_estimation
+   File: likelihood_field.py
+ Author: Will Heitman (w at heit dot mn)
+
+Likelihood field for scoring MCL particles.
+
+Rather than asking "did this road point land exactly on a drivable cell?",
+each cell holds a smooth score that falls off with the distance to the
+nearest drivable cell: exp(-d^2 / 2 sigma^2). A point that misses the road
+by a cell still earns most of its score, which makes particle weights
+better conditioned. The field is built with one distance transform per
+grid, so scoring a point is a single lookup.
+'''
+
+import numpy as np
+from scipy.ndimage import distance_transform_edt
+
+DRIVABLE = 100  # Value of drivable cells in /grid/drivable
+
+
+def getLikelihoodField(grid: np.ndarray, resolution: float, sigma: float) -> np.ndarray:
+    """Build a likelihood field from a drivable grid.
+
+    Args:
+        grid (np.ndarray): Drivable grid, where DRIVABLE marks road cells
+        resolution (float): Cell size in meters
+        sigma (float): Falloff of the field in meters. If zero, the field
+            is 1 on drivable cells and 0 elsewhere.
+
+    Returns:
+        np.ndarray: float32 field with the grid's shape, in [0, 1]
+    """
+    drivable = grid == DRIVABLE
+
+    if sigma <= 0.0 or not drivable.any():
+        return drivable.astype(np.float32)
+
+    # Distance from each cell to the nearest drivable cell, in meters
+    distances = distance_transform_edt(~drivable, sampling=resolution)
+
+    field = np.square(distances / sigma)
+    field *= -0.5
+    np.exp(field, out=field)
+    return field.astype(np.float32)
+
+
+class LikelihoodField:
+
+    def __init__(self, resolution: float, sigma: float):
+        """Cache of the likelihood field for the latest grid.
+
+        Args:
+            resolution (float): Cell size in meters
+            sigma (float): Falloff of the field in meters
+        """
+        self.resolution = resolution
+        self.sigma = sigma
+        self.grid = None  # Grid that `field` was built from
+        self.field = None
+
+    def update(self, grid: np.ndarray) -> np.ndarray:
+        """Return the field for this grid, rebuilding it only if the grid changed"""
+        if self.grid is not None and np.array_equal(self.grid, grid):
+            return self.field
+
+        self.grid = np.array(grid)  # Copy, since the caller may reuse its buffer
+        self.field = getLikelihoodField(grid, self.resolution, self.sigma)
+        return self.field
@@ -32,7 +32,13 @@ from numpy.random import randn, random
 import scipy
 import scipy.stats
 import time
-import matplotlib.pyplot as plt
+from vt_viz import debug_plot
+
+from .kld_sampling import getKLDParticleCount
+from .landmarks import extractLandmarks
+from .likelihood_field import getLikelihoodField
+from .resampling import getResampler
+from .ring_buffer import RingBuffer
 
 ROAD_ID = 4286595200
 TRAFFIC_LIGHT_ID = 4294617630
@@ -42,7 +48,30 @@ GRID_ORIGIN_METERS = [-20., -30.]
 GRID_ORIGIN_METERS = np.array(GRID_ORIGIN_METERS)
 CELL_SIZE = 0.4  # meters/cell
 
-DO_PLOT_ALIGNMENT = False
+# Most grid lookups to do at once in getAlignments(), which bounds its memory use
+MAX_SCORED_POINTS = 2**20
+
+KIDNAPPED_DISTANCE = 3.0  # meters. Estimate this far from GNSS resets the filter.
+DISAGREEMENT_DISTANCE = 1.5  # meters. Estimate this far from GNSS counts as a disagreement.
+# Consecutive disagreements before particles are added. A single noisy GNSS fix
+# is not enough to grow the filter.
+DISAGREEMENT_PERSISTENCE = 3
+MAX_GNSS_DISTANCE = 5.0  # meters. Particles this far from GNSS get no weight.
+ROUGHENING_STD = 0.1  # meters. Noise added to particles after resampling.
+HISTORY_SIZE = 1000  # Number of past estimates and GNSS poses to keep
+
+# Motion noise std (heading in radians, distance in meters) over MOTION_NOISE_PERIOD.
+# Noise is a random walk, so its std grows with sqrt(dt). Predicting at IMU
+# rate then spreads the particles as much as predicting once per cloud.
+MOTION_NOISE_STD = (0.3, 0.05)
+MOTION_NOISE_PERIOD = 0.1  # seconds
+
+# Stages of each step, as timed in MCL.stage_times
+STAGES = ('predict', 'weight', 'resample', 'estimate', 'adapt')
+
+# Poles and traffic lights are scored as one point per grid cell that they occupy
+LANDMARK_CLASS_IDS = (POLE_ID, TRAFFIC_LIGHT_ID)
+LANDMARK_CLUSTER_SIZE = CELL_SIZE
 
 
 class MCL:
@@ -68,19 +97,21 @@ class MCL:
 
     def predictMotion(self, particles, u, std, dt, new_heading=None):
         """ move according to control input u (heading rate, speed)
-        with noise Q (std heading change, std velocity)`"""
+        with noise Q (std heading change, std distance), given per
+        MOTION_NOISE_PERIOD and scaled by sqrt(dt / MOTION_NOISE_PERIOD)"""
 
         N = len(particles)
-        # update heading
+        noise_scale = np.sqrt(max(dt, 0.0) / MOTION_NOISE_PERIOD)
 
+        # update heading
         if new_heading is None:
-            particles[:, 2] += u[0] * dt + (randn(N) * std[0])
+            particles[:, 2] += u[0] * dt + (randn(N) * std[0] * noise_scale)
             particles[:, 2] %= 2 * np.pi
         else:
             particles[:, 2] = new_heading
 
         # move in the (noisy) commanded direction
-        dist = (self.previous_speed * dt) + (randn(N) * std[1])
+        dist = (self.previous_speed * dt) + (randn(N) * std[1] * noise_scale)
         particles[:, 0] += np.cos(particles[:, 2]) * dist
         particles[:, 1] += np.sin(particles[:, 2]) * dist
 
@@ -117,122 +148,224 @@ class MCL:
         # mean relatively higher weights.
         weights *= scipy.stats.norm(particle_distances, R).pdf(z[0])
 
-        plt.scatter(particles[:, 0], particles[:, 1], c=weights)
-        plt.show()
+        if debug_plot.isEnabled():
+            plt = debug_plot.getPyplot()
+            plt.scatter(particles[:, 0], particles[:, 1], c=weights)
+            plt.show()
 
         weights += 1.e-300      # avoid round-off to zero
         weights /= sum(weights)  # normalize
 
-    def updateWeights(self, particles, weights, cloud: np.array, grid: np.array, gnss_pose):
+    def updateWeights(self, particles, weights, cloud: np.array, grid: np.array, gnss_pose, field: np.array = None):
         """Update the weights of each particle based on our current observation
         using Sequential Importance Sampling (SIS)
 
         Args:
             particles (np.array): particles to update
             weights (np.array): weights of our particles
-            z (np.array): _description_
-            R (np.array): sensor error standard deviation
-            landmarks (np.array): landmark positions [x,y]
+            cloud (np.array): classified cloud as (N,3) [x, y, class ID]
+            grid (np.array): drivable grid, centered on base_link
+            gnss_pose (np.array): latest GNSS pose [x, y, heading]
+            field (np.array, optional): likelihood field of the grid
+
+        Returns:
+            np.array: Likelihood of each particle
+        """
+        likelihoods = self.getLikelihoods(
+            particles, cloud, grid, gnss_pose, field)
+        self.applyLikelihoods(weights, likelihoods)
+
+        return likelihoods
+
+    def getLikelihoods(self, particles, cloud: np.array, grid: np.array, gnss_pose, field: np.array = None) -> np.array:
+        """Score each particle against our current observation.
+
+        This is the expensive part of the update. It leaves the filter's
+        particles and weights alone, so it can score a copy of the particles
+        while prediction carries on (see MCLNode's pipeline mode).
+
+        Args:
+            particles (np.array): particles to score
+            cloud (np.array): classified cloud as (N,3) [x, y, class ID]
+            grid (np.array): drivable grid, centered on base_link
+            gnss_pose (np.array): latest GNSS pose [x, y, heading]
+            field (np.array, optional): likelihood field of the grid
+                (see likelihood_field.py), used for road points. If None,
+                road points only score when they land exactly on a drivable
+                cell. Landmarks are always penalized by the unsmoothed grid.
+
+        Returns:
+            np.array: Non-negative likelihood of each particle
         """
+        scoring_start = time.perf_counter()
+
+        # Landmarks beside the road must not be penalized as if they were in it,
+        # so their penalty comes from the drivable cells themselves
+        drivable_field = getLikelihoodField(grid, CELL_SIZE, sigma=0.0)
+        if field is None:
+            field = drivable_field
 
         # Crop cloud to nearby
         nearby_cloud = cloud[np.linalg.norm(cloud[:, 0:2], axis=1) < 14]
 
-        # Transform cloud to grid
-        # 1. Translate to grid origin
-        cloud_on_grid = np.copy(nearby_cloud)
+        scored_cloud, counts = self.getScoredPoints(nearby_cloud)
+        alignments = self.getAlignments(
+            particles, scored_cloud, field, counts, drivable_field)
 
-        cloud_on_grid[:, 0:2] -= GRID_ORIGIN_METERS
-        # 2. Scale to cell size
-        cloud_on_grid[:, 0:2] /= CELL_SIZE
+        if debug_plot.isEnabled():
+            self.plotAlignments(particles, grid, alignments)
 
-        alignments = []
+        # Alignments can be negative due to landmark penalties
+        likelihoods = np.clip(alignments, 0., None)
 
-        plt.imshow(grid, origin='lower')
-        # plt.scatter(cloud_on_grid[:, 0], cloud_on_grid[:, 1], c='red', s=1.0)
+        # Kill off particles further than 5m from GNSS
+        gnss_distances = np.linalg.norm(
+            particles[:, 0:2] - gnss_pose[0:2], axis=1)
+        likelihoods[gnss_distances > MAX_GNSS_DISTANCE] = 0.
 
-        particles_on_grid = []
+        self.scoring_time = time.perf_counter() - scoring_start
+        self.stage_times['weight'] = self.scoring_time
+        return likelihoods
 
-        for particle in particles:
-            # particle_on_grid = np.copy(particle)
+    def applyLikelihoods(self, weights: np.array, likelihoods: np.array):
+        weights *= likelihoods
+        weights += 1.e-300      # avoid round-off to zero
+        weights /= np.sum(weights)  # normalize
 
-            # Transform particle to grid s.t. x/y are grid indices
-            particle_on_grid = particle - self.mu
-            particle_on_grid[0:2] -= GRID_ORIGIN_METERS
-            particle_on_grid[0:2] /= CELL_SIZE
-            particle_on_grid = particle_on_grid.astype(int)
+    def getScoredPoints(self, cloud: np.array) -> tuple:
+        """Collapse each pole and traffic light into one point per cell.
 
-            # Rotate cloud to particle frame
+        Road points are kept as-is. A traffic light can return hundreds of
+        hits, which would otherwise each be scored for every particle.
 
-            cloud_on_particle = np.copy(cloud_on_grid)
-            cloud_on_particle[:, 0:2] += GRID_ORIGIN_METERS/CELL_SIZE
-            d_theta = particle_on_grid[2]
-            r = np.array([[np.cos(d_theta), -1*np.sin(d_theta)],
-                          [np.sin(d_theta), np.cos(d_theta)]])
-            cloud_on_particle[:, 0:2] = np.dot(
-                cloud_on_particle[:, 0:2], r.T)  # Apply rotation matrix
-            # cloud_on_grid[:, 0:2] -= GRID_ORIGIN_METERS/CELL_SIZE
-
-            # Translate cloud to complete transform
-            cloud_on_particle[:, 0:2] += particle_on_grid[0:2]
-            cloud_on_particle = cloud_on_particle.astype(int)
-
-            hits = 0
-            good_points = []
-            bad_points = []
-            for pt in cloud_on_particle:
-                if pt[0] >= grid.shape[0] or pt[1] >= grid.shape[1] or pt[0] < 0 or pt[1] < 0:
-                    continue
-                if grid[pt[1]][pt[0]] == 100 and pt[2] == ROAD_ID:
-                    hits += 1
-                    good_points.append(pt)
-                elif grid[pt[1]][pt[0]] == 100 and (pt[2] == POLE_ID or pt[2] == TRAFFIC_LIGHT_ID):
-                    # Pole and traffic light misalignment penalty
-                    # Poles and traffic lights should not fall into roads, so penalize particles that present this
-                    hits -= 5
-                else:
-                    bad_points.append(pt)
-            alignments.append(hits / len(cloud_on_particle))
-
-            bad_points = np.array(bad_points)
-            good_points = np.array(good_points)
-            # plt.scatter(particle_on_grid[0], particle_on_grid[1], c='blue')
-            # # # print(cloud_on_particle)
-
-            particles_on_grid.append(particle_on_grid)
-
-            if not DO_PLOT_ALIGNMENT:
-                continue  # Skip to next loop if plotting not enabled
-
-            if len(bad_points) > 1:
-                plt.scatter(bad_points[:, 0],
-                            bad_points[:, 1], s=1.0, c='red')
-            if len(good_points) > 1:
-                plt.scatter(good_points[:, 0],
-                            good_points[:, 1], s=1.0, c='green')
-
-        particles_on_grid = np.array(particles_on_grid)
-
-        if DO_PLOT_ALIGNMENT:
-            print(np.max(alignments) / len(cloud))
-            plt.scatter(particles_on_grid[:, 0],
-                        particles_on_grid[:, 1], c=alignments)
-
-            plt.colorbar()
-            plt.show()
+        Args:
+            cloud (np.array): (N,3) cloud [x, y, class ID], in base_link
 
-        # alignments = np.array(alignments) / len(particles)
+        Returns:
+            tuple: (cloud, counts), where counts is the number of original
+                points that each row of the new cloud stands for
+        """
+        road_cloud = cloud[cloud[:, 2] == ROAD_ID]
+        clouds = [road_cloud]
+        counts = [np.ones(len(road_cloud), dtype=int)]
+
+        for class_id in LANDMARK_CLASS_IDS:
+            centroids, landmark_counts = extractLandmarks(
+                cloud, class_id, LANDMARK_CLUSTER_SIZE)
+            clouds.append(np.column_stack(
+                (centroids, np.full(len(centroids), class_id))))
+            counts.append(landmark_counts)
+
+        return np.vstack(clouds), np.concatenate(counts)
+
+    def getAlignments(self, particles: np.array, cloud: np.array, field: np.array, counts: np.array = None,
+                      landmark_field: np.array = None) -> np.array:
+        """Score how well the cloud lines up with the grid from each particle's pose.
+
+        All particles are scored at once. The cloud is transformed into an
+        (N_particles, N_points, 2) tensor of grid indices, which is used for
+        a single gather from the likelihood fields. A road point adds its
+        cell's likelihood, while a pole or traffic light point subtracts 5x
+        its cell's value in landmark_field, since these should not fall into
+        roads. Points outside of the grid score 0.
 
-        # # if np.max(alignments) > 0.5:
-        # #     weights *= alignments
-        # # else:
-        # #     print(f"Max alignment was only {np.max(alignments)}")
-        # weights *= alignments
+        Args:
+            particles (np.array): (N,3) particles [x, y, heading]
+            cloud (np.array): (M,3) cloud [x, y, class ID], in base_link
+            field (np.array): likelihood field, indexed as field[y][x]
+            counts (np.array, optional): (M,) number of lidar points that each
+                row of the cloud stands for (see getScoredPoints). Defaults to 1 each.
+            landmark_field (np.array, optional): field for pole and traffic light
+                points, shaped like field. This should be the unsmoothed, 0/1
+                drivable grid, so that landmarks right beside the road are not
+                penalized. Defaults to field.
 
-        weights += 1.e-300      # avoid round-off to zero
-        weights /= sum(weights)  # normalize
+        Returns:
+            np.array: (N,) hits divided by the total of counts, i.e. the number
+                of lidar points that the cloud's rows stand for (the road points
+                plus the points in each landmark cluster). Without counts, this is
+                the number of rows in the cloud.
+        """
+        if len(cloud) == 0:
+            return np.zeros(len(particles))
+
+        if counts is None:
+            counts = np.ones(len(cloud))
+
+        # Particles relative to our last estimate, in (truncated) grid cells
+        particles_on_grid = particles - self.mu
+        particles_on_grid[:, 0:2] -= GRID_ORIGIN_METERS
+        particles_on_grid[:, 0:2] /= CELL_SIZE
+        particles_on_grid = particles_on_grid.astype(int)
+
+        # Cloud in cells relative to base_link. Going through the grid origin
+        # rounds slightly differently than cloud / CELL_SIZE, which changes
+        # which cell some points are truncated into, so keep it.
+        cloud_on_grid = (cloud[:, 0:2] - GRID_ORIGIN_METERS) / CELL_SIZE
+        cloud_on_grid += GRID_ORIGIN_METERS/CELL_SIZE
+
+        # Headings were truncated to whole radians, so there are only a few
+        # distinct rotations. Rotate the cloud once per heading.
+        headings, heading_indices = np.unique(
+            particles_on_grid[:, 2], return_inverse=True)
+        rotated_clouds = np.empty((len(headings),) + cloud_on_grid.shape)
+        for i, d_theta in enumerate(headings):
+            r = np.array([[np.cos(d_theta), -1*np.sin(d_theta)],
+                          [np.sin(d_theta), np.cos(d_theta)]])
+            rotated_clouds[i] = np.dot(cloud_on_grid, r.T)
+
+        is_road = cloud[:, 2] == ROAD_ID
+        is_landmark = np.logical_or(
+            cloud[:, 2] == POLE_ID, cloud[:, 2] == TRAFFIC_LIGHT_ID)
+        if landmark_field is None:
+            landmark_field = field
+
+        # Both fields in one array, so that each point is still a single lookup.
+        # Landmark points index into the second half.
+        likelihoods = np.concatenate((field.ravel(), landmark_field.ravel()))
+        point_offsets = np.where(is_landmark, field.size, 0)
+
+        # Each point's contribution per unit of likelihood
+        point_weights = np.zeros(len(cloud))
+        point_weights[is_road] = counts[is_road]
+        point_weights[is_landmark] = -5 * counts[is_landmark]
+
+        hits = np.empty(len(particles))
+
+        # Score in chunks of particles to bound the size of the index tensor
+        chunk_size = max(1, MAX_SCORED_POINTS // len(cloud))
+        for start in range(0, len(particles), chunk_size):
+            stop = start + chunk_size
+
+            # (particles, points, 2) tensor of grid indices
+            indices = rotated_clouds[heading_indices[start:stop]]
+            indices += particles_on_grid[start:stop, np.newaxis, 0:2]
+            indices = indices.astype(int)
+            x = indices[:, :, 0]
+            y = indices[:, :, 1]
+
+            on_grid = (x >= 0) & (x < field.shape[1]) & (y >= 0) & (y < field.shape[0])
+            cells = np.where(on_grid, y * field.shape[1] + x + point_offsets, 0)
+            scores = likelihoods[cells]
+            scores[~on_grid] = 0.0
+
+            hits[start:stop] = scores @ point_weights
+
+        return hits / np.sum(counts)
+
+    def plotAlignments(self, particles: np.array, grid: np.array, alignments: np.array):
+        particles_on_grid = particles - self.mu
+        particles_on_grid[:, 0:2] -= GRID_ORIGIN_METERS
+        particles_on_grid[:, 0:2] /= CELL_SIZE
+        particles_on_grid = particles_on_grid.astype(int)
+
+        plt = debug_plot.getPyplot()
+        plt.imshow(grid, origin='lower')
+        plt.scatter(particles_on_grid[:, 0],
+                    particles_on_grid[:, 1], c=alignments)
 
-        return alignments
+        plt.colorbar()
+        plt.show()
 
     def estimate(self, particles: np.array, weights) -> tuple:
         """Return mean and variance of particles
@@ -249,22 +382,11 @@ class MCL:
         var = np.average((particles - mean)**2, weights=weights, axis=0)
         return mean, var
 
-    def simple_resample(particles: np.array, weights: np.array) -> None:
-        N = len(particles)
-        cumulative_sum = np.cumsum(weights)
-        cumulative_sum[-1] = 1.  # avoid round-off error
-        indexes = np.searchsorted(cumulative_sum, random(N))
-
-        # resample according to indexes
-        particles[:] = particles[indexes]
-        weights.fill(1.0 / N)
-
     def neff(self, weights: np.array) -> float:
         return 1. / np.sum(np.square(weights))
 
     def resample_from_index(self, particles: np.array, weights, indexes) -> None:
         particles[:] = particles[indexes]
-        weights.resize(len(particles))
         weights.fill(1.0 / len(weights))
 
     def create_uniform_particles(self, x_range, y_range, hdg_range, N: int) -> np.array:
@@ -275,7 +397,36 @@ class MCL:
         particles[:, 2] %= 2 * np.pi
         return particles
 
-    def __init__(self, clock, grid_resolution: float, initial_pose=np.array([0.0, 0.0, 0.0]), map_origin=np.array([0.0, 0.0]), N=30):
+    def __init__(self, clock, grid_resolution: float, initial_pose=np.array([0.0, 0.0, 0.0]), map_origin=np.array([0.0, 0.0]), N=30, min_N=None, max_N=None, kld_epsilon=0.05, resampler='systematic', resample_threshold=0.5):
+        """Create the filter.
+
+        The particle count adapts between min_N and max_N using KLD-sampling
+        (see kld_sampling.py). By default, both are N, so the count is fixed.
+
+        Args:
+            clock (float): Current time in seconds
+            grid_resolution (float): Grid cell size in meters
+            initial_pose (np.array, optional): [x, y, heading]. Defaults to the origin.
+            map_origin (np.array, optional): [x, y]. Defaults to the origin.
+            N (int, optional): Initial number of particles. Defaults to 30.
+            min_N (int, optional): Fewest particles to keep. Defaults to N.
+            max_N (int, optional): Most particles to keep. Defaults to N.
+            kld_epsilon (float, optional): KLD-sampling error bound.
+                Smaller values use more particles. Defaults to 0.05.
+            resampler (str, optional): Resampling scheme (see resampling.py).
+                Defaults to 'systematic'.
+            resample_threshold (float, optional): Resample once the effective
+                number of particles falls below this fraction of N. Defaults to 0.5.
+        """
+        self.resampler = getResampler(resampler)
+        self.resample_threshold = resample_threshold
+        self.min_N = N if min_N is None else min_N
+        self.max_N = N if max_N is None else max_N
+        self.kld_epsilon = kld_epsilon
+        self.scoring_time = 0.0  # seconds spent in updateWeights last step
+        # Seconds spent in each stage of the last step
+        self.stage_times = dict.fromkeys(STAGES, 0.0)
+
         self.particles = self.create_gaussian_particles(
             mean=initial_pose, std=(2, 2, np.pi/8), N=N)
 
@@ -286,10 +437,11 @@ class MCL:
         self.map_origin = map_origin
         self.grid_resolution = grid_resolution
 
-        self.mus = []
-        self.gnss_poses = []
+        self.mus = RingBuffer(HISTORY_SIZE, shape=(3,))
+        self.gnss_poses = RingBuffer(HISTORY_SIZE, shape=(3,))
         self.last_update_time = clock
         self.previous_speed = 0.0
+        self.disagreements = 0  # Consecutive corrections that disagreed with GNSS
 
     def reset(self, initial_pose, N):
         self.particles = self.create_gaussian_particles(
@@ -297,6 +449,72 @@ class MCL:
 
         self.weights = np.ones(N) / N
 
+    def resize(self, N: int, pose: np.array = None):
+        """Grow or shrink the particle set to N particles.
+
+        Shrinking keeps a random subset. Growing adds jittered copies of
+        random particles, which inherit their weights, or, if a pose is given,
+        particles spread around it as in reset(), with the average weight.
+        Weights are then renormalized.
+
+        Args:
+            N (int): New particle count
+            pose (np.array, optional): [x, y, heading] to spread new particles around
+        """
+        current_N = len(self.particles)
+
+        if N == current_N:
+            return
+
+        if N < current_N:
+            kept = np.random.choice(current_N, N, replace=False)
+            self.particles = self.particles[kept]
+            self.weights = self.weights[kept]
+        else:
+            if pose is None:
+                sources = np.random.randint(current_N, size=N - current_N)
+                new_particles = self.particles[sources]
+                new_particles[:, 0:2] += randn(N - current_N,
+                                               2) * ROUGHENING_STD
+                new_weights = self.weights[sources]
+            else:
+                new_particles = self.create_gaussian_particles(
+                    mean=pose, std=(2, 2, np.pi/8), N=N - current_N)
+                new_weights = np.full(N - current_N, 1. / current_N)
+
+            self.particles = np.vstack((self.particles, new_particles))
+            self.weights = np.concatenate((self.weights, new_weights))
+
+        self.weights /= np.sum(self.weights)
+
+    def adaptParticleCount(self, gnss_difference: float, gnss_pose: np.array):
+        """Resize the particle set for the current uncertainty.
+
+        Once the estimate has disagreed with GNSS for DISAGREEMENT_PERSISTENCE
+        corrections in a row, we double the particle count (up to max_N) on
+        each correction that still disagrees, adding particles around the
+        GNSS pose. Otherwise, KLD-sampling picks the count from the
+        particles' spread.
+
+        Args:
+            gnss_difference (float): Distance between our estimate and GNSS
+            gnss_pose (np.array): latest GNSS pose [x, y, heading]
+        """
+        if self.min_N == self.max_N:
+            return
+
+        if gnss_difference > DISAGREEMENT_DISTANCE:
+            self.disagreements += 1
+        else:
+            self.disagreements = 0
+
+        if self.disagreements >= DISAGREEMENT_PERSISTENCE:
+            self.resize(min(2 * len(self.particles), self.max_N), gnss_pose)
+            return
+
+        self.resize(getKLDParticleCount(
+            self.particles, self.min_N, self.max_N, self.kld_epsilon))
+
     def addNoise(self, particles, std, N):
         threshold = 1/N
 
@@ -313,31 +531,11 @@ class MCL:
 
         MAX_LANDMARK_DIST = 10.0  # meters
 
-        traffic_light_pts = cloud[cloud[:, 2] == TRAFFIC_LIGHT_ID][:, 0:2]
-
-        # Filter out faraway pts
-        traffic_light_pts = traffic_light_pts[np.linalg.norm(
-            traffic_light_pts, axis=1) < MAX_LANDMARK_DIST]
-
-        downsampled_pts = []
-
-        # Only include points not super close to other ones
-        MIN_DISTANCE = 1.0  # Points closer than this will be simplified to one pt
-        for pt_a in traffic_light_pts:
-            too_close = False
-            for pt_b in downsampled_pts:
-                if np.linalg.norm(pt_a - pt_b) < MIN_DISTANCE:
-                    too_close = True
-                    break
-            if not too_close:
-                downsampled_pts.append(pt_a)
-
-        downsampled_pts = np.array(downsampled_pts)
+        # Points closer than this will be simplified to one pt
+        MIN_DISTANCE = 1.0
 
-        print("Traffic light points:")
-        print(downsampled_pts)
-
-        downsampled_pts = downsampled_pts.reshape((-1, 2))
+        downsampled_pts, _ = extractLandmarks(
+            cloud, TRAFFIC_LIGHT_ID, MIN_DISTANCE, MAX_LANDMARK_DIST)
 
         distances = np.linalg.norm(
             downsampled_pts, axis=1) + randn(downsampled_pts.shape[0]) * noise
@@ -353,7 +551,6 @@ class MCL:
         if landmarks_on_grid.shape[0] == 0:
             return landmarks_on_grid  # If empty, send it out
 
-        print(landmarks_on_grid)
         # landmarks_on_grid = landmarks_on_grid[landmarks_on_grid[:, 0] > 70]
         # landmarks_on_grid = landmarks_on_grid[landmarks_on_grid[:, 0] < 85]
         # landmarks_on_grid = landmarks_on_grid[landmarks_on_grid[:, 1] < 70]
@@ -372,118 +569,124 @@ class MCL:
         # Now translate
         landmarks_on_map += mu[0:2]
 
-        print(landmarks_on_map)
-
         # plt.scatter(landmarks_on_map[:, 0], landmarks_on_map[:, 1])
         # plt.scatter(mu[0], mu[1], c='r')
         # plt.show()
 
         return landmarks_on_map
 
-    def resample(self, particles, alignments, gnss_pose):
-
-        alignments = np.array(alignments).reshape((-1, 1))
-
-        # Kill off particles further than 5m from GNSS
-        dists = gnss_difference = np.linalg.norm(
-            particles[:, 0:2] - gnss_pose[0:2], axis=1)
-        alignments[dists > 5] = 0.
-
-        # Form a combined particle-alignment array
-        combined_array = np.hstack((particles, alignments))
-        # Sort by third column (alignments)
-        combined_array = combined_array[combined_array[:, 3].argsort()]
+    def resample(self) -> bool:
+        """Resample the particles once too few of them carry most of the weight,
+        i.e. once neff() falls below resample_threshold * N.
 
-        # Determine the number of particles to be replaced
-        replacement_qty = int(len(particles)/10)
-
-        # Perform replacement
-        print(f"Replacing bottom {replacement_qty} particles")
-        combined_array[0:replacement_qty] = combined_array[-
-                                                           1*replacement_qty-1:-1]
+        Returns:
+            bool: True if the particles were resampled
+        """
+        N = len(self.particles)
+        if self.neff(self.weights) >= self.resample_threshold * N:
+            return False
 
-        # Add a little noise
-        print(randn(replacement_qty).T)
-        print(combined_array[0: replacement_qty, 0])
-        combined_array[0: replacement_qty,
-                       0] += randn(replacement_qty).T * 0.1
-        combined_array[0: replacement_qty,
-                       1] += randn(replacement_qty).T * 0.1
+        indexes = self.resampler(self.weights)
+        self.resample_from_index(self.particles, self.weights, indexes)
 
-        print(combined_array)
+        # Add a little noise, so that copies of a particle spread out
+        self.particles[:, 0:2] += randn(N, 2) * ROUGHENING_STD
 
-        # Return only the particles, not the alignments
-        return combined_array[:, 0: 3]
+        return True
 
-    def step(self, u, clock, cloud: np.array, gnss_pose: np.array, grid: np.array) -> tuple:
+    def step(self, u, clock, cloud: np.array, gnss_pose: np.array, grid: np.array, field: np.array = None) -> tuple:
         """Takes new data, runs it through the filter, and generates a result pose.
 
         ✅ 1. Predict the motion of all particles using the latest speedometer and angular velocity data.
         ✅ 2. Assign a likelihood score to each particle using the latest classified cloud and grid.
-        ❌ 3. Select and replace the bottom X percent of particles with copies of the top X percent
+        ✅ 3. Resample the particles once their weights have degenerated (see resampling.py)
         ✅ 4. Take the weighted mean and covariance of the particles, return them
         ✅ 5. Repeat 1-4.
 
+        The optional likelihood field of the grid is used for scoring (see updateWeights).
+        Prediction and correction can also be run separately; see predict() and correct().
+
         Returns:
             (mean, covariance)
         """
 
-        self.predictMotion(self.particles, u, std=[
-                           0.3, 0.05], dt=clock - self.last_update_time, new_heading=gnss_pose[2])
+        self.predict(u, clock, new_heading=gnss_pose[2])
+
+        likelihoods = self.getLikelihoods(
+            self.particles, cloud, grid, gnss_pose, field)
+
+        return self.correct(likelihoods, gnss_pose)
+
+    def predict(self, u, clock, new_heading=None):
+        """Move the particles according to our odometry since the last prediction.
+
+        Args:
+            u (list): [heading rate, speed]
+            clock (float): Current time in seconds
+            new_heading (float, optional): Heading to give every particle,
+                e.g. from GNSS. Defaults to None (integrate the heading rate).
+        """
+        predict_start = time.perf_counter()
+        self.predictMotion(self.particles, u, std=MOTION_NOISE_STD,
+                           dt=clock - self.last_update_time, new_heading=new_heading)
         self.last_update_time = clock
+        self.stage_times['predict'] = time.perf_counter() - predict_start
+
+    def markStage(self, stage: str, start: float, accumulate: bool = False) -> float:
+        """Record the time since start in stage_times.
+
+        Args:
+            stage (str): One of STAGES
+            start (float): time.perf_counter() when the stage began
+            accumulate (bool, optional): Add to the stage's time instead of replacing it
+
+        Returns:
+            float: time.perf_counter() now, i.e. the start of the next stage
+        """
+        now = time.perf_counter()
+        if accumulate:
+            self.stage_times[stage] += now - start
+        else:
+            self.stage_times[stage] = now - start
+
+        return now
+
+    def correct(self, likelihoods: np.array, gnss_pose: np.array) -> tuple:
+        """Weight the particles by their likelihoods, resample, and update our estimate.
+
+        Args:
+            likelihoods (np.array): From getLikelihoods(), one per particle
+            gnss_pose (np.array): latest GNSS pose [x, y, heading]
 
-        alignments = self.updateWeights(self.particles, self.weights,
-                                        cloud, grid, gnss_pose)
+        Returns:
+            (mean, covariance)
+        """
+        stage_start = time.perf_counter()
+        self.applyLikelihoods(self.weights, likelihoods)
+        stage_start = self.markStage('weight', stage_start, accumulate=True)
 
-        self.particles = self.resample(self.particles, alignments, gnss_pose)
+        self.resample()
+        stage_start = self.markStage('resample', stage_start)
 
         mu, var = self.estimate(self.particles, self.weights)
+        stage_start = self.markStage('estimate', stage_start)
 
         gnss_difference = np.linalg.norm(mu - gnss_pose)
-        if gnss_difference > 3:
+        if gnss_difference > KIDNAPPED_DISTANCE:
             print("KIDNAPPED! Reseting.")
-            self.reset(gnss_pose, N=len(self.particles))
+            # We have no idea where we are, so use as many particles as we can
+            self.reset(gnss_pose, N=self.max_N)
+        else:
+            self.adaptParticleCount(gnss_difference, gnss_pose)
 
         self.mu = mu
 
-        self.mus.append(mu)
-        self.gnss_poses.append(gnss_pose)
+        self.mus.push(mu)
+        self.gnss_poses.push(gnss_pose)
+        self.markStage('adapt', stage_start)
 
-        # plt.plot(self.mus)
-        # plt.plot(self.gnss_poses)
+        # plt.plot(self.mus.toArray())
+        # plt.plot(self.gnss_poses.toArray())
         # plt.show()
 
         return mu, var
-
-    # From Roger Labbe's filterpy
-    # https://github.com/rlabbe/filterpy/blob/master/filterpy/monte_carlo/resampling.py
-    def systematic_resample(self, weights: np.array) -> np.array:
-        """ Performs the systemic resampling algorithm used by particle filters.
-        This algorithm separates the sample space into N divisions. A single random
-        offset is used to to choose where to sample from for all divisions. This
-        guarantees that every sample is exactly 1/N apart.
-        Parameters
-        ----------
-        weights : list-like of float
-            list of weights as floats
-        Returns
-        -------
-        indexes : ndarray of ints
-            array of indexes into the weights defining the resample. i.e. the
-            index of the zeroth resample is indexes[0], etc.
-        """
-        N = len(weights)
-
-        # make N subdivisions, and choose positions with a consistent random offset
-        positions = (random() + np.arange(N)) / N
-
-        indexes = np.zeros(N, 'i')
-        cumulative_sum = np.cumsum(weights)
-        i, j = 0, 0
-        while i < N:
-            if positions[i] < cumulative_sum[j]:
-                indexes[i] = j
-                i += 1
-            else:
-                j += 1
-        return indexes
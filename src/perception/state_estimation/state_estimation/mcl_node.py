@@ -13,9 +13,27 @@ Subscribes to:
 Reads:
 - .pcd map file from disk
 
+Parameters:
+- pipeline (bool): If True, predict at IMU rate and broadcast the predicted pose,
+    while correcting with the latest cloud on a worker thread. Clouds that
+    arrive during a correction replace any waiting cloud rather than queueing.
+- likelihood_sigma (float): Falloff of the likelihood field used to score
+    particles, in meters. 0.0 scores exact drivable cell hits only.
+- min_particles, max_particles (int): Bounds on the adaptive particle count
+- kld_epsilon (float): KLD-sampling error bound. Smaller values use more particles.
+- resampling_scheme (str): systematic, stratified, residual or multinomial
+- resample_threshold (float): Resample once the effective number of particles
+    falls below this fraction of the particle count
+- debug_plots (bool): Show the filter's matplotlib debug plots. These block,
+    so leave this off outside of debugging.
+- record_path (str): If set, record the filter's inputs for each cloud
+    (see replay.py) and save them here on shutdown, as a .npz file or a
+    directory. Empty (off) by default.
+
 Publishes:
 - MCL result (geometry_msgs/PoseWithCovarianceStamped)
     - Minimum frequency: 2 Hz
+- Diagnostic status, incl. particle count and per-stage latency (DiagnosticStatus)
 '''
 
 import math
@@ -23,11 +41,13 @@ import numpy as np
 import rclpy
 import ros2_numpy as rnp
 import struct
+import threading
 import time
 
 # Message definitions
 from carla_msgs.msg import CarlaSpeedometer
-from geometry_msgs.msg import TransformStamped
+from diagnostic_msgs.msg import DiagnosticStatus, KeyValue
+from geometry_msgs.msg import PoseStamped, TransformStamped
 from nav_msgs.msg import OccupancyGrid, Odometry
 from nova_msgs.srv import GetLandmarks
 from rclpy.node import Node
@@ -35,9 +55,10 @@ from rosgraph_msgs.msg import Clock
 from sensor_msgs.msg import Imu, PointCloud2
 from tf2_ros import TransformBroadcaster
 
-from .mcl import MCL
-
-import matplotlib.pyplot as plt
+from .likelihood_field import LikelihoodField
+from .mcl import MCL, CELL_SIZE, ROAD_ID, POLE_ID, TRAFFIC_LIGHT_ID
+from .replay import Recording
+from vt_viz import debug_plot
 
 
 class MCLNode(Node):
@@ -52,14 +73,44 @@ class MCLNode(Node):
         self.last_update_time = time.time()
         self.old_gnss_pose = None
         self.grid: np.array = None
+        self.likelihood_field: np.array = None
         self.imu = None
         self.speed: float = 0.0  # m/s
 
+        # Built once per new grid in map_cb, then reused by every cloud_cb
+        self.field_cache = LikelihoodField(
+            CELL_SIZE, self.declare_parameter('likelihood_sigma', 0.5).value)
+
+        self.min_particles = self.declare_parameter('min_particles', 50).value
+        self.max_particles = self.declare_parameter(
+            'max_particles', 2000).value
+        self.kld_epsilon = self.declare_parameter('kld_epsilon', 0.05).value
+        self.resampling_scheme = self.declare_parameter(
+            'resampling_scheme', 'systematic').value
+        self.resample_threshold = self.declare_parameter(
+            'resample_threshold', 0.5).value
+
+        debug_plot.enable(self.declare_parameter('debug_plots', False).value)
+
+        self.pipeline = self.declare_parameter('pipeline', False).value
+        self.filter_lock = threading.Lock()  # Guards the filter in pipeline mode
+        self.cloud_lock = threading.Lock()
+        self.cloud_ready = threading.Event()
+        self.latest_cloud: PointCloud2 = None  # Waiting for the correction thread
+        self.dropped_clouds = 0
+        self.latencies = {'predict': 0.0, 'correct': 0.0}  # seconds
+
+        # Inputs for replay.py, recorded once per cloud
+        self.record_path = self.declare_parameter('record_path', '').value
+        self.recording = Recording() if self.record_path else None
+        self.true_pose = np.full(3, np.nan)  # Unknown until /true_pose arrives
+
         self.clock_sub = self.create_subscription(
             Clock, '/clock', self.clock_cb, 10)
 
+        # In pipeline mode, stale clouds are dropped rather than queued
         self.cloud_sub = self.create_subscription(
-            PointCloud2, '/lidar/semantic', self.cloud_cb, 10)
+            PointCloud2, '/lidar/semantic', self.cloud_cb, 1 if self.pipeline else 10)
 
         self.gnss_sub = self.create_subscription(
             Odometry, '/odometry/gnss_processed', self.gnss_cb, 10)
@@ -73,8 +124,15 @@ class MCLNode(Node):
         self.speed_sub = self.create_subscription(
             CarlaSpeedometer, '/carla/hero/speedometer', self.speed_cb, 1)
 
+        if self.recording is not None:
+            self.true_pose_sub = self.create_subscription(
+                PoseStamped, '/true_pose', self.true_pose_cb, 10)
+
         self.particle_cloud_pub = self.create_publisher(
             PointCloud2, '/mcl/particles', 10)
+
+        self.status_pub = self.create_publisher(
+            DiagnosticStatus, '/node_statuses', 1)
         # landmark_request = GetLandmarks.Request()
         # self.get_logger().info("Sending request")
         # self.landmarks: GetLandmarks.Response = self.landmark_client.call(
@@ -94,15 +152,50 @@ class MCLNode(Node):
 
         self.tf_broadcaster = TransformBroadcaster(self)
 
+        self.running = True
+        if self.pipeline:
+            self.correction_thread = threading.Thread(
+                target=self.correctionLoop, daemon=True)
+            self.correction_thread.start()
+
+    def destroy_node(self):
+        self.running = False
+        if self.pipeline:
+            self.cloud_ready.set()
+            self.correction_thread.join()
+
+        if self.recording is not None and len(self.recording) > 0:
+            self.recording.save(self.record_path)
+            self.get_logger().info(
+                f"Saved {len(self.recording)} frames to {self.record_path}")
+
+        super().destroy_node()
+
     def clock_cb(self, msg: Clock):
         self.clock = msg
 
     def imu_cb(self, msg: Imu):
         self.imu = msg
 
+        if self.pipeline:
+            self.predictAndBroadcast()
+
     def speed_cb(self, msg: CarlaSpeedometer):
         self.speed = msg.speed
 
+    def true_pose_cb(self, msg: PoseStamped):
+        # /true_pose carries no orientation, so the true heading stays unknown
+        self.true_pose = np.array(
+            [msg.pose.position.x, msg.pose.position.y, np.nan])
+
+    def recordFrame(self, cloud: np.array, gnss_pose: np.array, grid: np.array):
+        """Add the filter's inputs for this cloud to our recording, if we're recording"""
+        if self.recording is None:
+            return
+
+        self.recording.append(self.getClockSeconds(), self.speed, self.imu.angular_velocity.z,
+                              cloud, gnss_pose, grid, self.true_pose)
+
     def getMotionDelta(self, current_gnss_pose, old_gnss_pose, speed: float, dt):
 
         # Start by calculating heading change
@@ -137,8 +230,32 @@ class MCLNode(Node):
         msg.header.frame_id = 'map'
         self.particle_cloud_pub.publish(msg)
 
+    def publishStatus(self):
+        """Report the filter's particle count and the latency of each stage"""
+        status = DiagnosticStatus()
+        status.name = self.get_name()
+        status.level = DiagnosticStatus.OK
+
+        values = {
+            'stamp': str(self.getClockSeconds()),
+            'particles': str(len(self.filter.particles)),
+            'scoring_time': f"{self.filter.scoring_time:.4f}",
+            'predict_latency': f"{self.latencies['predict']:.4f}",
+            'correct_latency': f"{self.latencies['correct']:.4f}",
+            'dropped_clouds': str(self.dropped_clouds)
+        }
+
+        for key, value in values.items():
+            kv = KeyValue()
+            kv.key = key
+            kv.value = value
+            status.values.append(kv)
+
+        self.status_pub.publish(status)
+
     def cloud_cb(self, msg: PointCloud2):
-        """Update our filter with the latest observations and publish the result
+        """Update our filter with the latest observations and publish the result.
+        In pipeline mode, the cloud is handed to the correction thread instead.
 
         Args:
             msg (PointCloud2): Our latest observations from e.g. road segmentation
@@ -148,58 +265,141 @@ class MCLNode(Node):
         if self.filter is None or self.imu is None:
             return
 
+        if self.pipeline:
+            # Only the latest cloud matters, so one still waiting is stale
+            with self.cloud_lock:
+                if self.latest_cloud is not None:
+                    self.dropped_clouds += 1
+                self.latest_cloud = msg
+                self.cloud_ready.set()
+            return
+
+        start = time.perf_counter()
+
         if self.previous_result is None:
             self.previous_result = np.zeros((3))
 
-        # Change in pose since last filter update
-        dt = time.time() - self.last_update_time
         heading_rate = self.imu.angular_velocity.z
+        cloud = self.formatCloud(msg)
+        self.recordFrame(cloud, self.gnss_pose, self.grid)
 
-        # The filter accepts clouds as a (N,2) array. Format accordingly.
-        cloud_formatted = rnp.numpify(msg)
+        # step() is the critical function that feeds data into the filter
+        # and returns a pose and covariance.
+        result_pose, pose_variance = self.filter.step(
+            [heading_rate, self.speed], self.getClockSeconds(), cloud, self.gnss_pose, self.grid,
+            self.likelihood_field)
+
+        self.last_update_time = time.time()
+        self.publish_particle_cloud()
+        self.broadcastPose(result_pose)
+
+        # Cache our result to calculate the delta later
+        self.previous_result = result_pose
 
-        ROAD_ID = 4286595200
-        TRAFFIC_LIGHT_ID = 4294617630
-        POLE_ID = 4288256409
+        self.latencies['correct'] = time.perf_counter() - start
+        self.publishStatus()
+
+    def formatCloud(self, msg: PointCloud2) -> np.array:
+        """Turn a classified PointCloud2 into the (N,3) [x, y, class ID] array
+        that the filter accepts, keeping only road, pole and traffic light points.
+        """
+        cloud_formatted = rnp.numpify(msg)
 
         cloud_formatted = cloud_formatted[np.logical_or(cloud_formatted['rgb'] == POLE_ID,
                                                         np.logical_or(cloud_formatted['rgb'] == ROAD_ID,
                                                                       cloud_formatted['rgb'] == TRAFFIC_LIGHT_ID))]
 
-        cloud = np.vstack(
+        return np.vstack(
             (cloud_formatted['x'], cloud_formatted['y'], cloud_formatted['rgb'])).T
 
-        # Filter to road points only
+    def predictAndBroadcast(self):
+        """Pipeline mode: move the particles with our latest odometry
+        and broadcast the predicted pose.
+        """
+        if self.filter is None or self.imu is None:
+            return
 
-        # step() is the critical function that feeds data into the filter
-        # and returns a pose and covariance.
+        start = time.perf_counter()
 
-        clock_seconds = self.clock.clock.sec + self.clock.clock.nanosec * 1e-9
+        with self.filter_lock:
+            self.filter.predict([self.imu.angular_velocity.z, self.speed],
+                                self.getClockSeconds(), new_heading=self.gnss_pose[2])
+            predicted_pose, _ = self.filter.estimate(
+                self.filter.particles, self.filter.weights)
 
-        result_pose, pose_variance = self.filter.step(
-            [heading_rate, self.speed], clock_seconds, cloud, self.gnss_pose, self.grid)
+        self.broadcastPose(predicted_pose)
+        self.latencies['predict'] = time.perf_counter() - start
 
-        self.last_update_time = time.time()
-        self.publish_particle_cloud()
+    def correctionLoop(self):
+        """Pipeline mode: correct the filter with each new cloud, on its own thread"""
+        while self.running:
+            if not self.cloud_ready.wait(timeout=0.5):
+                continue
+
+            with self.cloud_lock:
+                msg = self.latest_cloud
+                self.latest_cloud = None
+                self.cloud_ready.clear()
+
+            if msg is None:
+                continue
 
-        # self.get_logger().info(f"Diff: {str(self.gnss_pose-result_pose)}")
+            # An exception would otherwise silently end this thread,
+            # leaving us with prediction alone
+            try:
+                self.correct(msg)
+            except Exception as e:
+                self.get_logger().error(f"Correction failed: {e}")
 
-        # Turn our filter result into a transform
+    def correct(self, msg: PointCloud2):
+        """Pipeline mode: weight, resample and publish using the given cloud.
+
+        Particles are scored outside of the filter lock, so prediction
+        keeps running meanwhile. Prediction only moves particles, so the
+        likelihoods still line up with the filter's particles afterwards.
+
+        Args:
+            msg (PointCloud2): Latest cloud
+        """
+        start = time.perf_counter()
+        cloud = self.formatCloud(msg)
+
+        with self.filter_lock:
+            particles = np.copy(self.filter.particles)
+            gnss_pose = self.gnss_pose
+            grid = self.grid
+            field = self.likelihood_field
+            self.recordFrame(cloud, gnss_pose, grid)
+
+        likelihoods = self.filter.getLikelihoods(
+            particles, cloud, grid, gnss_pose, field)
+
+        with self.filter_lock:
+            result_pose, pose_variance = self.filter.correct(
+                likelihoods, gnss_pose)
+            self.publish_particle_cloud()
+
+        self.broadcastPose(result_pose)
+        self.previous_result = result_pose
+
+        self.latencies['correct'] = time.perf_counter() - start
+        self.publishStatus()
+
+    def broadcastPose(self, pose: np.array):
+        """Broadcast a map->hero transform for the pose [x, y, heading]"""
         t = TransformStamped()
         t.header.frame_id = 'map'
         t.header.stamp = self.clock.clock
         t.child_frame_id = 'hero'
-        t.transform.translation.x = result_pose[0]
-        t.transform.translation.y = result_pose[1]
-        t.transform.rotation.w = math.cos(result_pose[2] / 2)
-        t.transform.rotation.z = math.sin(result_pose[2] / 2)
+        t.transform.translation.x = pose[0]
+        t.transform.translation.y = pose[1]
+        t.transform.rotation.w = math.cos(pose[2] / 2)
+        t.transform.rotation.z = math.sin(pose[2] / 2)
 
-        # Broadcast our transform
         self.tf_broadcaster.sendTransform(t)
-        # self.get_logger().info("BROADCASTING")
 
-        # Cache our gnss_pose to calculate the delta later
-        self.previous_result = result_pose
+    def getClockSeconds(self) -> float:
+        return self.clock.clock.sec + self.clock.clock.nanosec * 1e-9
 
     def gnss_cb(self, msg: Odometry):
         pose_msg = msg.pose.pose
@@ -212,16 +412,11 @@ class MCLNode(Node):
         ])
 
     def map_cb(self, msg: OccupancyGrid):
-        data = np.rot90(np.array(msg.data).reshape(151, 151), k=1, axes=(1, 0))
-        # plt.imshow(data, origin='lower')
-        # print("Showing!")
-        # plt.show()
-
         if self.gnss_pose is None:
             return  # Wait for initial guess from GNSS
 
-        self.grid = np.asarray(msg.data,
-                               dtype=np.int8).reshape(msg.info.height, msg.info.width)
+        self.grid = rnp.occupancy_grid.occupancy_grid_to_array(msg)
+        self.likelihood_field = self.field_cache.update(self.grid)
 
         if self.filter is not None:
             return
@@ -229,9 +424,13 @@ class MCLNode(Node):
         origin = msg.info.origin.position
         res = msg.info.resolution
 
-        clock_seconds = self.clock.clock.sec + self.clock.clock.nanosec * 1e-9
+        clock_seconds = self.getClockSeconds()
+        # Start small. KLD-sampling grows the count while the particles are spread out.
         self.filter = MCL(clock_seconds, res, initial_pose=self.gnss_pose,
-                          map_origin=np.array([origin.x, origin.y]), N=50)
+                          map_origin=np.array([origin.x, origin.y]), N=self.min_particles,
+                          min_N=self.min_particles, max_N=self.max_particles,
+                          kld_epsilon=self.kld_epsilon, resampler=self.resampling_scheme,
+                          resample_threshold=self.resample_threshold)
 
         self.get_logger().info("MCL filter created")
 
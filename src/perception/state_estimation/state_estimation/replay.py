@@ -0,0 +1,223 @@
+'''
+Package: state_estimation
+   File: replay.py
+ Author: Will Heitman (w at heit dot mn)
+
+Offline replay of recorded drives through MCL, without ROS.
+
+A recording holds one frame per cloud: the inputs to MCL.step
+(speed, heading rate, classified cloud, GNSS pose and drivable grid),
+plus the true pose, as published on /true_pose in CARLA. MCLNode records
+real drives when its record_path parameter is set.
+
+Recordings are saved either as a single .npz file, or as a directory
+of .npy files. Directories are memory-mapped when loaded, so even a
+long drive doesn't need to fit in memory.
+
+Arrays in a recording, for T frames:
+- stamps (T,): time of each frame, in seconds
+- speeds (T,), heading_rates (T,): odometry, in m/s and rad/s
+- clouds (M,3): every frame's cloud [x, y, class ID], back to back
+- cloud_offsets (T+1,): frame i's cloud is clouds[cloud_offsets[i]:cloud_offsets[i+1]]
+- gnss_poses (T,3), true_poses (T,3): [x, y, heading] in the map frame.
+  Unknown true poses or headings are NaN, and are left out of summarize().
+- grids (G,H,W): each distinct drivable grid, centered on base_link
+- grid_indexes (T,): frame i's grid is grids[grid_indexes[i]]
+'''
+
+import os
+
+import numpy as np
+
+from .likelihood_field import LikelihoodField
+from .mcl import MCL, CELL_SIZE, STAGES
+
+ARRAY_NAMES = ('stamps', 'speeds', 'heading_rates', 'clouds', 'cloud_offsets',
+               'gnss_poses', 'true_poses', 'grids', 'grid_indexes')
+
+
+class Recording:
+
+    def __init__(self):
+        """An empty recording, to be filled with append() and written with save()"""
+        self.frames = []
+        self.grids = []
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+    def append(self, stamp: float, speed: float, heading_rate: float, cloud: np.ndarray,
+               gnss_pose: np.ndarray, grid: np.ndarray, true_pose: np.ndarray):
+        """Add a frame. Grids that match the previous frame's are stored only once."""
+        if len(self.grids) == 0 or not np.array_equal(grid, self.grids[-1]):
+            self.grids.append(np.copy(grid))
+
+        self.frames.append((stamp, speed, heading_rate, np.asarray(cloud)[:, 0:3],
+                            gnss_pose, true_pose, len(self.grids) - 1))
+
+    def toArrays(self) -> dict:
+        stamps, speeds, heading_rates, clouds, gnss_poses, true_poses, grid_indexes = zip(
+            *self.frames)
+
+        return {
+            'stamps': np.array(stamps, dtype=np.float64),
+            'speeds': np.array(speeds, dtype=np.float64),
+            'heading_rates': np.array(heading_rates, dtype=np.float64),
+            'clouds': np.vstack(clouds).astype(np.float64),
+            'cloud_offsets': np.concatenate(([0], np.cumsum([len(cloud) for cloud in clouds]))),
+            'gnss_poses': np.array(gnss_poses, dtype=np.float64).reshape((-1, 3)),
+            'true_poses': np.array(true_poses, dtype=np.float64).reshape((-1, 3)),
+            'grids': np.stack(self.grids),
+            'grid_indexes': np.array(grid_indexes)
+        }
+
+    def save(self, path: str):
+        """Write the recording.
+
+        Args:
+            path (str): A path ending in .npz writes a single file. Any other
+                path is created as a directory of .npy files, which can be memory-mapped.
+        """
+        arrays = self.toArrays()
+
+        if path.endswith('.npz'):
+            np.savez(path, **arrays)
+            return
+
+        os.makedirs(path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(path, f"{name}.npy"), array)
+
+
+def loadRecording(path: str) -> dict:
+    """Read a recording written by Recording.save().
+
+    Args:
+        path (str): .npz file or directory of .npy files
+
+    Returns:
+        dict: Arrays by name (see ARRAY_NAMES). A directory's arrays are
+            read-only memory maps.
+    """
+    if os.path.isdir(path):
+        return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r')
+                for name in ARRAY_NAMES}
+
+    with np.load(path) as recording:
+        return {name: recording[name] for name in ARRAY_NAMES}
+
+
+def getPoseErrors(estimates: np.ndarray, true_poses: np.ndarray) -> tuple:
+    """Return the position error (meters) and heading error (radians) of each estimate
+
+    Args:
+        estimates (np.ndarray): (T,3) estimated poses [x, y, heading]
+        true_poses (np.ndarray): (T,3) true poses [x, y, heading]
+
+    Returns:
+        tuple: ((T,) position errors, (T,) absolute heading errors, wrapped to [0, pi])
+    """
+    position_errors = np.linalg.norm(
+        estimates[:, 0:2] - true_poses[:, 0:2], axis=1)
+    heading_errors = np.abs(np.angle(
+        np.exp(1j * (estimates[:, 2] - true_poses[:, 2]))))
+
+    return position_errors, heading_errors
+
+
+def replay(recording: dict, likelihood_sigma: float = 0.5, **filter_args) -> dict:
+    """Run every frame of a recording through MCL.step, as fast as possible.
+
+    The filter starts at the first GNSS pose, like MCLNode's.
+
+    Args:
+        recording (dict): From loadRecording()
+        likelihood_sigma (float, optional): See LikelihoodField. Defaults to 0.5.
+        **filter_args: Passed to MCL(), e.g. N, min_N, max_N or resampler
+
+    Returns:
+        dict: 'estimates' (T,3) poses, 'particle_counts' (T,), and
+            'stage_times', the (T,) seconds per frame of each stage in STAGES
+    """
+    stamps = recording['stamps']
+    clouds = recording['clouds']
+    cloud_offsets = recording['cloud_offsets']
+    gnss_poses = recording['gnss_poses']
+    grid_indexes = recording['grid_indexes']
+    T = len(stamps)
+
+    mcl = MCL(float(stamps[0]), CELL_SIZE,
+              initial_pose=np.array(gnss_poses[0]), **filter_args)
+    field_cache = LikelihoodField(CELL_SIZE, likelihood_sigma)
+
+    estimates = np.zeros((T, 3))
+    particle_counts = np.zeros(T, dtype=int)
+    stage_times = {stage: np.zeros(T) for stage in STAGES}
+
+    for i in range(T):
+        grid = np.asarray(recording['grids'][grid_indexes[i]])
+        field = field_cache.update(grid)
+        cloud = np.asarray(clouds[cloud_offsets[i]:cloud_offsets[i+1]])
+        gnss_pose = np.array(gnss_poses[i])
+
+        estimates[i], _ = mcl.step([recording['heading_rates'][i], recording['speeds'][i]],
+                                   float(stamps[i]), cloud, gnss_pose, grid, field)
+
+        particle_counts[i] = len(mcl.particles)
+        for stage in STAGES:
+            stage_times[stage][i] = mcl.stage_times[stage]
+
+    return {
+        'estimates': estimates,
+        'particle_counts': particle_counts,
+        'stage_times': stage_times
+    }
+
+
+def summarize(recording: dict, result: dict) -> str:
+    """Format a replay's per-stage timing and pose error as a table"""
+    lines = [f"{'stage':<10}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}  (ms)"]
+
+    total_times = np.zeros(len(result['estimates']))
+    for stage, times in result['stage_times'].items():
+        total_times += times
+        lines.append(f"{stage:<10}" + ''.join(
+            f"{value * 1e3:>10.3f}" for value in
+            (np.mean(times), np.median(times), np.percentile(times, 95), np.max(times))))
+
+    lines.append(f"{'total':<10}" + ''.join(
+        f"{value * 1e3:>10.3f}" for value in
+        (np.mean(total_times), np.median(total_times),
+         np.percentile(total_times, 95), np.max(total_times))))
+
+    position_errors, heading_errors = getPoseErrors(
+        result['estimates'], np.asarray(recording['true_poses']))
+    gnss_errors, _ = getPoseErrors(
+        np.asarray(recording['gnss_poses']), np.asarray(recording['true_poses']))
+
+    # Frames with no known true pose or heading are NaN, so leave them out
+    position_errors = position_errors[~np.isnan(position_errors)]
+    gnss_errors = gnss_errors[~np.isnan(gnss_errors)]
+    heading_errors = heading_errors[~np.isnan(heading_errors)]
+
+    lines += [
+        '',
+        f"frames: {len(total_times)} at {1 / np.mean(total_times):.1f} Hz, "
+        f"{np.mean(result['particle_counts']):.0f} particles on average"
+    ]
+
+    if len(position_errors) > 0:
+        lines.append(
+            f"position error: RMSE {np.sqrt(np.mean(position_errors**2)):.3f} m, "
+            f"max {np.max(position_errors):.3f} m (GNSS RMSE {np.sqrt(np.mean(gnss_errors**2)):.3f} m)")
+    else:
+        lines.append("position error: unknown (no true poses)")
+
+    if len(heading_errors) > 0:
+        lines.append(
+            f"heading error: mean {np.degrees(np.mean(heading_errors)):.2f} deg, "
+            f"max {np.degrees(np.max(heading_errors)):.2f} deg")
+    else:
+        lines.append("heading error: unknown (no true headings)")
+
+    return '\n'.join(lines)
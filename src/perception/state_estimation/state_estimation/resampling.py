@@ -0,0 +1,96 @@
+'''
+Package: state_estimation
+   File: resampling.py
+ Author: Will Heitman (w at heit dot mn)
+
+Resampling schemes for particle filters.
+
+Each scheme takes normalized particle weights and returns the indexes of
+the particles to keep, so that particles[indexes] is the resampled set.
+All of them are O(N log N) at worst: a cumulative sum of the weights,
+then one np.searchsorted for every draw.
+
+- multinomial: N independent draws. Simplest, but the noisiest.
+- stratified: one draw from each of N equal slices of [0, 1).
+- systematic: like stratified, but with a single random offset for
+    every slice, so samples are exactly 1/N apart. Low variance and cheap.
+- residual: floor(N * w) copies of each particle, then multinomial
+    draws for the remainder.
+
+ACKNOWLEDGEMENT:
+Adapted from Roger Labbe's filterpy:
+https://github.com/rlabbe/filterpy/blob/master/filterpy/monte_carlo/resampling.py
+'''
+
+import numpy as np
+from numpy.random import random
+
+
+def getCumulativeSum(weights: np.ndarray) -> np.ndarray:
+    cumulative_sum = np.cumsum(weights)
+    cumulative_sum[-1] = 1.  # avoid round-off error
+    return cumulative_sum
+
+
+def multinomial_resample(weights: np.ndarray) -> np.ndarray:
+    """Draw N particles independently, with probability equal to their weights"""
+    return np.searchsorted(getCumulativeSum(weights), random(len(weights)), side='right')
+
+
+def stratified_resample(weights: np.ndarray) -> np.ndarray:
+    """Draw one particle from each of N equal divisions of the cumulative weights"""
+    N = len(weights)
+    positions = (random(N) + np.arange(N)) / N
+    return np.searchsorted(getCumulativeSum(weights), positions, side='right')
+
+
+def systematic_resample(weights: np.ndarray) -> np.ndarray:
+    """Draw particles at N evenly spaced positions, with one random offset"""
+    N = len(weights)
+    positions = (random() + np.arange(N)) / N
+    return np.searchsorted(getCumulativeSum(weights), positions, side='right')
+
+
+def residual_resample(weights: np.ndarray) -> np.ndarray:
+    """Copy each particle floor(N * weight) times, then draw the rest multinomially"""
+    N = len(weights)
+    num_copies = np.floor(N * np.asarray(weights)).astype(int)
+    indexes = np.repeat(np.arange(N), num_copies)
+
+    remaining = N - len(indexes)
+    if remaining == 0:
+        return indexes
+
+    residuals = N * np.asarray(weights) - num_copies
+    residuals /= np.sum(residuals)
+    drawn = np.searchsorted(getCumulativeSum(residuals),
+                            random(remaining), side='right')
+
+    return np.concatenate((indexes, drawn))
+
+
+RESAMPLERS = {
+    'multinomial': multinomial_resample,
+    'stratified': stratified_resample,
+    'systematic': systematic_resample,
+    'residual': residual_resample
+}
+
+
+def getResampler(name: str):
+    """Look up a resampling scheme by name.
+
+    Args:
+        name (str): One of RESAMPLERS' keys
+
+    Raises:
+        ValueError: If the scheme does not exist
+
+    Returns:
+        Callable: Function from weights to resampled indexes
+    """
+    if name not in RESAMPLERS:
+        raise ValueError(
+            f"Unknown resampling scheme '{name}'. Choose one of {list(RESAMPLERS)}")
+
+    return RESAMPLERS[name]
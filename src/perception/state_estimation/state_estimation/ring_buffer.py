@@ -0,0 +1,91 @@
+'''
+Package: state_estimation
+   File: ring_buffer.py
+ Author: Will Heitman (w at heit dot mn)
+
+Fixed-capacity history of NumPy values.
+
+Pushing is O(1): once the buffer is full, the newest value overwrites the
+oldest one in place. The buffer also keeps running sums, so the mean and
+the linearly weighted moving average (WMA) of its contents are O(1) too.
+This keeps both memory and per-message cost constant on long drives.
+'''
+
+import numpy as np
+
+
+class RingBuffer:
+
+    def __init__(self, capacity: int, shape: tuple = (), dtype=np.float64):
+        """Create an empty buffer.
+
+        Args:
+            capacity (int): Most values to keep. Older values are discarded.
+            shape (tuple, optional): Shape of each value, e.g. (3,) for
+                [x, y, heading]. Defaults to () (scalars).
+            dtype (optional): Defaults to np.float64.
+        """
+        self.capacity = capacity
+        self.data = np.zeros((capacity,) + tuple(shape), dtype=dtype)
+        self.clear()
+
+    def clear(self):
+        self.start = 0  # Index of the oldest value
+        self.count = 0
+        self.pushes = 0
+
+        # Sum of the values, and sum weighted by age: 1 for the oldest
+        # value up to count for the newest
+        self.sum = np.zeros(self.data.shape[1:])
+        self.weighted_sum = np.zeros(self.data.shape[1:])
+
+    def __len__(self) -> int:
+        return self.count
+
+    def isFull(self) -> bool:
+        return self.count == self.capacity
+
+    def push(self, value):
+        """Add a value, discarding the oldest one if the buffer is full"""
+        value = np.asarray(value, dtype=self.data.dtype)
+
+        if self.isFull():
+            # Every value ages by one, which drops each weight by one,
+            # and the oldest value (weight 1) falls out
+            self.weighted_sum -= self.sum
+            self.sum -= self.data[self.start]
+            self.data[self.start] = value
+            self.start = (self.start + 1) % self.capacity
+        else:
+            self.data[(self.start + self.count) % self.capacity] = value
+            self.count += 1
+
+        self.sum += value
+        self.weighted_sum += self.count * value
+
+        # Recompute the running sums now and then, so that round-off
+        # doesn't accumulate over a long drive
+        self.pushes += 1
+        if self.pushes % self.capacity == 0:
+            self.resync()
+
+    def resync(self):
+        values = self.toArray()
+        self.sum = np.sum(values, axis=0)
+        self.weighted_sum = np.tensordot(
+            np.arange(1, self.count + 1), values, axes=1)
+
+    def toArray(self) -> np.ndarray:
+        """Copy of the values, from oldest to newest"""
+        indices = (self.start + np.arange(self.count)) % self.capacity
+        return self.data[indices]
+
+    def mean(self):
+        """Mean of the values. The buffer must not be empty."""
+        return self.sum / self.count
+
+    def weightedMean(self):
+        """Linearly weighted moving average of the values, where the newest
+        value has weight n and the oldest has weight 1. The buffer must not be empty.
+        """
+        return self.weighted_sum / (self.count * (self.count + 1) / 2)
@@ -0,0 +1,70 @@
+'''
+Benchmark for MCL, using the replay harness in replay.py.
+
+Replays a recorded drive through MCL.step as fast as possible, then
+prints the time spent in each stage and the pose error against the
+recorded true pose. Without a recording, a synthetic drive down a
+straight road is generated and used instead.
+
+Usage: python3 benchmark_mcl.py [recording.npz or directory] [max particle count]
+'''
+
+import sys
+
+import numpy as np
+
+from state_estimation.mcl import GRID_ORIGIN_METERS, CELL_SIZE, ROAD_ID, POLE_ID
+from state_estimation.replay import Recording, loadRecording, replay, summarize
+
+FRAMES = 200
+FRAME_RATE = 10.0  # Hz
+SPEED = 5.0  # m/s
+ROAD_HALF_WIDTH = 4.0  # meters
+GNSS_STD = 1.0  # meters
+CLOUD_SIZE = 5000
+
+
+def makeSyntheticRecording(seed: int = 0) -> dict:
+    """A car driving along the x axis, on a road centered on y = 0"""
+    rng = np.random.default_rng(seed)
+
+    # Rows of the base_link-centered grid that are within the road
+    grid = np.zeros((151, 151), dtype=np.int8)
+    row_y = np.arange(151) * CELL_SIZE + GRID_ORIGIN_METERS[1]
+    grid[np.abs(row_y) < ROAD_HALF_WIDTH, :] = 100
+
+    recording = Recording()
+    for i in range(FRAMES):
+        true_pose = np.array([SPEED * i / FRAME_RATE, 0.0, 0.0])
+        gnss_pose = true_pose + [*rng.normal(0, GNSS_STD, 2), 0.0]
+
+        road = np.column_stack((
+            rng.uniform(-12, 12, CLOUD_SIZE),
+            rng.uniform(-ROAD_HALF_WIDTH, ROAD_HALF_WIDTH, CLOUD_SIZE),
+            np.full(CLOUD_SIZE, ROAD_ID)))
+        pole = np.column_stack((
+            rng.normal(3.0, 0.05, 100), rng.normal(ROAD_HALF_WIDTH + 1, 0.05, 100),
+            np.full(100, POLE_ID)))
+
+        recording.append(i / FRAME_RATE, SPEED, 0.0, np.vstack((road, pole)),
+                         gnss_pose, grid, true_pose)
+
+    return recording.toArrays()
+
+
+def main():
+    if len(sys.argv) > 1:
+        recording = loadRecording(sys.argv[1])
+    else:
+        recording = makeSyntheticRecording()
+
+    N = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+
+    # Start at the fewest particles, like MCLNode
+    result = replay(recording, N=N // 40, min_N=N // 40, max_N=N)
+
+    print(summarize(recording, result))
+
+
+if __name__ == '__main__':
+    main()
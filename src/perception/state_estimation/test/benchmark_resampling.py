@@ -0,0 +1,57 @@
+'''
+Benchmark for the resampling schemes in resampling.py.
+
+Times each scheme, plus the original while-loop systematic resampler,
+for particle counts from 50 to 50k.
+
+Usage: python3 benchmark_resampling.py
+'''
+
+import timeit
+
+import numpy as np
+
+from state_estimation.resampling import RESAMPLERS
+
+PARTICLE_COUNTS = [50, 500, 5000, 50000]
+REPEATS = 20
+
+
+def loop_systematic_resample(weights):
+    """The original while-loop implementation, for comparison"""
+    N = len(weights)
+    positions = (np.random.random() + np.arange(N)) / N
+
+    indexes = np.zeros(N, 'i')
+    cumulative_sum = np.cumsum(weights)
+    i, j = 0, 0
+    while i < N:
+        if positions[i] < cumulative_sum[j]:
+            indexes[i] = j
+            i += 1
+        else:
+            j += 1
+    return indexes
+
+
+def main():
+    schemes = dict(RESAMPLERS, **{'systematic (loop)': loop_systematic_resample})
+
+    print(f"{'scheme':<18}" + ''.join(f"{N:>12}" for N in PARTICLE_COUNTS))
+
+    for name, resample in schemes.items():
+        row = f"{name:<18}"
+
+        for N in PARTICLE_COUNTS:
+            weights = np.random.random(N)
+            weights /= np.sum(weights)
+
+            seconds = min(timeit.repeat(
+                lambda: resample(weights), number=1, repeat=REPEATS))
+            row += f"{seconds * 1e3:>9.3f} ms"
+
+        print(row)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import unittest
+
+import numpy as np
+
+from state_estimation.kld_sampling import getKLDParticleCount, getOccupiedBinCount
+from state_estimation.mcl import MCL
+
+
+class TestKLDSampling(unittest.TestCase):
+    def test_occupied_bins(self):
+        particles = np.array([[0.1, 0.1, 0.0],
+                              [0.2, 0.3, 0.01],  # Same bin as the first
+                              [0.6, 0.1, 0.0],
+                              [0.1, 0.1, 1.0]])
+
+        self.assertEqual(getOccupiedBinCount(particles), 3)
+
+    def test_count_follows_spread(self):
+        rng = np.random.default_rng(0)
+        converged = rng.normal(0, [0.2, 0.2, 0.01], (1000, 3))
+        spread = rng.normal(0, [2.0, 2.0, 0.4], (1000, 3))
+
+        converged_N = getKLDParticleCount(converged, 10, 100000)
+        spread_N = getKLDParticleCount(spread, 10, 100000)
+
+        self.assertLess(converged_N, 500)
+        self.assertGreater(spread_N, 10 * converged_N)
+
+    def test_count_is_bounded(self):
+        rng = np.random.default_rng(0)
+        spread = rng.normal(0, [2.0, 2.0, 0.4], (1000, 3))
+
+        self.assertEqual(getKLDParticleCount(spread, 10, 300), 300)
+        self.assertEqual(getKLDParticleCount(np.zeros((5, 3)), 10, 300), 10)
+
+
+class TestAdaptiveMCL(unittest.TestCase):
+    def test_shrinks_when_converged(self):
+        mcl = MCL(0.0, 0.4, N=1000, min_N=50, max_N=1000)
+        mcl.particles = np.random.normal(0, [0.1, 0.1, 0.0], (1000, 3))
+
+        mcl.adaptParticleCount(0.0, np.zeros(3))
+
+        self.assertLess(len(mcl.particles), 1000)
+        self.assertEqual(len(mcl.weights), len(mcl.particles))
+
+    def test_grows_when_gnss_disagrees(self):
+        mcl = MCL(0.0, 0.4, N=50, min_N=50, max_N=300)
+        mcl.particles = np.full((50, 3), 0.2)  # Converged, so KLD-sampling alone keeps min_N
+        gnss_pose = np.array([10.0, 0.0, 0.0])
+
+        # A single disagreement may just be GNSS noise
+        mcl.adaptParticleCount(2.0, gnss_pose)
+        self.assertEqual(len(mcl.particles), 50)
+        mcl.adaptParticleCount(0.0, gnss_pose)
+        mcl.adaptParticleCount(2.0, gnss_pose)
+        mcl.adaptParticleCount(2.0, gnss_pose)
+        self.assertEqual(len(mcl.particles), 50)
+
+        # A persistent disagreement doubles the count, up to max_N
+        counts = []
+        for _ in range(4):
+            mcl.adaptParticleCount(2.0, gnss_pose)
+            counts.append(len(mcl.particles))
+
+        self.assertEqual(counts, [100, 200, 300, 300])
+        self.assertAlmostEqual(np.sum(mcl.weights), 1.0)
+        # New particles surround the GNSS pose
+        self.assertAlmostEqual(np.mean(mcl.particles[50:, 0]), 10.0, delta=0.5)
+
+    def test_fixed_count_by_default(self):
+        mcl = MCL(0.0, 0.4, N=30)
+
+        mcl.adaptParticleCount(2.0, np.zeros(3))
+
+        self.assertEqual(len(mcl.particles), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+
+from state_estimation.landmarks import getClusters, extractLandmarks
+from state_estimation.mcl import POLE_ID, TRAFFIC_LIGHT_ID
+
+
+class TestClusters(unittest.TestCase):
+    def test_groups_points_by_cell(self):
+        points = np.array([[0.1, 0.1], [0.3, 0.5], [0.9, 0.2],  # Cell (0, 0)
+                           [5.5, -2.5], [5.1, -2.9]])           # Cell (5, -3)
+
+        centroids, counts = getClusters(points, 1.0)
+        order = np.argsort(counts)[::-1]
+
+        np.testing.assert_array_equal(counts[order], [3, 2])
+        np.testing.assert_allclose(
+            centroids[order], [[1.3/3, 0.8/3], [5.3, -2.7]])
+
+    def test_empty(self):
+        centroids, counts = getClusters(np.zeros((0, 2)), 1.0)
+
+        self.assertEqual(centroids.shape, (0, 2))
+        self.assertEqual(counts.shape, (0,))
+
+
+class TestExtractLandmarks(unittest.TestCase):
+    def test_filters_class_and_distance(self):
+        rng = np.random.default_rng(0)
+        light = rng.normal(0, 0.05, (200, 2)) + [4.5, 2.5]
+        far_light = rng.normal(0, 0.05, (50, 2)) + [30.5, 0.5]
+        pole = rng.normal(0, 0.05, (80, 2)) + [-3.5, 1.5]
+        cloud = np.vstack((
+            np.column_stack((light, np.full(200, TRAFFIC_LIGHT_ID))),
+            np.column_stack((far_light, np.full(50, TRAFFIC_LIGHT_ID))),
+            np.column_stack((pole, np.full(80, POLE_ID)))))
+
+        centroids, counts = extractLandmarks(
+            cloud, TRAFFIC_LIGHT_ID, 1.0, max_distance=10.0)
+
+        np.testing.assert_array_equal(counts, [200])
+        np.testing.assert_allclose(centroids, [np.mean(light, axis=0)])
@@ -0,0 +1,49 @@
+import unittest
+
+import numpy as np
+
+from state_estimation.likelihood_field import LikelihoodField, getLikelihoodField
+
+
+class TestLikelihoodField(unittest.TestCase):
+    def test_falloff(self):
+        grid = np.zeros((20, 20), dtype=np.int8)
+        grid[:, 10] = 100
+
+        field = getLikelihoodField(grid, resolution=0.5, sigma=1.0)
+
+        self.assertEqual(field.dtype, np.float32)
+        np.testing.assert_array_equal(field[:, 10], 1.0)
+        np.testing.assert_allclose(field[:, 12], np.exp(-0.5))  # 1 m away
+        self.assertTrue(np.all(np.diff(field[0, 10:]) < 0))
+
+    def test_zero_sigma_is_binary(self):
+        grid = np.zeros((20, 20), dtype=np.int8)
+        grid[5:8, 2:4] = 100
+
+        field = getLikelihoodField(grid, resolution=0.4, sigma=0.0)
+
+        np.testing.assert_array_equal(field, grid == 100)
+
+    def test_no_drivable_cells(self):
+        field = getLikelihoodField(
+            np.zeros((20, 20), dtype=np.int8), resolution=0.4, sigma=1.0)
+
+        np.testing.assert_array_equal(field, 0.0)
+
+    def test_cached_until_grid_changes(self):
+        cache = LikelihoodField(resolution=0.4, sigma=0.5)
+        grid = np.zeros((20, 20), dtype=np.int8)
+        grid[3, 3] = 100
+
+        first = cache.update(grid)
+        self.assertIs(cache.update(grid.copy()), first)
+
+        grid[3, 4] = 100  # Changing the caller's array must not alias the cache
+        second = cache.update(grid)
+        self.assertIsNot(second, first)
+        self.assertEqual(second[3, 4], 1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
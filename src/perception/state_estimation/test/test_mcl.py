@@ -0,0 +1,202 @@
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from state_estimation.likelihood_field import getLikelihoodField
+from state_estimation.mcl import MCL, GRID_ORIGIN_METERS, CELL_SIZE, \
+    ROAD_ID, POLE_ID, TRAFFIC_LIGHT_ID
+
+CLASS_IDS = np.array([ROAD_ID, POLE_ID, TRAFFIC_LIGHT_ID, 0])
+
+
+def getLoopAlignments(mu, particles, cloud, grid) -> list:
+    """The original per-particle, per-point scoring loop"""
+    cloud_on_grid = np.copy(cloud)
+    cloud_on_grid[:, 0:2] -= GRID_ORIGIN_METERS
+    cloud_on_grid[:, 0:2] /= CELL_SIZE
+
+    alignments = []
+    for particle in particles:
+        particle_on_grid = particle - mu
+        particle_on_grid[0:2] -= GRID_ORIGIN_METERS
+        particle_on_grid[0:2] /= CELL_SIZE
+        particle_on_grid = particle_on_grid.astype(int)
+
+        cloud_on_particle = np.copy(cloud_on_grid)
+        cloud_on_particle[:, 0:2] += GRID_ORIGIN_METERS/CELL_SIZE
+        d_theta = particle_on_grid[2]
+        r = np.array([[np.cos(d_theta), -1*np.sin(d_theta)],
+                      [np.sin(d_theta), np.cos(d_theta)]])
+        cloud_on_particle[:, 0:2] = np.dot(cloud_on_particle[:, 0:2], r.T)
+        cloud_on_particle[:, 0:2] += particle_on_grid[0:2]
+        cloud_on_particle = cloud_on_particle.astype(int)
+
+        hits = 0
+        for pt in cloud_on_particle:
+            if pt[0] >= grid.shape[0] or pt[1] >= grid.shape[1] or pt[0] < 0 or pt[1] < 0:
+                continue
+            if grid[pt[1]][pt[0]] == 100 and pt[2] == ROAD_ID:
+                hits += 1
+            elif grid[pt[1]][pt[0]] == 100 and (pt[2] == POLE_ID or pt[2] == TRAFFIC_LIGHT_ID):
+                hits -= 5
+        alignments.append(hits / len(cloud_on_particle))
+
+    return alignments
+
+
+class TestAlignments(unittest.TestCase):
+    def test_matches_loop(self):
+        rng = np.random.default_rng(0)
+        for _ in range(10):
+            grid = (rng.random((151, 151)) < 0.5).astype(np.int8) * 100
+            cloud = np.column_stack((
+                rng.normal(0, 8, 300), rng.normal(0, 8, 300),
+                CLASS_IDS[rng.integers(0, len(CLASS_IDS), 300)]))
+            mu = rng.normal(0, 50, 3)
+            particles = mu + rng.normal(0, 3, (40, 3))
+
+            mcl = MCL(0.0, CELL_SIZE, initial_pose=mu, N=40)
+            alignments = mcl.getAlignments(
+                particles, cloud, getLikelihoodField(grid, CELL_SIZE, 0.0))
+
+            np.testing.assert_array_equal(
+                alignments, getLoopAlignments(mu, particles, cloud, grid))
+
+    def test_chunked_scoring(self):
+        rng = np.random.default_rng(1)
+        grid = (rng.random((151, 151)) < 0.5).astype(np.int8) * 100
+        cloud = np.column_stack((
+            rng.normal(0, 8, 100), rng.normal(0, 8, 100),
+            CLASS_IDS[rng.integers(0, len(CLASS_IDS), 100)]))
+        mcl = MCL(0.0, CELL_SIZE, N=50)
+
+        # 7 particles per chunk, so the last chunk is partial
+        with mock.patch('state_estimation.mcl.MAX_SCORED_POINTS', 700):
+            alignments = mcl.getAlignments(
+                mcl.particles, cloud, getLikelihoodField(grid, CELL_SIZE, 0.0))
+
+        np.testing.assert_array_equal(
+            alignments, getLoopAlignments(mcl.mu, mcl.particles, cloud, grid))
+
+    def test_empty_cloud(self):
+        mcl = MCL(0.0, CELL_SIZE, N=10)
+        alignments = mcl.getAlignments(
+            mcl.particles, np.zeros((0, 3)), np.zeros((151, 151), dtype=np.float32))
+
+        np.testing.assert_array_equal(alignments, np.zeros(10))
+
+    def test_counts_weigh_points(self):
+        rng = np.random.default_rng(2)
+        grid = (rng.random((151, 151)) < 0.5).astype(np.int8) * 100
+        field = getLikelihoodField(grid, CELL_SIZE, 0.0)
+        cloud = np.column_stack((
+            rng.normal(0, 8, 50), rng.normal(0, 8, 50),
+            CLASS_IDS[rng.integers(0, len(CLASS_IDS), 50)]))
+        counts = rng.integers(1, 5, 50)
+        mcl = MCL(0.0, CELL_SIZE, N=20)
+
+        # A point with a count of n scores like n copies of that point
+        weighted = mcl.getAlignments(mcl.particles, cloud, field, counts)
+        repeated = mcl.getAlignments(
+            mcl.particles, np.repeat(cloud, counts, axis=0), field)
+
+        np.testing.assert_allclose(weighted, repeated)
+
+    def test_field_rewards_near_misses(self):
+        # Road runs along y = 0 in base_link, i.e. grid row 75
+        grid = np.zeros((151, 151), dtype=np.int8)
+        grid[75, :] = 100
+        cloud = np.column_stack((
+            np.arange(-10, 10), np.zeros(20), np.full(20, ROAD_ID)))
+
+        mcl = MCL(0.0, CELL_SIZE, N=1)
+        mcl.mu = np.zeros(3)
+        particles = np.array([[0.0, 0.0, 0.0],   # On the road
+                              [0.0, 0.8, 0.0],   # Two cells off
+                              [0.0, 8.0, 0.0]])  # Far off
+
+        exact = mcl.getAlignments(
+            particles, cloud, getLikelihoodField(grid, CELL_SIZE, 0.0))
+        smooth = mcl.getAlignments(
+            particles, cloud, getLikelihoodField(grid, CELL_SIZE, 1.0))
+
+        np.testing.assert_array_equal(exact, [1.0, 0.0, 0.0])
+        self.assertAlmostEqual(smooth[0], 1.0)
+        self.assertGreater(smooth[1], 0.5)
+        self.assertLess(smooth[2], 1e-6)
+
+    def test_landmarks_beside_road(self):
+        # Road runs along y = 0 in base_link, i.e. grid row 75
+        grid = np.zeros((151, 151), dtype=np.int8)
+        grid[75, :] = 100
+        road = np.column_stack((
+            np.arange(-10, 10), np.zeros(20), np.full(20, ROAD_ID)))
+        field = getLikelihoodField(grid, CELL_SIZE, 0.5)
+
+        mcl = MCL(0.0, CELL_SIZE, N=1)
+        mcl.mu = np.zeros(3)
+        particles = np.zeros((1, 3))
+        gnss_pose = np.zeros(3)
+
+        # A pole one cell off the road's edge costs nothing...
+        beside = np.vstack((road, [3.0, 0.6, POLE_ID]))
+        likelihoods = mcl.getLikelihoods(
+            particles, beside, grid, gnss_pose, field)
+        np.testing.assert_allclose(likelihoods, [20 / 21])
+
+        # ...while a pole in the road is penalized
+        inside = np.vstack((road, [3.0, 0.0, POLE_ID]))
+        likelihoods = mcl.getLikelihoods(
+            particles, inside, grid, gnss_pose, field)
+        np.testing.assert_allclose(likelihoods, [15 / 21])
+
+
+class TestPredictCorrect(unittest.TestCase):
+    def test_matches_step(self):
+        rng = np.random.default_rng(2)
+        grid = (rng.random((151, 151)) < 0.5).astype(np.int8) * 100
+        cloud = np.column_stack((
+            rng.normal(0, 8, 300), rng.normal(0, 8, 300),
+            CLASS_IDS[rng.integers(0, len(CLASS_IDS), 300)]))
+        gnss_pose = np.array([0.5, -0.5, 0.2])
+
+        np.random.seed(0)
+        stepped = MCL(0.0, CELL_SIZE, N=100)
+        stepped_result = stepped.step([0.1, 2.0], 0.5, cloud, gnss_pose, grid)
+
+        np.random.seed(0)
+        staged = MCL(0.0, CELL_SIZE, N=100)
+        staged.predict([0.1, 2.0], 0.5, new_heading=gnss_pose[2])
+        likelihoods = staged.getLikelihoods(
+            np.copy(staged.particles), cloud, grid, gnss_pose)
+        staged_result = staged.correct(likelihoods, gnss_pose)
+
+        np.testing.assert_array_equal(stepped_result[0], staged_result[0])
+        np.testing.assert_array_equal(stepped.particles, staged.particles)
+
+    def test_noise_independent_of_rate(self):
+        np.random.seed(0)
+        once = MCL(0.0, CELL_SIZE, N=20000)
+        start = np.copy(once.particles)
+        once.predict([0.0, 0.0], 1.0, new_heading=0.0)
+
+        np.random.seed(1)
+        often = MCL(0.0, CELL_SIZE, N=20000)
+        often.particles = np.copy(start)
+        for i in range(1, 101):
+            often.predict([0.0, 0.0], i / 100, new_heading=0.0)
+
+        # A hundred small steps spread the particles as much as one long step
+        once_spread = np.std(once.particles[:, 0] - start[:, 0])
+        often_spread = np.std(often.particles[:, 0] - start[:, 0])
+        self.assertAlmostEqual(once_spread, often_spread, delta=0.05 * once_spread)
+
+        # No time passed, no noise
+        particles = np.copy(often.particles)
+        often.predict([0.0, 0.0], 1.0, new_heading=0.0)
+        np.testing.assert_array_equal(often.particles[:, 0:2], particles[:, 0:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from state_estimation.mcl import STAGES, ROAD_ID
+from state_estimation.replay import Recording, loadRecording, replay, getPoseErrors, summarize
+
+
+def makeRecording(frames: int = 5) -> Recording:
+    rng = np.random.default_rng(0)
+    grid = np.zeros((151, 151), dtype=np.int8)
+    grid[65:85, :] = 100
+
+    recording = Recording()
+    for i in range(frames):
+        pose = np.array([i * 0.5, 0.0, 0.0])
+        cloud = np.column_stack((
+            rng.uniform(-10, 10, 20 + i), rng.uniform(-3, 3, 20 + i),
+            np.full(20 + i, ROAD_ID)))
+        recording.append(i * 0.1, 5.0, 0.0, cloud, pose, grid, pose)
+
+    return recording
+
+
+class TestRecording(unittest.TestCase):
+    def test_round_trip(self):
+        arrays = makeRecording().toArrays()
+
+        with tempfile.TemporaryDirectory() as directory:
+            for path in (os.path.join(directory, 'drive.npz'),
+                         os.path.join(directory, 'drive')):
+                makeRecording().save(path)
+                loaded = loadRecording(path)
+
+                for name, array in arrays.items():
+                    np.testing.assert_array_equal(loaded[name], array)
+
+    def test_grids_are_stored_once(self):
+        arrays = makeRecording().toArrays()
+
+        self.assertEqual(arrays['grids'].shape, (1, 151, 151))
+        np.testing.assert_array_equal(arrays['grid_indexes'], np.zeros(5))
+        np.testing.assert_array_equal(
+            np.diff(arrays['cloud_offsets']), [20, 21, 22, 23, 24])
+
+
+class TestReplay(unittest.TestCase):
+    def test_replay(self):
+        result = replay(makeRecording().toArrays(), N=100)
+
+        self.assertEqual(result['estimates'].shape, (5, 3))
+        self.assertEqual(set(result['stage_times']), set(STAGES))
+        for times in result['stage_times'].values():
+            self.assertTrue(np.all(times >= 0))
+
+    def test_summarize_unknown_headings(self):
+        # As recorded by MCLNode, since /true_pose has no orientation
+        recording = makeRecording().toArrays()
+        recording['true_poses'][:, 2] = np.nan
+        recording['true_poses'][0] = np.nan
+
+        summary = summarize(recording, replay(recording, N=100))
+
+        self.assertIn("position error: RMSE", summary)
+        self.assertIn("heading error: unknown", summary)
+        self.assertNotIn("nan", summary)
+
+    def test_pose_errors(self):
+        position_errors, heading_errors = getPoseErrors(
+            np.array([[3.0, 4.0, 0.1], [0.0, 0.0, 6.2]]),
+            np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 0.0]]))
+
+        np.testing.assert_allclose(position_errors, [5.0, 0.0])
+        np.testing.assert_allclose(heading_errors, [0.1, 2 * np.pi - 6.2])
@@ -0,0 +1,84 @@
+import unittest
+
+import numpy as np
+
+from state_estimation.mcl import MCL
+from state_estimation.resampling import RESAMPLERS, getResampler, systematic_resample
+
+
+def loop_systematic_resample(weights, offset):
+    """The original while-loop implementation"""
+    N = len(weights)
+    positions = (offset + np.arange(N)) / N
+
+    indexes = np.zeros(N, 'i')
+    cumulative_sum = np.cumsum(weights)
+    i, j = 0, 0
+    while i < N:
+        if positions[i] < cumulative_sum[j]:
+            indexes[i] = j
+            i += 1
+        else:
+            j += 1
+    return indexes
+
+
+class TestResampling(unittest.TestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def test_schemes_pick_weighted_particles(self):
+        weights = np.array([0.0, 0.5, 0.0, 0.25, 0.25, 0.0])
+
+        for name, resample in RESAMPLERS.items():
+            indexes = resample(weights)
+
+            self.assertEqual(len(indexes), len(weights), name)
+            self.assertTrue(np.all(weights[indexes] > 0), name)
+
+    def test_low_variance_counts(self):
+        weights = np.random.random(200)
+        weights /= np.sum(weights)
+
+        # Systematic copies each particle floor(N * w) or ceil(N * w) times
+        counts = np.bincount(systematic_resample(weights), minlength=200)
+        self.assertTrue(np.all(counts >= np.floor(200 * weights)))
+        self.assertTrue(np.all(counts <= np.ceil(200 * weights)))
+
+        # Residual copies each particle at least floor(N * w) times
+        counts = np.bincount(RESAMPLERS['residual'](weights), minlength=200)
+        self.assertTrue(np.all(counts >= np.floor(200 * weights)))
+
+    def test_systematic_matches_loop(self):
+        weights = np.random.random(500)
+        weights /= np.sum(weights)
+
+        np.random.seed(1)
+        indexes = systematic_resample(weights)
+        np.random.seed(1)
+        expected = loop_systematic_resample(weights, np.random.random())
+
+        np.testing.assert_array_equal(indexes, expected)
+
+    def test_unknown_scheme(self):
+        with self.assertRaises(ValueError):
+            getResampler('bogus')
+
+    def test_resamples_below_neff_threshold(self):
+        mcl = MCL(0.0, 0.4, N=100, resampler='stratified', resample_threshold=0.5)
+
+        self.assertFalse(mcl.resample())  # Uniform weights, neff = N
+
+        mcl.weights[:] = 1e-6
+        mcl.weights[7] = 1.0
+        mcl.weights /= np.sum(mcl.weights)
+        heavy_particle = np.copy(mcl.particles[7])
+
+        self.assertTrue(mcl.resample())
+        np.testing.assert_allclose(mcl.weights, 0.01)
+        np.testing.assert_allclose(
+            np.mean(mcl.particles[:, 0:2], axis=0), heavy_particle[0:2], atol=0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+
+from state_estimation.ring_buffer import RingBuffer
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_keeps_newest_values(self):
+        buffer = RingBuffer(4)
+        for value in range(10):
+            buffer.push(value)
+
+        self.assertEqual(len(buffer), 4)
+        self.assertTrue(buffer.isFull())
+        np.testing.assert_array_equal(buffer.toArray(), [6, 7, 8, 9])
+
+    def test_running_averages(self):
+        rng = np.random.default_rng(0)
+        buffer = RingBuffer(7, shape=(3,))
+
+        for _ in range(50):
+            buffer.push(rng.normal(100.0, 10.0, 3))
+
+            values = buffer.toArray()
+            weights = np.arange(1, len(values) + 1)
+            np.testing.assert_allclose(buffer.mean(), np.mean(values, axis=0))
+            np.testing.assert_allclose(
+                buffer.weightedMean(), np.average(values, axis=0, weights=weights))
+
+    def test_clear(self):
+        buffer = RingBuffer(3, shape=(2,))
+        buffer.push([1.0, 2.0])
+        buffer.push([3.0, 4.0])
+        buffer.clear()
+        buffer.push([5.0, 6.0])
+
+        self.assertEqual(len(buffer), 1)
+        np.testing.assert_array_equal(buffer.mean(), [5.0, 6.0])
+        np.testing.assert_array_equal(buffer.weightedMean(), [5.0, 6.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
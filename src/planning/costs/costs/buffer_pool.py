@@ -0,0 +1,59 @@
+'''
+Package: costs
+   File: buffer_pool.py
+ Author: Will Heitman (w at heit dot mn)
+
+Named, preallocated NumPy buffers that are reused from frame to frame.
+
+Our cost maps have the same shape every frame, so rather than allocating
+fresh arrays per message, each step of a node asks the pool for its buffer
+by name and writes into it in place (np.add(..., out=), np.clip(..., out=),
+etc). A buffer is only reallocated if the requested shape or dtype changes.
+'''
+
+import numpy as np
+
+# Costs are small integers times a scale, which float32 holds exactly
+COST_DTYPE = np.float32
+
+
+class BufferPool:
+
+    def __init__(self, dtype=COST_DTYPE):
+        """Create an empty pool.
+
+        Args:
+            dtype (optional): Default dtype of new buffers. Defaults to COST_DTYPE.
+        """
+        self.dtype = np.dtype(dtype)
+        self.buffers = {}
+        self.allocations = 0  # Total number of buffers allocated so far
+
+    def get(self, name: str, shape: tuple, dtype=None) -> np.ndarray:
+        """Return the buffer with this name, allocating it if needed.
+
+        The contents are whatever was last written to the buffer
+        (zeros when it is first allocated).
+
+        Args:
+            name (str): Buffer name. Each use of a buffer should have its own name.
+            shape (tuple): Shape of the buffer
+            dtype (optional): Buffer dtype. Defaults to the pool's dtype.
+
+        Returns:
+            np.ndarray: The buffer
+        """
+        dtype = self.dtype if dtype is None else np.dtype(dtype)
+        shape = tuple(shape)
+
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.zeros(shape, dtype=dtype)
+            self.buffers[name] = buffer
+            self.allocations += 1
+
+        return buffer
+
+    def getBytes(self) -> int:
+        """Total size of every buffer in the pool, in bytes"""
+        return sum(buffer.nbytes for buffer in self.buffers.values())
@@ -0,0 +1,127 @@
+'''
+Package: costs
+   File: grid_resampler.py
+ Author: Will Heitman (w at heit dot mn)
+
+Nearest-neighbor resampling between occupancy grids of different
+resolutions and origins.
+
+Each cell of the target grid takes the value of the source cell that
+contains its center. Cells outside the source grid get a fill value.
+Which source cell that is depends only on the two grids' geometry, so the
+gather indices are computed once per (source, target) MapMetaData pair and
+every later call is a single np.take.
+
+Both grids are assumed to be axis-aligned in the same frame (e.g. base_link),
+so the origins' orientations are ignored.
+'''
+
+import numpy as np
+
+# Cell centers that land exactly on a source cell's edge go to the upper
+# cell, as they would in exact arithmetic. This absorbs rounding error.
+EDGE_TOLERANCE = 1e-3  # cells
+
+
+def getGeometry(info) -> tuple:
+    """Summarize a MapMetaData as (width, height, resolution, origin_x, origin_y)"""
+    return (int(info.width), int(info.height), float(info.resolution),
+            float(info.origin.position.x), float(info.origin.position.y))
+
+
+def getSourceIndices(target_size: int, target_res: float, target_origin: float,
+                     source_size: int, source_res: float, source_origin: float) -> np.ndarray:
+    """For each target cell along one axis, the index of the source cell
+    containing its center, or -1 if there is none.
+    """
+    centers = target_origin + (np.arange(target_size) + 0.5) * target_res
+    indices = np.floor((centers - source_origin) /
+                       source_res + EDGE_TOLERANCE).astype(np.intp)
+    indices[(indices < 0) | (indices >= source_size)] = -1
+
+    return indices
+
+
+def getInsideRange(indices: np.ndarray) -> tuple:
+    """Return the [start, stop) range of valid (non-negative) indices"""
+    inside = np.flatnonzero(indices >= 0)
+    if len(inside) == 0:
+        return (0, 0)
+
+    return (inside[0], inside[-1] + 1)
+
+
+class GridResampler:
+
+    def __init__(self, fill_value=0):
+        """Create a resampler with an empty cache of gather indices.
+
+        Args:
+            fill_value (optional): Value of target cells outside of the source.
+                Defaults to 0.
+        """
+        self.fill_value = fill_value
+        self.index_maps = {}  # (source geometry, target geometry) -> (indices, rows, cols)
+
+    def getIndexMap(self, source_info, target_info) -> tuple:
+        """Return (and cache) the gather indices for a pair of grids.
+
+        Returns:
+            tuple: (indices, rows, cols), where indices is the (H*W,) flat source
+            index for each target cell, and rows and cols are the [start, stop)
+            ranges of target rows and columns that lie within the source
+        """
+        key = (getGeometry(source_info), getGeometry(target_info))
+        if key in self.index_maps:
+            return self.index_maps[key]
+
+        source_width, source_height, source_res, source_x, source_y = key[0]
+        target_width, target_height, target_res, target_x, target_y = key[1]
+
+        if source_res <= 0 or target_res <= 0:
+            raise ValueError(
+                f"Grid resolutions must be positive, got {source_res} and {target_res}")
+
+        rows = getSourceIndices(target_height, target_res, target_y,
+                                source_height, source_res, source_y)
+        cols = getSourceIndices(target_width, target_res, target_x,
+                                source_width, source_res, source_x)
+
+        # Indices increase along each axis, so the cells within the source
+        # form one rectangle. Cells outside of it are filled in separately.
+        indices = (np.maximum(rows, 0)[:, None] * source_width +
+                   np.maximum(cols, 0)[None, :]).ravel()
+        index_map = (indices, getInsideRange(rows), getInsideRange(cols))
+
+        self.index_maps[key] = index_map
+        return index_map
+
+    def resample(self, source: np.ndarray, source_info, target_info, out: np.ndarray = None) -> np.ndarray:
+        """Resample a grid onto another grid's geometry.
+
+        Args:
+            source (np.ndarray): (height, width) source grid, row-major (y first)
+            source_info (MapMetaData): Geometry of the source
+            target_info (MapMetaData): Geometry of the target
+            out (np.ndarray, optional): (height, width) array to write the result
+                into. Defaults to None (allocate one with the source's dtype).
+
+        Returns:
+            np.ndarray: The resampled grid
+        """
+        indices, (row_start, row_stop), (col_start, col_stop) = self.getIndexMap(
+            source_info, target_info)
+
+        if out is None:
+            out = np.empty((target_info.height, target_info.width),
+                           dtype=source.dtype)
+
+        # Every index is valid, so skip the bounds checks
+        np.take(source.reshape(-1), indices, out=out.reshape(-1), mode='clip')
+
+        out[:row_start] = self.fill_value
+        out[row_stop:] = self.fill_value
+        out[:, :col_start] = self.fill_value
+        out[:, col_stop:] = self.fill_value
+
+        return out
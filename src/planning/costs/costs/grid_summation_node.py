@@ -5,8 +5,16 @@ Package: grids
 
 Subscribes to cost maps, calculates their weighted sum, and
 publishes the result as a finished cost map.
+
+Layers are only converted when a new message arrives, and the sum is kept
+up to date incrementally (see layer_fusion.py).
+
+Parameters:
+- publish_on_update: also publish as soon as any layer arrives, rather than
+                     only every 0.2 s (default False)
 '''
 
+import copy
 import rclpy
 import ros2_numpy as rnp
 import numpy as np
@@ -19,7 +27,7 @@ from tf2_ros.transform_listener import TransformListener
 # Message definitions
 from carla_msgs.msg import CarlaSpeedometer
 from diagnostic_msgs.msg import DiagnosticStatus
-from nav_msgs.msg import OccupancyGrid
+from nav_msgs.msg import MapMetaData, OccupancyGrid
 from nova_msgs.msg import Egma
 from rosgraph_msgs.msg import Clock
 from sensor_msgs.msg import PointCloud2
@@ -27,7 +35,10 @@ from std_msgs.msg import Float32
 
 from skimage.morphology import erosion
 
-import matplotlib.pyplot as plt
+from .buffer_pool import BufferPool, COST_DTYPE
+from .grid_resampler import GridResampler
+from .layer_fusion import LayerAccumulator
+
 
 STALENESS_TOLERANCE = 0.2  # seconds. Grids older than this will be ignored.
 
@@ -37,6 +48,12 @@ DRIVABLE_GRID_SCALE = 1.0
 ROUTE_DISTANCE_GRID_SCALE = 1.0
 JUNCTION_GRID_SCALE = 1.0
 
+# Our cost maps are 151x151 cells at 0.4 m, in base_link, with
+# the origin at their rear right corner
+COST_MAP_SIZE = 151
+COST_MAP_RES = 0.4
+COST_MAP_ORIGIN = (-20.0, -30.0)
+
 
 class GridSummationNode(Node):
 
@@ -93,6 +110,28 @@ class GridSummationNode(Node):
 
         self.combine_timer = self.create_timer(0.2, self.createCostMap)
 
+        # If true, also fuse and publish as soon as any layer arrives,
+        # rather than only on the timer
+        self.publish_on_update = self.declare_parameter(
+            'publish_on_update', False).value
+
+        # Per-frame arrays are written in place into these buffers
+        self.buffers = BufferPool(COST_DTYPE)
+
+        # Each layer is converted once per message, then kept in a running sum
+        self.layers = LayerAccumulator(
+            ('steering', 'speed'), (COST_MAP_SIZE, COST_MAP_SIZE), COST_DTYPE)
+        self.layers.addLayer('current_occupancy', lambda msg: self.convertLayer(
+            'current_occupancy', msg, CURRENT_OCCUPANCY_SCALE, resize=True), ('steering', 'speed'))
+        self.layers.addLayer('future_occupancy', lambda msg: self.convertLayer(
+            'future_occupancy', msg, FUTURE_OCCUPANCY_SCALE, resize=True), ('steering', 'speed'))
+        self.layers.addLayer('drivable', lambda msg: self.convertLayer(
+            'drivable', msg, DRIVABLE_GRID_SCALE), ('steering',))
+        self.layers.addLayer('route_distance', lambda msg: self.convertLayer(
+            'route_distance', msg, ROUTE_DISTANCE_GRID_SCALE), ('steering',))
+        self.layers.addLayer('junction', lambda msg: self.convertLayer(
+            'junction', msg, JUNCTION_GRID_SCALE), ('speed',))
+
         self.clock_sub = self.create_subscription(
             Clock, '/clock', self.clockCb, 1)
 
@@ -102,6 +141,15 @@ class GridSummationNode(Node):
         self.ego_has_stopped = False
         self.last_stop_time = time.time()
 
+        # Geometry of our cost maps, matching the map manager's grids
+        self.cost_map_info = MapMetaData()
+        self.cost_map_info.width = COST_MAP_SIZE
+        self.cost_map_info.height = COST_MAP_SIZE
+        self.cost_map_info.resolution = COST_MAP_RES
+        self.cost_map_info.origin.position.x = COST_MAP_ORIGIN[0]
+        self.cost_map_info.origin.position.y = COST_MAP_ORIGIN[1]
+        self.resampler = GridResampler()
+
     def speedometerCb(self, msg: CarlaSpeedometer):
         self.speed = msg.speed
 
@@ -122,18 +170,27 @@ class GridSummationNode(Node):
 
     def currentOccupancyCb(self, msg: OccupancyGrid):
         self.current_occupancy_grid = msg
+        self.onLayerUpdate()
 
     def futureOccupancyCb(self, msg: OccupancyGrid):
         self.future_occupancy_grid = msg
+        self.onLayerUpdate()
 
     def drivableGridCb(self, msg: OccupancyGrid):
         self.drivable_grid = msg
+        self.onLayerUpdate()
 
     def junctionGridCb(self, msg: OccupancyGrid):
         self.junction_grid = msg
+        self.onLayerUpdate()
 
     def routeDistGridCb(self, msg: OccupancyGrid):
         self.route_dist_grid = msg
+        self.onLayerUpdate()
+
+    def onLayerUpdate(self):
+        if self.publish_on_update:
+            self.createCostMap()
 
     def checkForStaleness(self, grid: OccupancyGrid, status: DiagnosticStatus):
         stamp = self.current_occupancy_grid.header.stamp
@@ -148,126 +205,112 @@ class GridSummationNode(Node):
                 status.level = DiagnosticStatus.ERROR
                 status.message = "More than one layer was stale!"
 
-    def getWeightedArray(self, msg: OccupancyGrid, scale: float) -> np.ndarray:
+    def getWeightedArray(self, msg: OccupancyGrid, scale: float, out: np.ndarray = None) -> np.ndarray:
         """Converts the OccupancyGrid message into a numpy array, then multiplies it by scale
 
         Args:
             msg (OccupancyGrid)
             scale (float)
+            out (np.ndarray, optional): Array to write the result into.
+                Defaults to None (allocate a new COST_DTYPE array).
 
         Returns:
             np.ndarray: Weighted ndarray
         """
-        arr = np.asarray(msg.data, dtype=np.float16).reshape(
-            msg.info.height, msg.info.width)
+        arr = rnp.occupancy_grid.occupancy_grid_to_array(msg)
 
-        arr *= scale
+        if out is None:
+            out = np.empty(arr.shape, dtype=COST_DTYPE)
 
-        return arr
+        # Match the scale's dtype to the output, so no float64 temporaries are needed
+        return np.multiply(arr, out.dtype.type(scale), out=out)
 
-    def resizeOccupancyGrid(self, original: np.ndarray) -> np.ndarray:
-        # This is a temporary measure until our current occ. grid's params
-        # match the rest of our stack. Basically, due to the difference in cell size,
-        # 1 out of 6 cells in the array needs to be deleted.
+    def convertLayer(self, name: str, msg: OccupancyGrid, scale: float, resize=False) -> np.ndarray:
+        """Weight (and optionally resize) a layer into its buffer from the pool
 
-        downsampled = np.delete(original, np.arange(0, 128, 6), axis=0)
-        downsampled = np.delete(downsampled, np.arange(
-            0, 128, 6), axis=1)  # 106x106 result
+        Args:
+            name (str): Layer name, which names its buffers
+            msg (OccupancyGrid): The layer's message
+            scale (float): The layer's weight
+            resize (bool, optional): Resample the layer onto the cost map's geometry.
+                Defaults to False.
 
-        # trim the bottom columns (behind the car)
-        downsampled = downsampled[:, 3:]
+        Returns:
+            np.ndarray: The weighted layer
+        """
+        shape = (msg.info.height, msg.info.width)
+
+        if not resize:
+            return self.getWeightedArray(msg, scale, self.buffers.get(name, shape))
+
+        weighted = self.getWeightedArray(
+            msg, scale, self.buffers.get(f'{name}_weighted', shape))
+
+        return self.resizeOccupancyGrid(weighted, msg.info, self.buffers.get(
+            name, (COST_MAP_SIZE, COST_MAP_SIZE)))
 
-        background = np.zeros((151, 151))
+    def resizeOccupancyGrid(self, original: np.ndarray, info: MapMetaData, out: np.ndarray = None) -> np.ndarray:
+        """Resample a grid (such as the 128x128 current occupancy grid, whose
+        cells are 1/3 m) onto the cost map's 151x151, 0.4 m geometry.
 
-        background[22:128, 0:103] = downsampled
-        return background  # Correct scale
+        Args:
+            original (np.ndarray): Grid to resample
+            info (MapMetaData): The grid's geometry
+            out (np.ndarray, optional): Array to write the result into.
+                Defaults to None (allocate one).
+
+        Returns:
+            np.ndarray: The resampled grid
+        """
+        return self.resampler.resample(original, info, self.cost_map_info, out)
 
     def createCostMap(self):
         status = DiagnosticStatus()
         status.level = DiagnosticStatus.OK
         status.name = 'grid_summation'
 
-        steering_cost = np.zeros((151, 151))
-        speed_cost = np.zeros((151, 151))
-
-        # Calculate the weighted cost map layers
-
-        # 1. Current occupancy
-        stale = self.checkForStaleness(self.current_occupancy_grid, status)
-        empty = len(self.current_occupancy_grid.data) == 0
-
-        weighted_current_occ_arr = None
-
-        if not stale and not empty:
-            msg = self.current_occupancy_grid
-            weighted_current_occ_arr = self.getWeightedArray(
-                msg, CURRENT_OCCUPANCY_SCALE)
-            weighted_current_occ_arr = self.resizeOccupancyGrid(
-                weighted_current_occ_arr)
-            steering_cost += weighted_current_occ_arr
-            speed_cost += weighted_current_occ_arr
-
-        # 2. Future occupancy
-        stale = self.checkForStaleness(self.future_occupancy_grid, status)
-        empty = len(self.future_occupancy_grid.data) == 0
-
-        if not stale and not empty:
-            msg = self.future_occupancy_grid
-            weighted_future_occ_arr = self.getWeightedArray(
-                msg, FUTURE_OCCUPANCY_SCALE)
-            weighted_future_occ_arr = self.resizeOccupancyGrid(
-                weighted_future_occ_arr)
-            steering_cost += weighted_future_occ_arr
-            speed_cost += weighted_future_occ_arr
-
-        # 3. Drivable area
-        stale = self.checkForStaleness(self.drivable_grid, status)
-        empty = len(self.drivable_grid.data) == 0
-
-        if not stale and not empty:
-            msg = self.drivable_grid
-            weighted_drivable_arr = self.getWeightedArray(
-                msg, DRIVABLE_GRID_SCALE)
-            steering_cost += weighted_drivable_arr
-            # speed_cost += weighted_drivable_arr
-
-        # 4. Route distance
-        stale = self.checkForStaleness(self.route_dist_grid, status)
-        empty = len(self.route_dist_grid.data) == 0
-
-        if not stale and not empty:
-            msg = self.route_dist_grid
-            weighted_route_dist_arr = self.getWeightedArray(
-                msg, ROUTE_DISTANCE_GRID_SCALE)
-            steering_cost += weighted_route_dist_arr
-
-        # 5. Junctions
-        stale = self.checkForStaleness(self.junction_grid, status)
-        empty = len(self.junction_grid.data) == 0
-
-        if not stale and not empty and weighted_current_occ_arr is not None:
-            msg = self.junction_grid
-            weighted_junction_arr = self.getWeightedArray(
-                msg, JUNCTION_GRID_SCALE)
-
-            speed_cost += weighted_junction_arr
-
-        # Cap this to 100
-        steering_cost = np.clip(steering_cost, 0, 100)
-        speed_cost = np.clip(speed_cost, 0, 100)
+        # Update the weighted cost map layers. Only layers with
+        # a new message are converted again.
+        layers = [
+            ('current_occupancy', self.current_occupancy_grid),
+            ('future_occupancy', self.future_occupancy_grid),
+            ('drivable', self.drivable_grid),
+            ('route_distance', self.route_dist_grid),
+            ('junction', self.junction_grid)
+        ]
+
+        for name, grid in layers:
+            stale = self.checkForStaleness(grid, status)
+            empty = len(grid.data) == 0
+            active = not stale and not empty
+
+            # Junctions only count if we can see the current occupancy
+            if name == 'junction':
+                active = active and self.layers.isActive('current_occupancy')
+
+            self.layers.update(name, grid, active)
+
+        # Cap this to 100, converting straight to int8 for publishing
+        steering_cost = np.clip(self.layers.sums['steering'], 0, 100, casting='unsafe',
+                                out=self.buffers.get('steering_cost', self.layers.sums['steering'].shape, np.int8))
+        speed_cost = np.clip(self.layers.sums['speed'], 0, 100, casting='unsafe',
+                             out=self.buffers.get('speed_cost', self.layers.sums['speed'].shape, np.int8))
 
         # plt.show()
 
         # Publish as an OccupancyGrid
         result_msg = OccupancyGrid()
 
-        result_msg.data = steering_cost.astype(np.int8).flatten().tolist()
+        result_msg.data = rnp.occupancy_grid.array_to_occupancy_grid_data(
+            steering_cost)
         result_msg.info = self.drivable_grid.info
-        result_msg.header = self.drivable_grid.header
+        # Copy the header, since the Egma loop below modifies its stamp
+        result_msg.header = copy.deepcopy(self.drivable_grid.header)
 
         self.steering_cost_pub.publish(result_msg)
 
-        result_msg.data = speed_cost.astype(np.int8).flatten().tolist()
+        result_msg.data = rnp.occupancy_grid.array_to_occupancy_grid_data(
+            speed_cost)
         self.speed_cost_pub.publish(result_msg)
 
         egma_msg = Egma()
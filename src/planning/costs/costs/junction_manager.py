@@ -21,7 +21,6 @@ Publisher:
 
 '''
 
-from array import array as Array
 import rclpy
 import ros2_numpy as rnp
 import numpy as np
@@ -33,13 +32,20 @@ from tf2_ros.transform_listener import TransformListener
 # Message definitions
 from carla_msgs.msg import CarlaSpeedometer
 from diagnostic_msgs.msg import DiagnosticStatus
-from nav_msgs.msg import OccupancyGrid
+from nav_msgs.msg import MapMetaData, OccupancyGrid
 from rosgraph_msgs.msg import Clock
 
-import matplotlib.pyplot as plt
 
 from skimage.morphology import binary_erosion, square
 
+from .buffer_pool import BufferPool
+from .grid_resampler import GridResampler
+
+# Cost map geometry, as in grid_summation_node
+COST_MAP_SIZE = 151
+COST_MAP_RES = 0.4
+COST_MAP_ORIGIN = (-20.0, -30.0)
+
 
 class JunctionManager(Node):
 
@@ -55,6 +61,18 @@ class JunctionManager(Node):
         self.last_stop_time = 0.0
         self.last_in_junction_time = 0.0
 
+        # Geometry of our cost maps, matching the map manager's grids
+        self.cost_map_info = MapMetaData()
+        self.cost_map_info.width = COST_MAP_SIZE
+        self.cost_map_info.height = COST_MAP_SIZE
+        self.cost_map_info.resolution = COST_MAP_RES
+        self.cost_map_info.origin.position.x = COST_MAP_ORIGIN[0]
+        self.cost_map_info.origin.position.y = COST_MAP_ORIGIN[1]
+        self.resampler = GridResampler()
+
+        # Per-message grids are written in place into these buffers
+        self.buffers = BufferPool()
+
         # Subscriptions and publishers
         self.current_occupancy_sub = self.create_subscription(
             OccupancyGrid, '/grid/occupancy/current', self.currentOccupancyCb, 1)
@@ -80,31 +98,16 @@ class JunctionManager(Node):
     def clockCb(self, msg: Clock):
         self.time_sec = msg.clock.sec + msg.clock.nanosec * 1e-9
 
-    def resizeOccupancyGrid(self, original: np.ndarray) -> np.ndarray:
-        # This is a temporary measure until our current occ. grid's params
-        # match the rest of our stack. Basically, due to the difference in cell size,
-        # 1 out of 6 cells in the array needs to be deleted.
-
-        downsampled = np.delete(original, np.arange(0, 128, 6), axis=0)
-        downsampled = np.delete(downsampled, np.arange(
-            0, 128, 6), axis=1)  # 106x106 result
-
-        # trim the bottom columns (behind the car)
-        downsampled = downsampled[:, 3:]
-
-        background = np.zeros((151, 151))
-
-        background[22:128, 0:103] = downsampled
-        return background  # Correct scale
-
     def currentOccupancyCb(self, msg: OccupancyGrid):
-        occupancy_grid = np.asarray(msg.data,
-                                    dtype=np.int8).reshape(msg.info.height, msg.info.width)
+        occupancy_grid = rnp.occupancy_grid.occupancy_grid_to_array(msg)
 
-        occupancy_grid = self.resizeOccupancyGrid(occupancy_grid)
+        shape = (COST_MAP_SIZE, COST_MAP_SIZE)
+        occupancy_grid = self.resizeOccupancyGrid(
+            occupancy_grid, msg.info, self.buffers.get('occupancy', shape, np.int8))
 
         # This creates a binary array, where each cell is simply "is occupied" or "is not occupied"
-        self.current_occupancy_grid = occupancy_grid > 80.0
+        self.current_occupancy_grid = np.greater(
+            occupancy_grid, 80, out=self.buffers.get('occupied', shape, bool))
 
     def junctionIsOccupied(self, occupancy, junction) -> bool:
         # Erode the occupancy grid slightly.
@@ -190,19 +193,23 @@ class JunctionManager(Node):
 
     def junctionGridCb(self, msg: OccupancyGrid):
 
+        shape = (msg.info.height, msg.info.width)
+
         # The "> 0 " makes this an efficient binary grid
-        junction_grid = np.asarray(msg.data,
-                                   dtype=np.int8).reshape(msg.info.height, msg.info.width) > 0
+        junction_grid = np.greater(rnp.occupancy_grid.occupancy_grid_to_array(msg), 0,
+                                   out=self.buffers.get('junction', shape, bool))
 
-        stateful_junction_grid = np.zeros((msg.info.height, msg.info.width))
+        stateful_junction_grid = self.buffers.get(
+            'stateful_junction', shape, np.int8)
+        stateful_junction_grid.fill(0)
 
         # If the ego cannot enter, set the stateful grid to include the junction cost
         if not self.egoCanEnter(self.speed, self.current_occupancy_grid, junction_grid):
-            stateful_junction_grid = junction_grid.astype(np.int8)*100
+            np.multiply(junction_grid, 100, out=stateful_junction_grid)
 
         stateful_msg = OccupancyGrid()
-        stateful_msg.data = Array(
-            'b', stateful_junction_grid.ravel().astype(np.int8))
+        stateful_msg.data = rnp.occupancy_grid.array_to_occupancy_grid_data(
+            stateful_junction_grid)
         stateful_msg.info = msg.info
         stateful_msg.header = msg.header
         self.stateful_grid_pub.publish(stateful_msg)
@@ -220,29 +227,27 @@ class JunctionManager(Node):
         Returns:
             np.ndarray: Weighted ndarray
         """
-        arr = np.asarray(msg.data, dtype=np.float16).reshape(
-            msg.info.height, msg.info.width)
+        arr = rnp.occupancy_grid.occupancy_grid_to_array(
+            msg).astype(np.float16)
 
         arr *= scale
 
         return arr
 
-    def resizeOccupancyGrid(self, original: np.ndarray) -> np.ndarray:
-        # This is a temporary measure until our current occ. grid's params
-        # match the rest of our stack. Basically, due to the difference in cell size,
-        # 1 out of 6 cells in the array needs to be deleted.
-
-        downsampled = np.delete(original, np.arange(0, 128, 6), axis=0)
-        downsampled = np.delete(downsampled, np.arange(
-            0, 128, 6), axis=1)  # 106x106 result
-
-        # trim the bottom columns (behind the car)
-        downsampled = downsampled[:, 3:]
+    def resizeOccupancyGrid(self, original: np.ndarray, info: MapMetaData, out: np.ndarray = None) -> np.ndarray:
+        """Resample a grid (such as the 128x128 current occupancy grid, whose
+        cells are 1/3 m) onto the cost map's 151x151, 0.4 m geometry.
 
-        background = np.zeros((151, 151))
+        Args:
+            original (np.ndarray): Grid to resample
+            info (MapMetaData): The grid's geometry
+            out (np.ndarray, optional): Array to write the result into.
+                Defaults to None (allocate one).
 
-        background[22:128, 0:103] = downsampled
-        return background  # Correct scale
+        Returns:
+            np.ndarray: The resampled grid
+        """
+        return self.resampler.resample(original, info, self.cost_map_info, out)
 
 
 def main(args=None):
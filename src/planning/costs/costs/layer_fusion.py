@@ -0,0 +1,111 @@
+'''
+Package: costs
+   File: layer_fusion.py
+ Author: Will Heitman (w at heit dot mn)
+
+Incremental weighted sum of cost map layers.
+
+Each layer's message is converted (weighted, resized, etc.) only when a new
+message arrives, and the result is cached along with the message's stamp.
+The fused cost maps are kept as running sums: when a layer changes, its old
+contribution is subtracted and the new one is added. Layers that have not
+changed cost nothing.
+'''
+
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+
+
+@dataclass
+class CachedLayer:
+    convert: Callable  # OccupancyGrid -> np.ndarray
+    targets: tuple  # Names of the sums that this layer contributes to
+    msg: object = None  # Message that `array` was computed from
+    stamp: tuple = None  # (sec, nanosec) of msg
+    array: np.ndarray = None  # Current contribution, or None if inactive
+
+
+def getStamp(msg) -> tuple:
+    stamp = msg.header.stamp
+    return (stamp.sec, stamp.nanosec)
+
+
+class LayerAccumulator:
+
+    def __init__(self, targets=('steering', 'speed'), shape=(151, 151), dtype=np.float64):
+        """Keep running sums of cost map layers.
+
+        Args:
+            targets (tuple, optional): Names of the sums to keep.
+                Defaults to ('steering', 'speed').
+            shape (tuple, optional): Shape of each sum. Defaults to (151, 151).
+            dtype (optional): dtype of the sums. Defaults to np.float64.
+        """
+        self.sums = {target: np.zeros(shape, dtype=dtype) for target in targets}
+        self.layers = {}
+
+    def addLayer(self, name: str, convert: Callable, targets: tuple):
+        """Register a layer.
+
+        Args:
+            name (str): Layer name, used with update()
+            convert (Callable): Turns the layer's message into its weighted array
+            targets (tuple): Names of the sums that this layer is added to
+        """
+        self.layers[name] = CachedLayer(convert, tuple(targets))
+
+    def update(self, name: str, msg, active=True) -> bool:
+        """Bring a layer's contribution up to date.
+
+        The message is only converted if it differs from the cached one.
+        The old contribution is subtracted before converting, so convert
+        may reuse the layer's previous array as its output buffer.
+
+        Args:
+            name (str): Layer name
+            msg (OccupancyGrid): Latest message for this layer
+            active (bool, optional): Whether the layer should be included
+                (e.g. False if it is stale or empty). Defaults to True.
+
+        Returns:
+            bool: True if the sums changed
+        """
+        layer = self.layers[name]
+
+        if not active:
+            if layer.array is None:
+                return False
+
+            self.remove(layer)
+            return True
+
+        stamp = getStamp(msg)
+        if layer.array is not None and layer.msg is msg and layer.stamp == stamp:
+            return False  # Cached
+
+        if layer.array is not None:
+            self.remove(layer)
+
+        array = layer.convert(msg)
+
+        for target in layer.targets:
+            self.sums[target] += array
+
+        layer.msg = msg
+        layer.stamp = stamp
+        layer.array = array
+        return True
+
+    def remove(self, layer: CachedLayer):
+        """Subtract a layer's contribution from the sums"""
+        for target in layer.targets:
+            self.sums[target] -= layer.array
+
+        layer.msg = None
+        layer.stamp = None
+        layer.array = None
+
+    def isActive(self, name: str) -> bool:
+        return self.layers[name].array is not None
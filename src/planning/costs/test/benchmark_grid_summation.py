@@ -0,0 +1,93 @@
+'''
+Benchmark for GridSummationNode.createCostMap.
+
+Feeds the node synthetic layers and reports, per tick, the latency and the
+peak memory allocated by temporaries during the tick. Two cases are run:
+every layer refreshed before each tick (worst case), and no layer refreshed.
+
+Usage: python3 benchmark_grid_summation.py
+'''
+
+import time
+import tracemalloc
+
+import numpy as np
+import rclpy
+import ros2_numpy as rnp
+from nav_msgs.msg import OccupancyGrid
+
+from costs.grid_summation_node import GridSummationNode
+
+TICKS = 100
+
+
+def makeGrid(arr: np.ndarray, res: float, origin: tuple, stamp: float) -> OccupancyGrid:
+    msg = OccupancyGrid()
+    msg.info.height, msg.info.width = arr.shape
+    msg.info.resolution = res
+    msg.info.origin.position.x, msg.info.origin.position.y = origin
+    msg.data = rnp.occupancy_grid.array_to_occupancy_grid_data(arr)
+    msg.header.stamp.sec = int(stamp)
+    msg.header.stamp.nanosec = int(stamp % 1 * 1e9)
+    return msg
+
+
+def feedLayers(node: GridSummationNode, rng: np.random.Generator, stamp: float):
+    occupancy = (1. / 3., (-64.0 / 3., -64.0 / 3.))
+    cost_map = (0.4, (-20.0, -30.0))
+
+    node.currentOccupancyCb(makeGrid(rng.integers(
+        -1, 101, (128, 128), dtype=np.int8), *occupancy, stamp))
+    node.futureOccupancyCb(makeGrid(rng.integers(
+        0, 30, (128, 128), dtype=np.int8), *occupancy, stamp))
+    node.drivableGridCb(makeGrid(rng.integers(
+        0, 60, (151, 151), dtype=np.int8), *cost_map, stamp))
+    node.routeDistGridCb(makeGrid(rng.integers(
+        0, 40, (151, 151), dtype=np.int8), *cost_map, stamp))
+    node.junctionGridCb(makeGrid(rng.integers(
+        0, 2, (151, 151), dtype=np.int8) * 100, *cost_map, stamp))
+
+
+def runTicks(node: GridSummationNode, refresh: bool, trace: bool) -> float:
+    """Return the median latency (or, if tracing, peak temporary memory) per tick"""
+    rng = np.random.default_rng(0)
+    results = []
+
+    for tick in range(TICKS):
+        if refresh or tick == 0:
+            feedLayers(node, rng, 100.0 + tick * 0.2)
+
+        if trace:
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            node.createCostMap()
+            results.append(tracemalloc.get_traced_memory()[1] - baseline)
+        else:
+            start = time.perf_counter()
+            node.createCostMap()
+            results.append(time.perf_counter() - start)
+
+    return np.median(results)
+
+
+def main():
+    rclpy.init()
+    node = GridSummationNode()
+
+    for name, refresh in (('all layers new', True), ('no layers new', False)):
+        latency = runTicks(node, refresh, trace=False)
+
+        # Tracing slows everything down, so it gets its own run
+        tracemalloc.start()
+        peak = runTicks(node, refresh, trace=True)
+        tracemalloc.stop()
+
+        print(f"{name:<16} {latency * 1e3:7.3f} ms per tick, "
+              f"{peak / 1024:8.1f} KiB of temporaries")
+
+    node.destroy_node()
+    rclpy.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+import unittest
+
+import numpy as np
+
+from costs.buffer_pool import BufferPool, COST_DTYPE
+
+
+class TestBufferPool(unittest.TestCase):
+    def test_buffers_are_reused(self):
+        pool = BufferPool()
+        first = pool.get('steering', (151, 151))
+        first[0, 0] = 5
+
+        second = pool.get('steering', (151, 151))
+
+        self.assertIs(first, second)
+        self.assertEqual(second[0, 0], 5)
+        self.assertEqual(second.dtype, COST_DTYPE)
+        self.assertEqual(pool.allocations, 1)
+
+    def test_shape_or_dtype_change_reallocates(self):
+        pool = BufferPool()
+        pool.get('layer', (128, 128))
+        pool.get('layer', (151, 151))
+        pool.get('layer', (151, 151), np.int8)
+        pool.get('other', (151, 151), np.int8)
+
+        self.assertEqual(pool.allocations, 4)
+        self.assertEqual(pool.getBytes(), 2 * 151 * 151)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from costs.grid_resampler import GridResampler
+
+
+def make_info(size: int, res: float, origin_x: float, origin_y: float):
+    position = SimpleNamespace(x=origin_x, y=origin_y, z=0.0)
+    return SimpleNamespace(width=size, height=size, resolution=res,
+                           origin=SimpleNamespace(position=position))
+
+
+# Resolutions arrive as float32 in MapMetaData
+OCCUPANCY_INFO = make_info(128, float(np.float32(1. / 3.)),
+                           -64.0 * (1. / 3.), -64.0 * (1. / 3.))
+COST_MAP_INFO = make_info(151, 0.4, -20.0, -30.0)
+
+
+def legacy_resize(original: np.ndarray) -> np.ndarray:
+    """The hard-coded 128 -> 151 conversion that GridResampler replaced"""
+    downsampled = np.delete(original, np.arange(0, 128, 6), axis=0)
+    downsampled = np.delete(downsampled, np.arange(0, 128, 6), axis=1)
+    downsampled = downsampled[:, 3:]
+
+    background = np.zeros((151, 151))
+    background[22:128, 0:103] = downsampled
+    return background
+
+
+class TestGridResampler(unittest.TestCase):
+    def test_matches_legacy_resize(self):
+        resampler = GridResampler()
+        original = np.random.randint(-1, 101, size=(128, 128)).astype(np.int8)
+
+        np.testing.assert_equal(
+            resampler.resample(original, OCCUPANCY_INFO, COST_MAP_INFO),
+            legacy_resize(original))
+
+    def test_identity(self):
+        resampler = GridResampler()
+        original = np.random.randint(0, 100, size=(151, 151))
+
+        np.testing.assert_equal(
+            resampler.resample(original, COST_MAP_INFO, COST_MAP_INFO), original)
+
+    def test_shift_and_fill(self):
+        resampler = GridResampler(fill_value=-1)
+        original = np.arange(16).reshape(4, 4)
+        source = make_info(4, 1.0, 0.0, 0.0)
+        target = make_info(4, 1.0, 1.0, 2.0)  # One column right, two rows up
+
+        resampled = resampler.resample(original, source, target)
+
+        np.testing.assert_equal(resampled[:2, :3], original[2:, 1:])
+        np.testing.assert_equal(resampled[2:], -1)
+        np.testing.assert_equal(resampled[:, 3], -1)
+
+    def test_index_maps_are_cached(self):
+        resampler = GridResampler()
+        out = np.empty((151, 151), dtype=np.int8)
+
+        for _ in range(3):
+            original = np.random.randint(0, 100, size=(128, 128)).astype(np.int8)
+            result = resampler.resample(
+                original, OCCUPANCY_INFO, COST_MAP_INFO, out=out)
+
+        self.assertIs(result, out)
+        self.assertEqual(len(resampler.index_maps), 1)
+        np.testing.assert_equal(out, legacy_resize(original))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+from types import SimpleNamespace
+
+import numpy as np
+
+from costs.layer_fusion import LayerAccumulator
+
+
+def make_msg(value: int, sec: int):
+    stamp = SimpleNamespace(sec=sec, nanosec=0)
+    return SimpleNamespace(header=SimpleNamespace(stamp=stamp), value=value)
+
+
+class TestLayerAccumulator(unittest.TestCase):
+    def setUp(self):
+        self.conversions = 0
+        self.layers = LayerAccumulator(('steering', 'speed'), (4, 4))
+        self.layers.addLayer('a', self.convert, ('steering', 'speed'))
+        self.layers.addLayer('b', lambda msg: self.convert(msg) * 3, ('steering',))
+
+    def convert(self, msg) -> np.ndarray:
+        self.conversions += 1
+        return np.full((4, 4), msg.value, dtype=np.float16)
+
+    def test_sums(self):
+        self.layers.update('a', make_msg(2, sec=1))
+        self.layers.update('b', make_msg(5, sec=1))
+
+        np.testing.assert_equal(self.layers.sums['steering'], 17)
+        np.testing.assert_equal(self.layers.sums['speed'], 2)
+
+    def test_unchanged_layers_are_cached(self):
+        msg = make_msg(2, sec=1)
+        self.assertTrue(self.layers.update('a', msg))
+        self.assertFalse(self.layers.update('a', msg))
+        self.assertEqual(self.conversions, 1)
+
+        # Same message object, but restamped
+        msg.header.stamp.sec = 2
+        self.assertTrue(self.layers.update('a', msg))
+        self.assertEqual(self.conversions, 2)
+        np.testing.assert_equal(self.layers.sums['steering'], 2)
+
+    def test_replace_and_remove(self):
+        self.layers.update('a', make_msg(2, sec=1))
+        self.layers.update('b', make_msg(5, sec=1))
+        self.layers.update('a', make_msg(7, sec=2))
+
+        np.testing.assert_equal(self.layers.sums['steering'], 22)
+        np.testing.assert_equal(self.layers.sums['speed'], 7)
+
+        self.assertTrue(self.layers.update('b', None, active=False))
+        self.assertFalse(self.layers.update('b', None, active=False))
+        self.assertFalse(self.layers.isActive('b'))
+        np.testing.assert_equal(self.layers.sums['steering'], 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+'''
+Package:   rtp
+Filename:  barrier.py
+Author:    Will Heitman (w at heit.mn)
+
+Batched barrier check for candidate paths
+
+For every pose of every path, a line of cells is swept perpendicular to the
+path, one car-width wide. The first pose whose line touches a high-cost cell
+is that path's "barrier".
+
+This is a vectorized version of RecursiveTreePlanner.getBarrierIndex. Rather
+than calling skimage.draw.line once per pose, the same Bresenham lines are
+traced for all poses at once. The sweep is at most a few cells long, so this
+takes only a handful of array operations in total.
+'''
+
+import numpy as np
+
+GRID_RES = 0.4  # meters per cell
+BARRIER_COST = 90  # Cells above this cost are barriers
+
+
+def getBarrierIndices(poses: np.ndarray, costmap: np.ndarray, width_meters=1.8) -> np.ndarray:
+    """Given paths, perform a basic collision check and return the pose index
+    for the first pose of each path that fails the check (such as the pose that
+    hits a vehicle, goes offroad, enters an intersection, etc).
+
+    Args:
+        poses (np.ndarray): (N, P, 3) poses [x, y, heading] for N paths
+        costmap (np.ndarray): Cost map to use for the check
+        width_meters (float, optional): Width of the swept line. Defaults to 1.8.
+
+    Returns:
+        np.ndarray: (N,) index of the first failing pose of each path,
+        or P-1 if the whole path passes
+    """
+    poses = np.asarray(poses)
+
+    # This is the number of cells to extend to either side of the path
+    # It's the full width (in cells) divided by two, rounded up
+    REACH_CELLS = np.ceil(width_meters / GRID_RES / 2)  # = 3
+
+    theta = poses[..., 2] + np.pi/2
+
+    # Endpoints of the line, truncated to int8 like getBarrierIndex
+    c0 = (np.cos(theta) * REACH_CELLS +
+          poses[..., 0]).astype(np.int8).astype(int)
+    r0 = (np.sin(theta) * REACH_CELLS +
+          poses[..., 1]).astype(np.int8).astype(int)
+    c1 = (np.cos(theta) * REACH_CELLS * -1 +
+          poses[..., 0]).astype(np.int8).astype(int)
+    r1 = (np.sin(theta) * REACH_CELLS * -1 +
+          poses[..., 1]).astype(np.int8).astype(int)
+
+    fails = costmap[r1, c1] > BARRIER_COST  # skimage always ends on (r1, c1)
+
+    # Bresenham's line algorithm, as in skimage.draw.line. For steep lines,
+    # rows and columns are swapped so that "major" always advances by one.
+    steep = np.abs(r1 - r0) > np.abs(c1 - c0)
+    major = np.where(steep, r0, c0)
+    minor = np.where(steep, c0, r0)
+    major_step = np.where(steep, np.where(r1 - r0 > 0, 1, -1),
+                          np.where(c1 - c0 > 0, 1, -1))
+    minor_step = np.where(steep, np.where(c1 - c0 > 0, 1, -1),
+                          np.where(r1 - r0 > 0, 1, -1))
+    major_len = np.maximum(np.abs(r1 - r0), np.abs(c1 - c0))
+    minor_len = np.minimum(np.abs(r1 - r0), np.abs(c1 - c0))
+    error = 2 * minor_len - major_len
+
+    for i in range(np.max(major_len, initial=0)):
+        on_line = i < major_len
+        rows = np.where(on_line, np.where(steep, major, minor), r1)
+        cols = np.where(on_line, np.where(steep, minor, major), c1)
+        fails |= costmap[rows, cols] > BARRIER_COST
+
+        # minor_len <= major_len, so the error needs at most one correction
+        correct = error >= 0
+        minor = np.where(correct, minor + minor_step, minor)
+        error = np.where(correct, error - 2 * major_len, error)
+        major = major + major_step
+        error = error + 2 * minor_len
+
+    return np.where(np.any(fails, axis=1), np.argmax(fails, axis=1), poses.shape[1] - 1)
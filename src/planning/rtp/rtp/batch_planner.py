@@ -0,0 +1,447 @@
+'''
+Package:   rtp
+Filename:  batch_planner.py
+Author:    Will Heitman (w at heit.mn)
+
+Batched (breadth-first) engine for the recursive tree planner
+
+Rather than walking the tree one branch and one step at a time, every branch
+of a depth level is evaluated at once:
+
+- The tree's poses and cell indices come from a precomputed lattice
+  (see lattice.py), so they are never recomputed per frame
+- Costs are gathered from the cost map with fancy indexing
+- Branches that touch a cell above the cost cutoff are dropped with a mask
+
+search() adds branch-and-bound on top of this. It keeps the running best
+leaf cost and abandons any branch whose accumulated cost, plus a lower bound
+on the cost still to come, already exceeds it. The lower bound comes from a
+min-pooled pyramid of the cost map: a branch's remaining steps can cost no
+less than the cheapest cell in the bounding box of its subtree.
+
+Leaves come out in the same order that the recursion visits them, so the
+least-cost path (including how ties are broken) matches RecursiveTreePlanner.
+
+Consecutive cost maps are similar, so search() can also be warm-started from
+the previous cycle's path. The branches around it are searched first, which
+usually gives a tight bound before the rest of the tree is explored.
+'''
+
+from dataclasses import dataclass
+import time
+
+import numpy as np
+
+from .lattice import PrimitiveLattice
+
+# Leaves are penalized (e.g. barrier proximity) in chunks of this size,
+# cheapest first, so that expensive leaves can still be skipped.
+PENALTY_CHUNK_SIZE = 256
+
+# With a deadline, parents are expanded in chunks of this size
+# so that the deadline can be checked in between.
+EXPANSION_CHUNK_SIZE = 128
+
+# Steering angle strides for the anytime search's passes, coarse to fine
+COARSE_TO_FINE_STRIDES = [4, 2, 1]
+
+# A warm start searches this many steering angles to either side of the
+# previous path, at every level
+WARM_START_SPREAD = 2
+
+
+@dataclass
+class SearchStats:
+    expansions: int = 0  # Nodes whose cost was evaluated
+    depth: int = 0  # Levels in the returned path
+    stride: int = 0  # Finest steering stride that was fully searched (1 = all)
+    timed_out: bool = False
+    warm_started: bool = False  # The seed path gave a better initial bound than the dive
+
+
+def getRank(best: tuple) -> tuple:
+    """Order (cost, node) pairs by cost, then by the recursion's order"""
+    cost, node = best
+    return (cost, np.inf if node is None else node)
+
+
+def getStrideBranches(num_branches: int, stride: int) -> np.ndarray:
+    """Every `stride`th branch index, counting out from the straightest one"""
+    branches = np.arange(num_branches)
+    return branches[(branches - num_branches // 2) % stride == 0]
+
+
+def getMinPyramid(costmap: np.ndarray) -> list:
+    """Min-pool the cost map into a pyramid.
+
+    Level p holds the minimum of each 2^p x 2^p block of the cost map.
+    Odd edges are padded by repeating the last row/column, which leaves
+    every block's minimum unchanged.
+
+    Args:
+        costmap (np.ndarray): Cost map, row-major (y first)
+
+    Returns:
+        list: Pyramid levels, starting with the cost map itself
+    """
+    pyramid = [costmap]
+    while max(pyramid[-1].shape) > 1:
+        previous = pyramid[-1]
+        padded = np.pad(previous, ((0, previous.shape[0] % 2),
+                                   (0, previous.shape[1] % 2)), mode='edge')
+        height, width = padded.shape
+        pyramid.append(padded.reshape(
+            height // 2, 2, width // 2, 2).min(axis=(1, 3)))
+
+    return pyramid
+
+
+def getBoxMinimums(pyramid: list, boxes: np.ndarray) -> np.ndarray:
+    """Lower-bound the cheapest cell within each box.
+
+    Each box is looked up on the first pyramid level whose blocks are at
+    least as large as the box, where it is covered by at most 2x2 blocks.
+    The result is the minimum of a superset of the box, so it never exceeds
+    the box's true minimum.
+
+    Args:
+        pyramid (list): Levels from getMinPyramid
+        boxes (np.ndarray): (N, 4) boxes [row_min, row_max, col_min, col_max],
+            all within the cost map
+
+    Returns:
+        np.ndarray: (N,) lower bounds
+    """
+    sizes = np.maximum(boxes[:, 1] - boxes[:, 0], boxes[:, 3] - boxes[:, 2]) + 1
+    levels = np.minimum(np.ceil(np.log2(sizes)).astype(int), len(pyramid) - 1)
+
+    minimums = np.empty(len(boxes), dtype=np.int64)
+    for level in np.unique(levels):
+        selected = levels == level
+        blocks = boxes[selected] >> level
+        grid = pyramid[level]
+        minimums[selected] = np.minimum.reduce((grid[blocks[:, 0], blocks[:, 2]],
+                                                grid[blocks[:, 0], blocks[:, 3]],
+                                                grid[blocks[:, 1], blocks[:, 2]],
+                                                grid[blocks[:, 1], blocks[:, 3]]))
+
+    return minimums
+
+
+class BatchTreePlanner:
+
+    def __init__(self, origin=(50., 75.), max_turn_angle=0.30, segment_length=9.0,
+                 depth=7, branches=7, res=1.0, cost_cutoff=90, lattice_path=None):
+        """Create the planner and build (or load) its lattice.
+
+        Args:
+            lattice_path (str, optional): .npz file to cache the lattice in.
+                Defaults to None, which builds the lattice in memory.
+        """
+        self.cost_cutoff = cost_cutoff
+        self.stats = SearchStats()  # From the last search
+        self.partial = None  # Deepest (level, nodes, costs) reached by the last search
+        self.lattice = PrimitiveLattice.loadOrBuild(
+            lattice_path, origin=origin, max_turn_angle=max_turn_angle,
+            segment_length=segment_length, depth=depth, branches=branches, res=res)
+
+    def plan(self, costmap: np.ndarray) -> tuple:
+        """Evaluate the whole tree over the cost map, one depth level at a time.
+
+        Args:
+            costmap (np.ndarray): Cost map, row-major (y first)
+
+        Returns:
+            tuple: (leaves, costs), where leaves is an (N,) array of lattice
+            leaf indices and costs is an (N,) array of their summed costs.
+            Both are empty if every branch was cut off. Use getPoses() to
+            turn leaves into poses.
+        """
+        lattice = self.lattice
+        alive = np.ones(1, dtype=bool)
+        costs = np.zeros(1, dtype=np.int64)
+
+        for level in range(lattice.depth):
+            parents = lattice.parents[level]
+            segment_costs = costmap[lattice.rows[level], lattice.cols[level]]
+
+            # Early cutoff: a branch dies if it touches a high-cost cell
+            # or if its parent already died.
+            alive = alive[parents] & np.all(
+                segment_costs <= self.cost_cutoff, axis=1)
+            costs = costs[parents] + segment_costs.sum(axis=1, dtype=np.int64)
+
+        leaves = np.flatnonzero(alive)
+
+        return leaves, costs[leaves]
+
+    def search(self, costmap: np.ndarray, leaf_penalty=None, time_budget: float = None,
+               seed_path: np.ndarray = None, switch_cost: int = 0) -> tuple:
+        """Find the least-cost leaf with branch-and-bound.
+
+        1. Get an initial upper bound on the best cost by diving greedily to a
+           leaf, and by searching the branches around the seed path (if any).
+        2. Expand the tree one level at a time, dropping branches that hit the
+           cost cutoff or whose bound already exceeds the best cost.
+        3. Penalize the surviving leaves cheapest-first, tightening the best
+           cost as we go, and keep the cheapest one.
+
+        Branches are only dropped when their bound is strictly greater than
+        the best cost, so every optimal leaf survives and ties are broken
+        in the recursion's order, exactly like plan().
+
+        With a time budget, this becomes an anytime search. Steps 2-3 are
+        repeated coarse-to-fine, first over every 4th steering angle, then
+        every 2nd, then all of them. Each pass starts from the best cost found
+        so far, so the finer passes prune harder. When the deadline hits, the
+        best path found so far is returned. Step 1 always finishes, so this
+        is only a partial path (from the deepest level reached) if step 1
+        was blocked and no later pass reached a leaf in time.
+
+        Args:
+            costmap (np.ndarray): Cost map, row-major (y first)
+            leaf_penalty (callable, optional): Maps (N,) leaf indices to (N,)
+                non-negative extra costs, such as barrier proximity.
+            time_budget (float, optional): Wall-clock budget, in seconds.
+                Defaults to None (search to completion).
+            seed_path (np.ndarray, optional): (P, 2) [x, y] cells of a path to
+                warm-start from, such as the previous best path after shifting
+                it by ego motion. Defaults to None (no warm start).
+            switch_cost (int, optional): Keep the best leaf near the seed path
+                unless another leaf is cheaper by more than this. Defaults to 0,
+                which always returns the least-cost leaf.
+
+        Returns:
+            tuple: (node, cost) of the best path, or (None, None) if every
+            branch was cut off. self.stats.depth gives the number of levels
+            in the path (usually the full depth).
+        """
+        self.stats = SearchStats()
+        deadline = None
+        if time_budget:
+            deadline = time.perf_counter() + time_budget
+
+        pyramid = getMinPyramid(costmap)
+        self.partial = None
+
+        seed_best = (np.inf, None)
+        if seed_path is not None and len(seed_path) > 0:
+            seed_best = self.searchPass(costmap, pyramid, self.getSeedBranches(seed_path),
+                                        seed_best, leaf_penalty)
+
+        best = self.dive(costmap, pyramid, leaf_penalty)
+        if getRank(seed_best) < getRank(best):
+            self.stats.warm_started = True
+            best = seed_best
+
+        strides = COARSE_TO_FINE_STRIDES if deadline is not None else [1]
+        for stride in strides:
+            if self.stats.timed_out:
+                break
+
+            branch_sets = [getStrideBranches(num_branches, stride)
+                           for num_branches in self.lattice.branch_counts]
+            result = self.searchPass(
+                costmap, pyramid, branch_sets, best, leaf_penalty, deadline)
+            if result is None:
+                self.stats.timed_out = True
+                break
+
+            best = result
+            if not self.stats.timed_out:
+                self.stats.stride = stride
+
+        # Hysteresis: only leave the seed path's neighborhood for a clear improvement
+        if switch_cost > 0 and seed_best[1] is not None and seed_best[0] <= best[0] + switch_cost:
+            best = seed_best
+
+        best_cost, best_node = best
+        if best_node is not None:
+            self.stats.depth = self.lattice.depth
+            return best_node, best_cost
+
+        if self.partial is None or not self.stats.timed_out:
+            return None, None
+
+        # Timed out before reaching any leaf. Fall back to the deepest partial path.
+        level, nodes, costs = self.partial
+        best_idx = np.argmin(
+            costs + self.getLowerBounds(pyramid, level, nodes))
+        self.stats.depth = level + 1
+        return nodes[best_idx], costs[best_idx]
+
+    def getSeedBranches(self, seed_path: np.ndarray) -> list:
+        """Find the lattice leaf that best follows the seed path, and return
+        the branches within WARM_START_SPREAD of it on every level.
+
+        The leaf is matched greedily, from the root down: on each level, take
+        the child whose end pose lies closest to the seed path.
+
+        Args:
+            seed_path (np.ndarray): (P, 2) [x, y] cells
+
+        Returns:
+            list: Per level, an array of branch indices
+        """
+        lattice = self.lattice
+        seed_path = np.asarray(seed_path, dtype=float)[:, :2]
+
+        branch_sets = []
+        node = 0
+        for level, num_branches in enumerate(lattice.branch_counts):
+            children = node * num_branches + np.arange(num_branches)
+            ends = lattice.end_poses[level][children, :2]
+            distances = np.min(np.linalg.norm(
+                ends[:, None, :] - seed_path[None, :, :], axis=2), axis=1)
+
+            branch = int(np.argmin(distances))
+            node = children[branch]
+            branch_sets.append(np.arange(max(branch - WARM_START_SPREAD, 0),
+                                         min(branch + WARM_START_SPREAD + 1, num_branches)))
+
+        return branch_sets
+
+    def searchPass(self, costmap: np.ndarray, pyramid: list, branch_sets: list, best: tuple,
+                   leaf_penalty=None, deadline: float = None) -> tuple:
+        """Run one branch-and-bound pass over a subset of the steering angles.
+
+        Args:
+            branch_sets (list): Per level, the branch indices to expand
+            best (tuple): (cost, leaf) of the best leaf so far. Cost may be infinite.
+
+        Returns:
+            tuple: The new (cost, leaf), or None if the deadline hit
+        """
+        nodes = np.zeros(1, dtype=np.intp)
+        costs = np.zeros(1, dtype=np.int64)
+        for level in range(self.lattice.depth):
+            # With a deadline, expand a few parents at a time so we can stop promptly
+            chunk_size = len(nodes) if deadline is None else EXPANSION_CHUNK_SIZE
+            children = []
+            for start in range(0, len(nodes), chunk_size):
+                if deadline is not None and time.perf_counter() > deadline:
+                    return None
+
+                children.append(self.expand(costmap, pyramid, level,
+                                            nodes[start:start + chunk_size],
+                                            costs[start:start + chunk_size],
+                                            best[0], branch_sets[level]))
+
+            nodes = np.concatenate([chunk[0] for chunk in children])
+            costs = np.concatenate([chunk[1] for chunk in children])
+
+            if len(nodes) == 0:
+                return best  # Nothing in this pass can beat the best leaf
+
+            if self.partial is None or level > self.partial[0]:
+                self.partial = (level, nodes, costs)
+
+        if leaf_penalty is None:
+            return min(best, self.getBest(costs, nodes), key=getRank)
+
+        order = np.argsort(costs, kind='stable')
+        for start in range(0, len(order), PENALTY_CHUNK_SIZE):
+            chunk = order[start:start + PENALTY_CHUNK_SIZE]
+            if costs[chunk[0]] > best[0]:
+                break  # Penalties are non-negative, so no remaining leaf can win
+
+            if deadline is not None and time.perf_counter() > deadline:
+                self.stats.timed_out = True
+                break
+
+            totals = costs[chunk] + leaf_penalty(nodes[chunk])
+            best = min(best, self.getBest(totals, nodes[chunk]), key=getRank)
+
+        return best
+
+    def dive(self, costmap: np.ndarray, pyramid: list, leaf_penalty=None) -> tuple:
+        """Follow the child with the lowest bound down to a leaf.
+
+        This only expands a few branches per level, so it ignores the deadline.
+
+        Returns:
+            tuple: (cost, leaf) with the leaf's complete cost,
+            or (inf, None) if the dive was blocked
+        """
+        nodes = np.zeros(1, dtype=np.intp)
+        costs = np.zeros(1, dtype=np.int64)
+        for level in range(self.lattice.depth):
+            nodes, costs = self.expand(
+                costmap, pyramid, level, nodes, costs, np.inf)
+            if len(nodes) == 0:
+                return np.inf, None
+
+            self.partial = (level, nodes, costs)
+
+            best_idx = np.argmin(
+                costs + self.getLowerBounds(pyramid, level, nodes))
+            nodes = nodes[best_idx:best_idx+1]
+            costs = costs[best_idx:best_idx+1]
+
+        if leaf_penalty is not None:
+            costs = costs + leaf_penalty(nodes)
+
+        return costs[0], nodes[0]
+
+    def getBest(self, costs: np.ndarray, nodes: np.ndarray) -> tuple:
+        """Return the (cost, node) with the lowest cost. Ties go to the lowest
+        node index, which is the node that the recursion visits first.
+        """
+        best_cost = np.min(costs)
+        return best_cost, np.min(nodes[costs == best_cost])
+
+    def expand(self, costmap: np.ndarray, pyramid: list, level: int, nodes: np.ndarray,
+               costs: np.ndarray, best_cost: float, branches: np.ndarray = None) -> tuple:
+        """Expand the children of the given nodes and keep the viable ones.
+
+        Args:
+            level (int): Level of the children
+            nodes (np.ndarray): (N,) parent indices on the previous level
+            costs (np.ndarray): (N,) accumulated parent costs
+            best_cost (float): Children whose bound exceeds this are dropped
+            branches (np.ndarray, optional): Branch indices to expand.
+                Defaults to None (all).
+
+        Returns:
+            tuple: (children, costs) that survived, in the recursion's order
+        """
+        lattice = self.lattice
+        num_branches = lattice.branch_counts[level]
+
+        if branches is None:
+            branches = np.arange(num_branches)
+
+        children = (nodes[:, None] * num_branches + branches).ravel()
+        segment_costs = costmap[lattice.rows[level][children],
+                                lattice.cols[level][children]]
+
+        costs = np.repeat(costs, len(branches)) + \
+            segment_costs.sum(axis=1, dtype=np.int64)
+        viable = np.all(segment_costs <= self.cost_cutoff, axis=1)
+        viable &= costs + \
+            self.getLowerBounds(pyramid, level, children) <= best_cost
+
+        self.stats.expansions += len(children)
+
+        return children[viable], costs[viable]
+
+    def getLowerBounds(self, pyramid: list, level: int, nodes: np.ndarray) -> np.ndarray:
+        """Lower-bound the cost still to come below each node.
+
+        Returns:
+            np.ndarray: (N,) admissible bounds (never more than the true cost)
+        """
+        if self.lattice.below_boxes[level] is None:
+            return np.zeros(len(nodes), dtype=np.int64)
+
+        boxes = self.lattice.below_boxes[level][nodes]
+        boxes = np.clip(boxes, 0, [pyramid[0].shape[0] - 1] * 2 +
+                        [pyramid[0].shape[1] - 1] * 2)
+
+        return self.lattice.below_steps[level] * getBoxMinimums(pyramid, boxes)
+
+    def getPoses(self, nodes: np.ndarray, depth: int = None) -> np.ndarray:
+        """Return the complete (N, steps, 3) poses [x, y, heading] of the given nodes.
+        See PrimitiveLattice.getPoses.
+        """
+        return self.lattice.getPoses(nodes, depth)
@@ -0,0 +1,300 @@
+'''
+Package:   rtp
+Filename:  lattice.py
+Author:    Will Heitman (w at heit.mn)
+
+Precomputed motion-primitive lattice for the tree planner
+
+The tree always starts from the same grid cell with the same heading, and
+its shape depends only on the planner constants (turn angle, step length,
+depth, branch count). Every branch's poses and cell indices can therefore be
+computed once at startup, after which planning only needs to gather and sum
+costs over the precomputed index arrays.
+
+Nodes are stored level by level. Within a level, nodes are ordered by parent,
+then by steering angle, which is the same order the recursion visits them.
+
+The lattice can be cached as an .npz file. The file stores a key that covers
+every planner constant, so a parameter change rebuilds the lattice.
+'''
+
+import hashlib
+import os
+
+import numpy as np
+
+# Bump this whenever the lattice layout or geometry changes
+LATTICE_VERSION = 2
+
+
+def getBranchCounts(depth: int, branches: int) -> list:
+    """Return the number of branches generated at each depth level.
+
+    This mirrors startGeneration and generatePaths: the root is boosted
+    to 3x the branches, and the final level uses 2n+1 branches.
+
+    Args:
+        depth (int): Tree depth, in segments
+        branches (int): Base number of branches
+
+    Returns:
+        list: Branch count for each level, root first
+    """
+    if depth < 2:
+        return [branches * 3]
+
+    return [branches * 3] + [branches] * (depth - 2) + [branches * 2 + 1]
+
+
+def getStepCount(segment_length: float, res: float) -> int:
+    """Count the steps in a segment exactly as getSegment does,
+    including its floating point accumulation.
+    """
+    steps = 0
+    current_length = 0.0
+    while current_length < segment_length:
+        current_length += res
+        steps += 1
+
+    return steps
+
+
+def getSegments(poses: np.ndarray, angles: np.ndarray, steps: int, res: float) -> np.ndarray:
+    """Generate one segment for every (start pose, steering angle) pair.
+
+    Each step moves `res` along the current heading, then turns by the
+    steering angle. Headings and positions are accumulated in order
+    (via cumsum) so that the result matches getSegment exactly.
+
+    Poses and angles are broadcast against each other, so (M, 1, 3) poses
+    with (1, K) angles give every combination, while (M, 3) poses with (M,)
+    angles give one segment per pair.
+
+    Args:
+        poses (np.ndarray): (..., 3) start poses [x, y, heading]
+        angles (np.ndarray): Steering angles, broadcastable against poses[..., 0]
+        steps (int): Steps per segment
+        res (float): Step length, in cells
+
+    Returns:
+        np.ndarray: (..., steps, 3) segment poses
+    """
+    shape = np.broadcast_shapes(
+        poses.shape[:-1], np.shape(angles)) + (steps + 1,)
+
+    headings = np.empty(shape)
+    headings[..., 0] = poses[..., 2]
+    headings[..., 1:] = np.asarray(angles)[..., None]
+    np.cumsum(headings, axis=-1, out=headings)
+
+    xs = np.empty(shape)
+    xs[..., 0] = poses[..., 0]
+    xs[..., 1:] = res * np.cos(headings[..., :-1])
+    np.cumsum(xs, axis=-1, out=xs)
+
+    ys = np.empty(shape)
+    ys[..., 0] = poses[..., 1]
+    ys[..., 1:] = res * np.sin(headings[..., :-1])
+    np.cumsum(ys, axis=-1, out=ys)
+
+    return np.stack((xs[..., 1:], ys[..., 1:], headings[..., 1:]), axis=-1)
+
+
+def getLatticeKey(origin, max_turn_angle, segment_length, depth, branches, res) -> str:
+    """Hash the planner constants into a cache key"""
+    constants = (LATTICE_VERSION, tuple(float(v) for v in origin), float(max_turn_angle),
+                 float(segment_length), int(depth), int(branches), float(res))
+
+    return hashlib.sha1(repr(constants).encode()).hexdigest()
+
+
+class PrimitiveLattice:
+
+    def __init__(self, key: str, origin, steps: int, res: float, angles: list,
+                 end_poses: list, rows: list, cols: list):
+        """Hold a lattice of precomputed tree nodes.
+
+        Use PrimitiveLattice.build or PrimitiveLattice.loadOrBuild rather
+        than calling this directly.
+
+        Every node on a level has the same number of children, so node i's
+        children on the next level are i*K to i*K + K-1, in steering order.
+
+        Args:
+            key (str): Cache key of the planner constants
+            origin (tuple): [x, y] cell that the tree starts from
+            steps (int): Steps per segment
+            res (float): Step length, in cells
+            angles (list): Per level, the (K,) steering angles
+            end_poses (list): Per level, an (M, 3) array of each node's final pose
+            rows (list): Per level, an (M, steps) array of each node's cell rows
+            cols (list): Per level, an (M, steps) array of each node's cell columns
+        """
+        self.key = key
+        self.origin = np.asarray(origin, dtype=float)
+        self.steps = steps
+        self.res = res
+        self.angles = angles
+        self.end_poses = end_poses
+        self.rows = rows
+        self.cols = cols
+        self.depth = len(angles)
+        self.branch_counts = [len(level) for level in angles]
+
+        # Index of each node's parent on the previous level
+        self.parents = [np.arange(len(level)) // len(level_angles)
+                        for level, level_angles in zip(end_poses, angles)]
+
+        # For each node, the bounding box [row_min, row_max, col_min, col_max]
+        # of every cell below it (its descendants, not itself), plus the number
+        # of steps below it. These bound the cost of a node's subtree.
+        self.below_boxes = [None] * self.depth
+        self.below_steps = [steps * (self.depth - 1 - level)
+                            for level in range(self.depth)]
+        subtree_box = None
+        for level in range(self.depth - 1, -1, -1):
+            box = np.stack((rows[level].min(axis=1), rows[level].max(axis=1),
+                            cols[level].min(axis=1), cols[level].max(axis=1)), axis=1)
+
+            if subtree_box is not None:
+                children = subtree_box.reshape(
+                    len(box), self.branch_counts[level + 1], 4)
+                below = np.empty_like(box)
+                below[:, 0::2] = children[:, :, 0::2].min(axis=1)
+                below[:, 1::2] = children[:, :, 1::2].max(axis=1)
+                self.below_boxes[level] = below
+
+                box[:, 0::2] = np.minimum(box[:, 0::2], below[:, 0::2])
+                box[:, 1::2] = np.maximum(box[:, 1::2], below[:, 1::2])
+
+            subtree_box = box
+
+    @classmethod
+    def build(cls, origin=(50., 75.), max_turn_angle=0.30, segment_length=9.0,
+              depth=7, branches=7, res=1.0):
+        """Expand the complete tree (without any cost map)
+
+        Returns:
+            PrimitiveLattice: The new lattice
+        """
+        key = getLatticeKey(origin, max_turn_angle,
+                            segment_length, depth, branches, res)
+        steps = getStepCount(segment_length, res)
+
+        start_poses = np.array([[origin[0], origin[1], 0.0]])
+        angles = []
+        end_poses = []
+        rows = []
+        cols = []
+
+        for num_branches in getBranchCounts(depth, branches):
+            level_angles = np.linspace(-max_turn_angle,
+                                       max_turn_angle, num_branches)
+            segments = getSegments(start_poses[:, None, :], level_angles[None, :],
+                                   steps, res).reshape(-1, steps, 3)
+
+            # Row-major means y is first! astype(int) truncates like int()
+            angles.append(level_angles)
+            end_poses.append(segments[:, -1])
+            rows.append(segments[..., 1].astype(np.int16))
+            cols.append(segments[..., 0].astype(np.int16))
+
+            start_poses = end_poses[-1]
+
+        return cls(key, origin, steps, res, angles, end_poses, rows, cols)
+
+    @classmethod
+    def load(cls, path: str):
+        """Load a lattice from an .npz file written by save()"""
+        with np.load(path) as archive:
+            depth = int(archive['depth'])
+            key = str(archive['key'])
+            origin = archive['origin']
+            steps = int(archive['steps'])
+            res = float(archive['res'])
+            angles, end_poses, rows, cols = [[archive[f'{name}_{level}'] for level in range(depth)]
+                                             for name in ('angles', 'end_poses', 'rows', 'cols')]
+
+        return cls(key, origin, steps, res, angles, end_poses, rows, cols)
+
+    def save(self, path: str):
+        """Write the lattice to an .npz file"""
+        arrays = {}
+        for level in range(self.depth):
+            arrays[f'angles_{level}'] = self.angles[level]
+            arrays[f'end_poses_{level}'] = self.end_poses[level]
+            arrays[f'rows_{level}'] = self.rows[level]
+            arrays[f'cols_{level}'] = self.cols[level]
+
+        # Pass a file object so that numpy doesn't append its own extension
+        with open(path, 'wb') as f:
+            np.savez(f, key=np.array(self.key), origin=self.origin,
+                     depth=np.array(self.depth), steps=np.array(self.steps),
+                     res=np.array(self.res), **arrays)
+
+    @classmethod
+    def loadOrBuild(cls, path: str = None, origin=(50., 75.), max_turn_angle=0.30,
+                    segment_length=9.0, depth=7, branches=7, res=1.0):
+        """Load the lattice from disk if it matches the planner constants.
+        Otherwise, build it (and save it to disk, if a path was given).
+
+        Args:
+            path (str, optional): .npz cache file. Defaults to None (no caching).
+
+        Returns:
+            PrimitiveLattice: The lattice
+        """
+        key = getLatticeKey(origin, max_turn_angle,
+                            segment_length, depth, branches, res)
+
+        if path and os.path.exists(path):
+            try:
+                lattice = cls.load(path)
+                if lattice.key == key:
+                    return lattice
+            except (OSError, KeyError, ValueError):
+                pass  # Corrupt or outdated file. Rebuild below.
+
+        lattice = cls.build(origin, max_turn_angle,
+                            segment_length, depth, branches, res)
+
+        if path:
+            lattice.save(path)
+
+        return lattice
+
+    def getPoses(self, nodes: np.ndarray, depth: int = None) -> np.ndarray:
+        """Assemble the complete poses of the given nodes, from the root down.
+
+        Only cell indices and end poses are stored, so each segment is
+        regenerated from its parent's end pose and its steering angle.
+
+        Args:
+            nodes (np.ndarray): (N,) node indices, usually leaves
+            depth (int, optional): Number of levels in the paths, where the nodes
+                lie on level depth-1. Defaults to the full depth (leaves).
+
+        Returns:
+            np.ndarray: (N, 1 + depth * steps, 3) poses [x, y, heading],
+            starting with the root pose
+        """
+        if depth is None:
+            depth = self.depth
+
+        # Walk up the tree to find each node's ancestor on every level
+        ancestors = [np.asarray(nodes, dtype=np.intp)]
+        for level in range(depth - 1, 0, -1):
+            ancestors.insert(0, self.parents[level][ancestors[0]])
+
+        start_poses = np.tile([self.origin[0], self.origin[1], 0.0],
+                              (len(ancestors[0]), 1))
+
+        segments = [start_poses[:, None, :]]
+        for level in range(depth):
+            angles = self.angles[level][ancestors[level] %
+                                        self.branch_counts[level]]
+            segments.append(getSegments(
+                start_poses, angles, self.steps, self.res))
+            start_poses = self.end_poses[level][ancestors[level]]
+
+        return np.concatenate(segments, axis=1)
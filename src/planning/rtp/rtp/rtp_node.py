@@ -25,10 +25,22 @@ Subscribes to:
 Publishes:
 ✅ /planning/path (Path) in map frame
 
+Parameters:
+- engine: 'batch' (default) expands each depth level at once as NumPy arrays,
+          'recursive' walks the tree one branch at a time
+- lattice_path: optional .npz file caching the batch engine's precomputed lattice
+- time_budget: seconds the batch engine may spend searching per cost map.
+               0.0 (default) searches to completion. Otherwise the search
+               refines coarse-to-fine and returns its best path so far when
+               the budget runs out, e.g. 0.08 for a comfortable 5 Hz.
+- warm_start: seed the batch engine's search with the previous best path,
+              shifted by our motion since then (default True)
+- path_switch_cost: keep following the previous path unless another path is
+                    cheaper by more than this (default 0, always switch)
+
 Minimum update rate: 2 Hz, ideally 5 Hz
 '''
 
-from matplotlib import pyplot as plt
 from diagnostic_msgs.msg import DiagnosticStatus, KeyValue
 from nav_msgs.msg import OccupancyGrid, Odometry, Path
 from nova_msgs.msg import Mode
@@ -50,7 +62,8 @@ from visualization_msgs.msg import Marker
 from skimage.draw import line
 
 
-from matplotlib.patches import Rectangle
+from .barrier import GRID_RES, getBarrierIndices
+from .batch_planner import BatchTreePlanner
 
 N_BRANCHES: int = 17
 STEP_LEN: float = 12.0  # meters
@@ -62,6 +75,14 @@ WHEEL_BASE: float = 3.5  # meters
 MAX_TURN_ANGLE = 0.30  # radians
 COST_CUTOFF = 90
 
+# Barrier proximity cost is (MAX_BARRIER_IDX - barrier index) * 50
+MAX_BARRIER_IDX = 36
+
+# 'batch' expands each depth level at once (see batch_planner.py),
+# 'recursive' walks the tree one branch at a time.
+ENGINES = ('batch', 'recursive')
+MAX_LATENCY = 0.5  # seconds. Slower than this misses our 2 Hz minimum.
+
 
 @dataclass
 class CostedPath:
@@ -122,17 +143,36 @@ class RecursiveTreePlanner(Node):
 
         self.current_mode = Mode.DISABLED
 
+        self.engine = self.declare_parameter('engine', 'batch').value
+        if self.engine not in ENGINES:
+            self.get_logger().warn(
+                f"Unknown engine '{self.engine}'. Falling back to 'batch'.")
+            self.engine = 'batch'
+
+        # The batch engine's lattice is built once here, or loaded from
+        # this .npz file if it was built with the same constants
+        lattice_path = self.declare_parameter('lattice_path', '').value
+
+        self.batch_planner = BatchTreePlanner(
+            origin=(50., 75.), max_turn_angle=MAX_TURN_ANGLE,
+            segment_length=STEP_LEN, depth=DEPTH, branches=N_BRANCHES,
+            cost_cutoff=COST_CUTOFF, lattice_path=lattice_path or None)
+
+        self.time_budget = self.declare_parameter('time_budget', 0.0).value
+
+        # Previous best path (grid cells) and our pose when it was planned
+        self.warm_start = self.declare_parameter('warm_start', True).value
+        self.path_switch_cost = self.declare_parameter(
+            'path_switch_cost', 0).value
+        self.previous_path = None
+        self.previous_ego_pose = None
+
     def currentModeCb(self, msg: Mode):
         self.current_mode = msg.mode
 
     def speedCostMapCb(self, msg: OccupancyGrid):
-        if msg.info.height == 0:
-            self.speed_costmap = np.asarray(msg.data, dtype=np.int8).reshape(
-                int(np.sqrt(len(msg.data))), -1)
-
-        else:
-            self.speed_costmap = np.asarray(msg.data, dtype=np.int8).reshape(
-                msg.info.height, msg.info.width)
+        # Grids without a height are assumed to be square
+        self.speed_costmap = rnp.occupancy_grid.occupancy_grid_to_array(msg)
 
     def clockCb(self, msg: Clock):
         self.clock = msg.clock
@@ -151,6 +191,10 @@ class RecursiveTreePlanner(Node):
 
         Returns:
             int: The index of the first pose that fails the check, where the "barrier" lies
+
+        This rasterises one line per pose, so it is slow for many paths.
+        costMapCb uses the batched barrier.getBarrierIndices instead, which
+        returns the same indices.
         """
         GRID_RES = 0.4  # meters per cell
 
@@ -200,7 +244,8 @@ class RecursiveTreePlanner(Node):
             if cost > COST_CUTOFF:
                 return
 
-            total_cost += cost
+            # Sum in a Python int: cost maps are int8, which would wrap
+            total_cost += int(cost)
 
             segment_poses.append([
                 x, y, end_heading + steering_angle
@@ -311,42 +356,169 @@ class RecursiveTreePlanner(Node):
 
         return status
 
-    def costMapCb(self, msg: OccupancyGrid):
-        start = time.time()
+    def selectRecursivePath(self, costmap: np.ndarray) -> CostedPath:
+        """Generate paths with the recursive engine and return the cheapest one
 
-        status = self.initStatusMsg()
-
-        if msg.info.height == 0 or msg.info.width == 0:
-            self.get_logger().warning("Incoming cost map dimensions were zero.")
-            return
+        Args:
+            costmap (np.ndarray): Steering cost map
 
-        costmap = np.asarray(msg.data, dtype=np.int8).reshape(
-            msg.info.height, msg.info.width)
+        Returns:
+            CostedPath: The least-cost path, or None if no path was viable
+        """
         results = self.startGeneration(
             costmap, depth=DEPTH, segment_length=STEP_LEN, branches=N_BRANCHES)
 
         min_cost = 100000
         best_path: CostedPath = None
 
-        barrier_idxs = []
+        # ADD BARRIER PROXIMITY COST
+        # (only if car is stopped)
+        if (self.speed < 2.0 and len(results) > 0):
+            barrier_idxs = getBarrierIndices(
+                [result.poses for result in results], self.speed_costmap)
+            for result, barrier_idx in zip(results, barrier_idxs):
+                result.cost += (MAX_BARRIER_IDX-int(barrier_idx))*50
 
         for result in results:
-
-            # ADD BARRIER PROXIMITY COST
-            # (only if car is stopped)
-            if (self.speed < 2.0):
-                barrier_idx = self.getBarrierIndex(
-                    result, self.speed_costmap)
-                MAX_IDX = 36
-                result.cost += (MAX_IDX-barrier_idx)*50
-
-            barrier_idxs.append(result.cost)
             if result.cost < min_cost:
                 min_cost = result.cost
                 best_path = result
 
-        # plt.hist(barrier_idxs)
-        # plt.show()
+        return best_path
+
+    def selectBatchPath(self, costmap: np.ndarray) -> CostedPath:
+        """Search the lattice with the batched engine and return the cheapest path
+
+        Args:
+            costmap (np.ndarray): Steering cost map
+
+        Returns:
+            CostedPath: The least-cost path, or None if no path was viable
+        """
+        # ADD BARRIER PROXIMITY COST
+        # (only if car is stopped)
+        leaf_penalty = self.getBarrierPenalty if self.speed < 2.0 else None
+
+        seed_path = self.getWarmStartPath() if self.warm_start else None
+
+        leaf, cost = self.batch_planner.search(
+            costmap, leaf_penalty, time_budget=self.time_budget or None,
+            seed_path=seed_path, switch_cost=self.path_switch_cost)
+
+        if leaf is None:
+            self.previous_path = None
+            return None
+
+        # If the search ran out of time, the path may stop short of full depth
+        best_path = CostedPath()
+        best_path.poses = self.batch_planner.getPoses(
+            [leaf], self.batch_planner.stats.depth)[0].tolist()
+        best_path.cost = int(cost)
+
+        self.previous_path = np.asarray(best_path.poses)
+        self.previous_ego_pose = self.ego_pose
+
+        return best_path
+
+    def getWarmStartPath(self) -> np.ndarray:
+        """Shift the previous best path into the current base_link frame,
+        using our motion (from odometry) since it was planned.
+
+        Returns:
+            np.ndarray: (P, 2) [x, y] cells of the shifted path,
+            or None if there is no previous path or odometry
+        """
+        if self.previous_path is None or self.previous_ego_pose is None or self.ego_pose is None:
+            return None
+
+        x0, y0, heading0 = self.previous_ego_pose
+        x1, y1, heading1 = self.ego_pose
+
+        # Previous base_link frame -> map frame
+        x = self.previous_path[:, 0] * GRID_RES - 20
+        y = self.previous_path[:, 1] * GRID_RES - 30
+        map_x = x0 + x * np.cos(heading0) - y * np.sin(heading0)
+        map_y = y0 + x * np.sin(heading0) + y * np.cos(heading0)
+
+        # Map frame -> current base_link frame
+        dx = map_x - x1
+        dy = map_y - y1
+        x = dx * np.cos(heading1) + dy * np.sin(heading1)
+        y = -dx * np.sin(heading1) + dy * np.cos(heading1)
+
+        # Only the part of the path ahead of us is worth following
+        ahead = x > 0
+        if not np.any(ahead):
+            return None
+
+        return np.stack(((x[ahead] + 20) / GRID_RES, (y[ahead] + 30) / GRID_RES), axis=1)
+
+    def getBarrierPenalty(self, leaves: np.ndarray) -> np.ndarray:
+        """Barrier proximity cost for each of the batch engine's leaves
+
+        Args:
+            leaves (np.ndarray): (N,) leaf indices
+
+        Returns:
+            np.ndarray: (N,) costs
+        """
+        barrier_idxs = getBarrierIndices(
+            self.batch_planner.getPoses(leaves), self.speed_costmap)
+
+        return (MAX_BARRIER_IDX-barrier_idxs)*50
+
+    def addPlanningStats(self, status: DiagnosticStatus, start: float):
+        """Report this cycle's latency and search effort in the status message.
+        Warns if the search was cut short or the cycle was too slow.
+
+        Args:
+            status (DiagnosticStatus): Status message to add to
+            start (float): Cycle start time, from time.time()
+        """
+        latency = time.time() - start
+        values = {'latency': f"{latency:.4f}"}
+
+        timed_out = False
+        if self.engine == 'batch':
+            stats = self.batch_planner.stats
+            timed_out = stats.timed_out
+            values['depth'] = str(stats.depth)
+            values['branches_expanded'] = str(stats.expansions)
+            values['stride'] = str(stats.stride)
+            values['timed_out'] = str(stats.timed_out)
+            values['warm_started'] = str(stats.warm_started)
+
+        for key, value in values.items():
+            kv = KeyValue()
+            kv.key = key
+            kv.value = value
+            status.values.append(kv)
+
+        if status.level != DiagnosticStatus.OK:
+            return
+
+        if latency > MAX_LATENCY:
+            status.level = DiagnosticStatus.WARN
+            status.message = f"Planning took {latency:.2f} s"
+        elif timed_out:
+            status.level = DiagnosticStatus.WARN
+            status.message = "Planning time budget exceeded. Path is approximate."
+
+    def costMapCb(self, msg: OccupancyGrid):
+        start = time.time()
+
+        status = self.initStatusMsg()
+
+        if msg.info.height == 0 or msg.info.width == 0:
+            self.get_logger().warning("Incoming cost map dimensions were zero.")
+            return
+
+        costmap = rnp.occupancy_grid.occupancy_grid_to_array(msg)
+
+        if self.engine == 'recursive':
+            best_path = self.selectRecursivePath(costmap)
+        else:
+            best_path = self.selectBatchPath(costmap)
 
         result_msg = Path()
         result_msg.header.frame_id = "base_link"
@@ -356,10 +528,12 @@ class RecursiveTreePlanner(Node):
             status.level = DiagnosticStatus.ERROR
             status.message = "Could not find viable path. Likely too far off course."
             self.get_logger().error("Could not find viable path")
+            self.addPlanningStats(status, start)
             self.status_pub.publish(status)
             return
 
-        barrier_idx = self.getBarrierIndex(best_path, self.speed_costmap)
+        barrier_idx = getBarrierIndices(
+            [best_path.poses], self.speed_costmap)[0]
         barrier_pose = best_path.poses[barrier_idx]
 
         distance_from_barrier = np.linalg.norm(
@@ -417,10 +591,9 @@ class RecursiveTreePlanner(Node):
 
         self.path_pub.publish(result_msg)
 
+        self.addPlanningStats(status, start)
         self.status_pub.publish(status)
 
-        # print(f"Done in {time.time() - start}!")
-
     def odomCb(self, msg: Odometry):
 
         pos = msg.pose.pose.position
@@ -0,0 +1,61 @@
+import unittest
+import numpy as np
+import rclpy
+
+from rtp.barrier import getBarrierIndices
+from rtp.rtp_node import RecursiveTreePlanner, CostedPath
+
+
+class TestBarrierIndices(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rclpy.init()
+        cls.node = RecursiveTreePlanner()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.node.destroy_node()
+        rclpy.shutdown()
+
+    def getExpected(self, poses, costmap) -> list:
+        expected = []
+        for path_poses in poses:
+            path = CostedPath()
+            path.poses = path_poses
+            expected.append(self.node.getBarrierIndex(path, costmap))
+        return expected
+
+    def test_matches_getBarrierIndex_random_poses(self):
+        rng = np.random.default_rng(0)
+        for _ in range(10):
+            costmap = rng.integers(0, 92, size=(151, 151)).astype(np.int8)
+            poses = np.stack((rng.uniform(5, 120, size=(200, 37)),
+                              rng.uniform(5, 120, size=(200, 37)),
+                              rng.uniform(-4, 4, size=(200, 37))), axis=-1)
+
+            np.testing.assert_equal(getBarrierIndices(poses, costmap),
+                                    self.getExpected(poses, costmap))
+
+    def test_matches_getBarrierIndex_planner_paths(self):
+        costmap = np.zeros((151, 151), dtype=np.int8)
+        costmap[60:70, 60:100] = 100
+        costmap[85:90, 70:75] = 100
+
+        leaves, _ = self.node.batch_planner.plan(
+            np.zeros((151, 151), dtype=np.int8))
+        poses = self.node.batch_planner.getPoses(leaves[::50])
+
+        np.testing.assert_equal(getBarrierIndices(poses, costmap),
+                                self.getExpected(poses, costmap))
+
+    def test_clear_path(self):
+        costmap = np.zeros((151, 151), dtype=np.int8)
+        poses = np.zeros((3, 10, 3))
+        poses[..., 0] = np.arange(50, 60)
+        poses[..., 1] = 75
+
+        np.testing.assert_equal(getBarrierIndices(poses, costmap), [9, 9, 9])
+
+
+if __name__ == '__main__':
+    unittest.main()
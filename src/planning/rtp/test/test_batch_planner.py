@@ -0,0 +1,208 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import rclpy
+
+from rtp.batch_planner import BatchTreePlanner, getMinPyramid, getBoxMinimums
+from rtp.lattice import PrimitiveLattice
+from rtp.rtp_node import RecursiveTreePlanner, DEPTH, STEP_LEN, N_BRANCHES, MAX_TURN_ANGLE
+
+
+def random_costmap(seed: int, obstacles: int, dtype=np.int64) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    costmap = rng.integers(0, 40, size=(151, 151))
+    for _ in range(obstacles):
+        r, c = rng.integers(40, 110, size=2)
+        costmap[r:r+8, c:c+8] = 100
+    return costmap.astype(dtype)
+
+
+class TestBatchTreePlanner(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        rclpy.init()
+        cls.node = RecursiveTreePlanner()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.node.destroy_node()
+        rclpy.shutdown()
+
+    def test_leaves_match_recursion(self):
+        costmap = random_costmap(0, obstacles=6)
+
+        results = self.node.startGeneration(
+            costmap, depth=DEPTH, segment_length=STEP_LEN, branches=N_BRANCHES)
+        leaves, costs = self.node.batch_planner.plan(costmap)
+        poses = self.node.batch_planner.getPoses(leaves)
+
+        self.assertEqual(len(results), len(costs))
+        np.testing.assert_equal(costs, [result.cost for result in results])
+        np.testing.assert_equal(poses, [result.poses for result in results])
+
+    def test_same_best_path(self):
+        self.node.speed = 5.0  # Skip the barrier cost
+        for seed in range(4):
+            costmap = random_costmap(seed, obstacles=3*seed)
+
+            expected = self.node.selectRecursivePath(costmap)
+            actual = self.node.selectBatchPath(costmap)
+
+            self.assertEqual(expected.cost, actual.cost)
+            np.testing.assert_equal(actual.poses, expected.poses)
+
+    def test_int8_costmaps(self):
+        # Like the grids from occupancy_grid_to_array, whose path costs overflow int8
+        for seed, speed in [(0, 0.0), (1, 5.0), (2, 0.0)]:
+            self.node.speed = speed
+            costmap = random_costmap(seed, obstacles=3*seed, dtype=np.int8)
+
+            results = self.node.startGeneration(
+                costmap, depth=DEPTH, segment_length=STEP_LEN, branches=N_BRANCHES)
+            leaves, costs = self.node.batch_planner.plan(costmap)
+            np.testing.assert_equal(costs, [result.cost for result in results])
+            np.testing.assert_equal(
+                costs, self.node.batch_planner.plan(costmap.astype(np.int64))[1])
+
+            expected = self.node.selectRecursivePath(costmap)
+            actual = self.node.selectBatchPath(costmap)
+
+            self.assertEqual(expected.cost, actual.cost)
+            np.testing.assert_equal(actual.poses, expected.poses)
+
+    def test_warm_start_path(self):
+        self.node.previous_path = np.array([[50., 75., 0.], [60., 75., 0.], [70., 80., 0.]])
+
+        # Standing still, the path ahead of us is unchanged
+        self.node.previous_ego_pose = [10.0, 5.0, 0.5]
+        self.node.ego_pose = [10.0, 5.0, 0.5]
+        np.testing.assert_allclose(
+            self.node.getWarmStartPath(), [[60., 75.], [70., 80.]])
+
+        # Driving 2 m forward shifts the path back by 5 cells
+        self.node.ego_pose = [10.0 + 2*np.cos(0.5), 5.0 + 2*np.sin(0.5), 0.5]
+        np.testing.assert_allclose(
+            self.node.getWarmStartPath(), [[55., 75.], [65., 80.]])
+
+        self.node.ego_pose = None
+        self.assertIsNone(self.node.getWarmStartPath())
+
+    def test_all_paths_blocked(self):
+        costmap = np.full((151, 151), 100)
+
+        leaves, costs = self.node.batch_planner.plan(costmap)
+
+        self.assertEqual(len(costs), 0)
+        self.assertIsNone(self.node.selectBatchPath(costmap))
+
+
+class TestPrimitiveLattice(unittest.TestCase):
+    def test_cache_roundtrip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'lattice.npz')
+            built = PrimitiveLattice.loadOrBuild(
+                path, max_turn_angle=MAX_TURN_ANGLE, segment_length=STEP_LEN,
+                depth=DEPTH, branches=N_BRANCHES)
+            self.assertTrue(os.path.exists(path))
+
+            loaded = PrimitiveLattice.loadOrBuild(
+                path, max_turn_angle=MAX_TURN_ANGLE, segment_length=STEP_LEN,
+                depth=DEPTH, branches=N_BRANCHES)
+
+            self.assertEqual(built.key, loaded.key)
+            for level in range(DEPTH):
+                np.testing.assert_equal(built.rows[level], loaded.rows[level])
+                np.testing.assert_equal(built.cols[level], loaded.cols[level])
+                np.testing.assert_equal(
+                    built.parents[level], loaded.parents[level])
+
+    def test_constant_change_rebuilds(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'lattice.npz')
+            old = PrimitiveLattice.loadOrBuild(
+                path, segment_length=STEP_LEN, depth=DEPTH, branches=N_BRANCHES)
+            new = PrimitiveLattice.loadOrBuild(
+                path, segment_length=STEP_LEN, depth=DEPTH, branches=N_BRANCHES + 2)
+
+            self.assertNotEqual(old.key, new.key)
+            self.assertEqual(len(new.parents[0]), (N_BRANCHES + 2) * 3)
+            self.assertEqual(PrimitiveLattice.load(path).key, new.key)
+
+
+class TestBranchAndBound(unittest.TestCase):
+    def test_box_minimums_are_admissible(self):
+        rng = np.random.default_rng(0)
+        costmap = rng.integers(-1, 101, size=(151, 151))
+        pyramid = getMinPyramid(costmap)
+
+        for _ in range(500):
+            r0, c0 = rng.integers(0, 151, size=2)
+            r1, c1 = rng.integers(r0, 151), rng.integers(c0, 151)
+            bound = getBoxMinimums(pyramid, np.array([[r0, r1, c0, c1]]))[0]
+            self.assertLessEqual(bound, costmap[r0:r1+1, c0:c1+1].min())
+
+    def test_search_matches_exhaustive(self):
+        planner = BatchTreePlanner(max_turn_angle=MAX_TURN_ANGLE, segment_length=9.0,
+                                   depth=4, branches=9)
+
+        def penalty(leaves):
+            return (leaves * 7919) % 300
+
+        for seed in range(4):
+            costmap = random_costmap(seed, obstacles=2*seed)
+            leaves, costs = planner.plan(costmap)
+
+            leaf, cost = planner.search(costmap)
+            self.assertEqual(leaf, leaves[np.argmin(costs)])
+            self.assertEqual(cost, np.min(costs))
+
+            totals = costs + penalty(leaves)
+            leaf, cost = planner.search(costmap, penalty)
+            self.assertEqual(leaf, leaves[np.argmin(totals)])
+            self.assertEqual(cost, np.min(totals))
+
+    def test_warm_start_matches_exhaustive(self):
+        planner = BatchTreePlanner(max_turn_angle=MAX_TURN_ANGLE, segment_length=STEP_LEN,
+                                   depth=DEPTH, branches=N_BRANCHES)
+        previous = random_costmap(0, obstacles=3)
+        leaf, _ = planner.search(previous)
+        seed_path = planner.getPoses([leaf])[0, :, :2]
+
+        for seed in range(4):
+            costmap = random_costmap(seed, obstacles=3)
+            leaves, costs = planner.plan(costmap)
+
+            leaf, cost = planner.search(costmap, seed_path=seed_path)
+            self.assertEqual(leaf, leaves[np.argmin(costs)])
+            self.assertEqual(cost, np.min(costs))
+
+        # On the same map, the seed alone gives the best bound
+        planner.search(previous, seed_path=seed_path)
+        warm_expansions = planner.stats.expansions
+        self.assertTrue(planner.stats.warm_started)
+        planner.search(previous)
+        self.assertLess(warm_expansions, planner.stats.expansions)
+
+    def test_time_budget(self):
+        planner = BatchTreePlanner(max_turn_angle=MAX_TURN_ANGLE, segment_length=STEP_LEN,
+                                   depth=DEPTH, branches=N_BRANCHES)
+        costmap = random_costmap(1, obstacles=3)
+        leaves, costs = planner.plan(costmap)
+
+        # A generous budget gives the exact answer
+        leaf, cost = planner.search(costmap, time_budget=10.0)
+        self.assertEqual(leaf, leaves[np.argmin(costs)])
+        self.assertEqual(cost, np.min(costs))
+        self.assertFalse(planner.stats.timed_out)
+
+        # An impossible budget still gives a complete, viable path
+        leaf, cost = planner.search(costmap, time_budget=1e-9)
+        self.assertTrue(planner.stats.timed_out)
+        self.assertEqual(planner.stats.depth, DEPTH)
+        self.assertIn(leaf, leaves)
+        self.assertEqual(cost, costs[np.searchsorted(leaves, leaf)])
+
+
+if __name__ == '__main__':
+    unittest.main()
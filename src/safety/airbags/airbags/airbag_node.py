@@ -6,7 +6,6 @@ Author:    Will Heitman (w at heit.mn)
 Code to establish safety zones around the car where the speed is limited.
 '''
 
-from matplotlib import pyplot as plt
 from carla_msgs.msg import CarlaEgoVehicleControl, CarlaSpeedometer
 from diagnostic_msgs.msg import DiagnosticStatus
 from nav_msgs.msg import OccupancyGrid
@@ -20,8 +19,6 @@ from std_msgs.msg import ColorRGBA, String
 from visualization_msgs.msg import Marker
 from geometry_msgs.msg import Point
 
-from matplotlib.patches import Rectangle
-
 
 class AirbagNode(Node):
     def __init__(self):
@@ -0,0 +1,151 @@
+'''
+Package: geo_projection
+   File: projection.py
+ Author: Will Heitman (w at heit dot mn)
+
+Geodetic (lat/lon) to local map coordinates, in meters.
+
+Both projections compute their map origin once, on creation, and then
+convert a single fix or whole arrays of fixes (e.g. an hour of logged
+GNSS data) with plain NumPy math.
+
+- MercatorProjection matches CARLA's LatLonToMercator, which is how
+  CARLA's OpenDRIVE maps are georeferenced.
+- EnuProjection gives East-North-Up coordinates on the WGS84 ellipsoid,
+  like pymap3d.geodetic2enu.
+'''
+
+import numpy as np
+
+EARTH_RADIUS_EQUA = 6378137.0  # meters
+
+# WGS84 ellipsoid
+WGS84_SEMIMAJOR_AXIS = EARTH_RADIUS_EQUA
+WGS84_FLATTENING = 1 / 298.257223563
+WGS84_ECCENTRICITY_SQ = WGS84_FLATTENING * (2 - WGS84_FLATTENING)
+
+
+def toRadians(degrees):
+    return degrees * np.pi / 180.0
+
+
+def latToScale(lat):
+    """Return UTM projection scale.
+
+    Args:
+        lat (float or np.ndarray): degrees latitude
+
+    Returns:
+        float or np.ndarray: projection scale
+    """
+    return np.cos(toRadians(lat))
+
+
+def latlonToMercator(lat, lon, scale) -> tuple:
+    """Convert geodetic coords (in degrees) to UTM coords, in meters.
+
+    Copied to match CARLA:
+    [LatLonToMercator](https://github.com/carla-simulator/carla/blob/fe3cb6863a604f5c0cf8b692fe2b6300b45b5999/LibCarla/source/carla/geom/GeoLocation.cpp#L38)
+
+    Args:
+        lat (float or np.ndarray): degrees
+        lon (float or np.ndarray): degrees
+        scale (float or np.ndarray): projection scale (see latToScale)
+
+    Returns:
+        tuple: (x,y) in UTM meters
+    """
+    x = scale * toRadians(lon) * EARTH_RADIUS_EQUA
+    y = scale * EARTH_RADIUS_EQUA * \
+        np.log(np.tan((90.0+lat) * np.pi/360.0))
+
+    return (x, y)
+
+
+def geodeticToEcef(lat, lon, alt) -> tuple:
+    """Convert geodetic coords (degrees, meters) to Earth-centered, Earth-fixed meters."""
+    lat = toRadians(lat)
+    lon = toRadians(lon)
+
+    # Prime vertical radius of curvature
+    N = WGS84_SEMIMAJOR_AXIS / \
+        np.sqrt(1 - WGS84_ECCENTRICITY_SQ * np.sin(lat)**2)
+
+    x = (N + alt) * np.cos(lat) * np.cos(lon)
+    y = (N + alt) * np.cos(lat) * np.sin(lon)
+    z = (N * (1 - WGS84_ECCENTRICITY_SQ) + alt) * np.sin(lat)
+
+    return (x, y, z)
+
+
+class MercatorProjection:
+
+    def __init__(self, lat0: float, lon0: float):
+        """CARLA-style Mercator projection, relative to a map origin.
+
+        Args:
+            lat0 (float): Origin latitude in degrees
+            lon0 (float): Origin longitude in degrees
+        """
+        self.x0, self.y0 = latlonToMercator(lat0, lon0, latToScale(lat0))
+
+    def toLocal(self, lat, lon) -> tuple:
+        """Project fixes to map coordinates.
+
+        Args:
+            lat (float or np.ndarray): degrees
+            lon (float or np.ndarray): degrees
+
+        Returns:
+            tuple: (x, y) in meters from the origin, shaped like lat and lon
+        """
+        # TODO: Should scale here be from lat0?
+        x, y = latlonToMercator(lat, lon, latToScale(lat))
+
+        return (x - self.x0, y - self.y0)
+
+
+class EnuProjection:
+
+    def __init__(self, lat0: float, lon0: float, alt0: float = 0.0):
+        """East-North-Up projection on the WGS84 ellipsoid, relative to a map origin.
+
+        Args:
+            lat0 (float): Origin latitude in degrees
+            lon0 (float): Origin longitude in degrees
+            alt0 (float, optional): Origin altitude in meters. Defaults to 0.0.
+        """
+        self.origin_ecef = np.array(geodeticToEcef(lat0, lon0, alt0))
+
+        # Rotation from ECEF offsets to [east, north, up]
+        lat0 = toRadians(lat0)
+        lon0 = toRadians(lon0)
+        self.rotation = np.array([
+            [-np.sin(lon0), np.cos(lon0), 0.0],
+            [-np.sin(lat0)*np.cos(lon0), -np.sin(lat0)*np.sin(lon0), np.cos(lat0)],
+            [np.cos(lat0)*np.cos(lon0), np.cos(lat0)*np.sin(lon0), np.sin(lat0)]
+        ])
+
+    def toLocal(self, lat, lon, alt=0.0) -> tuple:
+        """Project fixes to map coordinates.
+
+        Args:
+            lat (float or np.ndarray): degrees
+            lon (float or np.ndarray): degrees
+            alt (float or np.ndarray, optional): meters. Defaults to 0.0.
+
+        Returns:
+            tuple: (east, north, up) in meters from the origin, shaped like lat and lon
+        """
+        x, y, z = geodeticToEcef(lat, lon, alt)
+
+        dx = x - self.origin_ecef[0]
+        dy = y - self.origin_ecef[1]
+        dz = z - self.origin_ecef[2]
+
+        r = self.rotation
+        east = r[0, 0]*dx + r[0, 1]*dy
+        north = r[1, 0]*dx + r[1, 1]*dy + r[1, 2]*dz
+        up = r[2, 0]*dx + r[2, 1]*dy + r[2, 2]*dz
+
+        return (east, north, up)
@@ -0,0 +1,21 @@
+from setuptools import setup
+
+package_name = 'geo_projection'
+
+setup(
+    name=package_name,
+    version='1.0.0',
+    packages=[package_name],
+    data_files=[
+        ('share/ament_index/resource_index/packages',
+            ['resource/' + package_name]),
+        ('share/' + package_name, ['package.xml'])
+    ],
+    install_requires=['setuptools'],
+    zip_safe=True,
+    maintainer='main',
+    maintainer_email='will.heitman@utdallas.edu',
+    description='Geodetic (lat/lon) to local map projections',
+    license='MIT',
+    tests_require=['pytest'],
+)
@@ -0,0 +1,82 @@
+import math
+import unittest
+
+import numpy as np
+
+from geo_projection.projection import EARTH_RADIUS_EQUA, EnuProjection, MercatorProjection
+
+try:
+    import pymap3d
+except ImportError:
+    pymap3d = None
+
+
+def loopMercator(lat, lon, lat0, lon0):
+    """The original scalar conversion from GnssProcessingNode.gnssCb"""
+    def latlonToMercator(lat, lon, scale):
+        x = scale * (lon * math.pi / 180.0) * EARTH_RADIUS_EQUA
+        y = scale * EARTH_RADIUS_EQUA * \
+            math.log(math.tan((90.0+lat) * math.pi/360.0))
+        return (x, y)
+
+    x0, y0 = latlonToMercator(lat0, lon0, math.cos(lat0 * math.pi / 180.0))
+    x, y = latlonToMercator(lat, lon, math.cos(lat * math.pi / 180.0))
+    return (x - x0, y - y0)
+
+
+class TestProjection(unittest.TestCase):
+    def test_mercator_matches_scalar(self):
+        rng = np.random.default_rng(0)
+        lat = 32.99 + rng.normal(0, 0.01, 100)
+        lon = -96.75 + rng.normal(0, 0.01, 100)
+        projection = MercatorProjection(32.99, -96.75)
+
+        x, y = projection.toLocal(lat, lon)
+
+        expected = np.array([loopMercator(a, b, 32.99, -96.75)
+                             for a, b in zip(lat, lon)])
+        np.testing.assert_allclose(x, expected[:, 0], atol=1e-6)
+        np.testing.assert_allclose(y, expected[:, 1], atol=1e-6)
+
+    def test_enu_axes(self):
+        projection = EnuProjection(0.0, 0.0)
+
+        east, north, up = projection.toLocal(
+            np.array([0.0, 0.0, 1e-3]), np.array([0.0, 1e-3, 0.0]))
+
+        # At the equator, 1e-3 degrees of longitude is 111.32 m east
+        np.testing.assert_allclose(east, [0.0, 111.3195, 0.0], atol=1e-3)
+        # ...and 1e-3 degrees of latitude is 110.57 m north
+        np.testing.assert_allclose(north, [0.0, 0.0, 110.5743], atol=1e-3)
+        # The surface curves away from the tangent plane
+        np.testing.assert_allclose(up, [0.0, -0.00097, -0.00096], atol=1e-4)
+
+    def test_enu_scalar_matches_array(self):
+        projection = EnuProjection(32.99, -96.75, 180.0)
+        lat = np.array([32.991, 32.98])
+        lon = np.array([-96.752, -96.74])
+
+        arrays = projection.toLocal(lat, lon, 180.0)
+        scalar = projection.toLocal(lat[1], lon[1], 180.0)
+
+        np.testing.assert_allclose(np.array(arrays)[:, 1], scalar)
+
+    @unittest.skipIf(pymap3d is None, "pymap3d is not installed")
+    def test_enu_matches_pymap3d(self):
+        rng = np.random.default_rng(0)
+        lat = 32.99 + rng.normal(0, 0.05, 100)
+        lon = -96.75 + rng.normal(0, 0.05, 100)
+        alt = 180.0 + rng.normal(0, 20.0, 100)
+        projection = EnuProjection(32.99, -96.75, 180.0)
+
+        east, north, up = projection.toLocal(lat, lon, alt)
+
+        expected = np.array([pymap3d.geodetic2enu(a, b, c, 32.99, -96.75, 180.0)
+                             for a, b, c in zip(lat, lon, alt)])
+        np.testing.assert_allclose(east, expected[:, 0], atol=1e-8)
+        np.testing.assert_allclose(north, expected[:, 1], atol=1e-8)
+        np.testing.assert_allclose(up, expected[:, 2], atol=1e-8)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,7 +10,7 @@ from tqdm import tqdm, trange
 import xml.etree.ElementTree as ET
 
 # Strictly for testing/debug
-import matplotlib.pyplot as plt
+from vt_viz import debug_plot
 
 from .enums import LaneType, RoadType
 from .header import Header
@@ -71,7 +71,9 @@ class Map:
         for i in tqdm_range:
             points.append(Point(X[i], Y[i]))
 
-        plt.show()
+        # Show the lanes drawn by _parse_lanes_
+        if debug_plot.isEnabled():
+            debug_plot.getPyplot().show()
 
         hits = []
 
@@ -91,7 +93,6 @@ class Map:
         result *= 100
 
         # plt.imshow(result)
-        plt.show()
 
         self.header.grid_height = height
         self.header.grid_width = width
@@ -322,10 +323,7 @@ class Map:
             shape_pts += right_bound_coords
             lane.shape = Polygon(shape_pts)
 
-            plt.fill([point[0] for point in lane.shape.exterior.coords],
-                     [point[1] for point in lane.shape.exterior.coords], "paleturquoise")
-            plt.plot([point[0] for point in lane.shape.exterior.coords],
-                     [point[1] for point in lane.shape.exterior.coords], 'k')
+            self._plot_lane_(lane, "paleturquoise")
 
             i += 1
             right_bound = left_bound
@@ -357,13 +355,20 @@ class Map:
             shape_pts += right_bound_coords
             lane.shape = Polygon(shape_pts)
 
-            plt.fill([point[0] for point in lane.shape.exterior.coords],
-                     [point[1] for point in lane.shape.exterior.coords], "lightseagreen")
-
-            plt.plot([point[0] for point in lane.shape.exterior.coords],
-                     [point[1] for point in lane.shape.exterior.coords], 'k')
+            self._plot_lane_(lane, "lightseagreen")
             i -= 1
             left_bound = right_bound
 
+    def _plot_lane_(self, lane: Lane, color: str):
+        """Draw a lane's shape, if debug plots are enabled (see vt_viz.debug_plot)"""
+        if not debug_plot.isEnabled():
+            return
+
+        plt = debug_plot.getPyplot()
+        xs = [point[0] for point in lane.shape.exterior.coords]
+        ys = [point[1] for point in lane.shape.exterior.coords]
+        plt.fill(xs, ys, color)
+        plt.plot(xs, ys, 'k')
+
     def get_route():
         raise NotImplementedError
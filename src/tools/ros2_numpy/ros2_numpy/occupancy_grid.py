@@ -7,11 +7,43 @@ from nav_msgs.msg import OccupancyGrid, MapMetaData
 import numpy as np
 from numpy.lib.stride_tricks import as_strided
 
+
+def occupancy_grid_to_array(msg):
+    """Read an OccupancyGrid's cells as a plain (height, width) int8 array.
+
+    rclpy stores int8[] fields as array('b'), so this is a zero-copy view
+    of the message's buffer. Other sequences (such as lists) are copied.
+    If the grid's height is unset, the grid is assumed to be square.
+    """
+    try:
+        data = np.frombuffer(msg.data, dtype=np.int8)
+    except TypeError:
+        data = np.asarray(msg.data, dtype=np.int8)
+
+    if msg.info.height == 0:
+        return data.reshape(int(np.sqrt(len(data))), -1)
+
+    return data.reshape(msg.info.height, msg.info.width)
+
+
+def array_to_occupancy_grid_data(arr):
+    """Pack an array into an int8 buffer for OccupancyGrid.data.
+
+    rclpy accepts an array('b') as-is, while a list is checked and
+    converted one element at a time. The array is cast to int8 first,
+    so clip it to [-1, 100] beforehand if needed.
+    """
+    arr = np.ascontiguousarray(arr, dtype=np.int8)
+
+    # Copies straight from the array's buffer, without an intermediate bytes
+    data = Array('b')
+    data.frombytes(arr)
+    return data
+
+
 @converts_to_numpy(OccupancyGrid)
 def occupancygrid_to_numpy(msg):
-    data = \
-      np.asarray(msg.data,
-                 dtype=np.int8).reshape(msg.info.height, msg.info.width)
+    data = occupancy_grid_to_array(msg)
 
     return np.ma.array(data, mask=data==-1, fill_value=-1)
 
@@ -28,7 +60,7 @@ def numpy_to_occupancy_grid(arr, info=None):
         # We assume that the masked value are already -1, for speed
         arr = arr.data
 
-    grid.data = Array('b', arr.ravel().astype(np.int8))
+    grid.data = array_to_occupancy_grid_data(arr)
     grid.info = info or MapMetaData()
     grid.info.height = arr.shape[0]
     grid.info.width = arr.shape[1]
@@ -0,0 +1,56 @@
+'''
+Microbenchmark for OccupancyGrid <-> NumPy conversion of a 151x151 cost map.
+
+Compares the list-based conversion that our cost map publishers and
+subscribers used to do against the int8 buffer fast path in
+ros2_numpy.occupancy_grid.
+
+Usage: python3 benchmark_occupancygrids.py
+'''
+
+import timeit
+
+import numpy as np
+import ros2_numpy as rnp
+from nav_msgs.msg import OccupancyGrid
+
+REPEATS = 200
+
+
+def publishWithList(costs: np.ndarray, msg: OccupancyGrid):
+    msg.data = costs.astype(np.int8).flatten().tolist()
+
+
+def publishWithBuffer(costs: np.ndarray, msg: OccupancyGrid):
+    msg.data = rnp.occupancy_grid.array_to_occupancy_grid_data(costs)
+
+
+def readWithAsarray(msg: OccupancyGrid) -> np.ndarray:
+    return np.asarray(msg.data, dtype=np.int8).reshape(msg.info.height, msg.info.width)
+
+
+def readWithFrombuffer(msg: OccupancyGrid) -> np.ndarray:
+    return rnp.occupancy_grid.occupancy_grid_to_array(msg)
+
+
+def main():
+    costs = np.clip(np.random.uniform(0, 150, size=(151, 151)), 0, 100)
+
+    msg = OccupancyGrid()
+    msg.info.height, msg.info.width = costs.shape
+
+    results = {}
+    for name, publish in (('list', publishWithList), ('buffer', publishWithBuffer)):
+        results[f'publish ({name})'] = timeit.timeit(
+            lambda: publish(costs, msg), number=REPEATS)
+
+    for name, read in (('asarray', readWithAsarray), ('frombuffer', readWithFrombuffer)):
+        results[f'read ({name})'] = timeit.timeit(
+            lambda: read(msg), number=REPEATS)
+
+    for name, total in results.items():
+        print(f"{name:<20} {total / REPEATS * 1e6:10.1f} us per grid")
+
+
+if __name__ == '__main__':
+    main()
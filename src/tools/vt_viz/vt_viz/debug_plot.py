@@ -0,0 +1,45 @@
+'''
+Package: vt_viz
+   File: debug_plot.py
+ Author: Will Heitman (w at heit dot mn)
+
+Opt-in matplotlib plots for debugging.
+
+Importing matplotlib.pyplot is slow, and plotting (let alone
+plt.show(), which blocks) has no place in a node's callbacks. Code that
+has a debug plot should check isEnabled() first, then get pyplot from
+getPyplot(), which imports it on first use:
+
+    if debug_plot.isEnabled():
+        plt = debug_plot.getPyplot()
+        plt.imshow(grid)
+        plt.show()
+
+Plots are disabled by default. Nodes turn them on with a debug_plots
+parameter, and scripts with the VT_DEBUG_PLOTS=1 environment variable.
+'''
+
+import importlib
+import os
+
+_enabled = os.environ.get('VT_DEBUG_PLOTS', '0') == '1'
+_pyplot = None
+
+
+def enable(enabled: bool = True):
+    """Turn debug plots on or off for the whole process"""
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def isEnabled() -> bool:
+    return _enabled
+
+
+def getPyplot():
+    """Return matplotlib.pyplot, importing it on the first call"""
+    global _pyplot
+    if _pyplot is None:
+        _pyplot = importlib.import_module('matplotlib.pyplot')
+
+    return _pyplot